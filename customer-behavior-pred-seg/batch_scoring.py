@@ -0,0 +1,149 @@
+"""
+Chunked multi-process batch scoring of the full customer base.
+
+Streams the engineered feature table as Arrow record batches, reading only the
+entity key and the columns the models use, and fans the batches out to a pool of
+worker processes. Each worker loads the exported models once (local or distilled
+students, see local_training and distillation), scores every target and writes
+its batch straight to the output, so memory stays bounded by the batches in
+flight however many customers are scored.
+
+Output layout:
+- {output_path}/scores/customer_bucket=<n>/part-<batch>-<i>.parquet   entity key + one score column per model
+- {output_path}/_scoring_summary.json                                 rows, batches, rows/second
+
+Classifier scores are the probability of the positive class; regressor scores are predictions.
+Customers are spread over customer_bucket partitions by a stable hash of the entity key.
+"""
+import os
+import json
+import time
+import fsspec
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from local_training import LocalTabularPredictor
+
+
+ROWS_PER_BATCH = 250_000
+SCORE_BUCKETS = 16
+
+# Batches queued per worker; bounds the memory held by the parent process
+BATCHES_IN_FLIGHT_PER_WORKER = 2
+
+# Worker-process state: score column -> predictor, loaded once by _init_worker
+_models = None
+
+
+def _init_worker(model_paths: Dict[str, str]):
+    global _models
+    from threadpoolctl import threadpool_limits
+    # One process per core already; keep each estimator single-threaded
+    threadpool_limits(limits=1)
+    _models = {column: LocalTabularPredictor.load(path) for column, path in model_paths.items()}
+
+
+def positive_class_probability(predictor: LocalTabularPredictor, frame: pd.DataFrame) -> np.ndarray:
+    """Probability of the positive class (True/1/yes, else the last class)"""
+    probabilities = predictor.predict_proba(frame)
+    for positive in (True, 1, '1', 'true', 'True', 'yes', 'Yes'):
+        if positive in probabilities.columns:
+            return probabilities[positive].to_numpy()
+    return probabilities.iloc[:, -1].to_numpy()
+
+
+def score_frame(frame: pd.DataFrame, models: Dict[str, LocalTabularPredictor], entity_key: str,
+                buckets: int = SCORE_BUCKETS) -> pd.DataFrame:
+    """Entity key, one float32 score column per model and the customer_bucket partition value"""
+    scores = pd.DataFrame({entity_key: frame[entity_key].to_numpy()})
+    for column, predictor in models.items():
+        values = positive_class_probability(predictor, frame) if predictor.classification else predictor.predict(frame).to_numpy()
+        scores[column] = np.asarray(values, dtype=np.float32)
+    hashes = pd.util.hash_pandas_object(frame[entity_key], index=False).to_numpy()
+    scores['customer_bucket'] = (hashes % buckets).astype(np.int16)
+    return scores
+
+
+def _score_batch(batch_number: int, batch: pa.RecordBatch, entity_key: str, output_path: str, buckets: int) -> int:
+    scores = score_frame(batch.to_pandas(), _models, entity_key, buckets)
+    fs, root = fsspec.core.url_to_fs(f"{output_path}/scores")
+    pq.write_to_dataset(pa.Table.from_pandas(scores, preserve_index=False), root_path=root,
+                        partition_cols=['customer_bucket'], filesystem=fs,
+                        basename_template=f"part-{batch_number:06d}-{{i}}.parquet",
+                        existing_data_behavior='overwrite_or_ignore')
+    return len(scores)
+
+
+def run_batch_scoring(dataset, model_paths: Dict[str, str], output_path: str, entity_key: str = 'customer_id',
+                      workers: Optional[int] = None, rows_per_batch: int = ROWS_PER_BATCH,
+                      buckets: int = SCORE_BUCKETS) -> Dict[str, Any]:
+    """
+    Score every row of a feature dataset with exported local models in parallel processes.
+
+    Args:
+        dataset: pyarrow dataset of engineered features (e.g. from s3_manifest.manifest_dataset)
+        model_paths: Score column -> path of a model written by LocalTabularPredictor.save
+        output_path: S3 (or local) path; scores/ and _scoring_summary.json are written under it
+        entity_key: Column identifying the customer, written with every score
+        workers: Worker processes (default: all cores)
+        rows_per_batch: Rows per record batch sent to a worker
+        buckets: Number of customer_bucket partitions
+    """
+    output_path = output_path.rstrip('/')
+    if entity_key not in dataset.schema.names:
+        raise ValueError(f"Entity key column '{entity_key}' not found in the feature data")
+
+    # Read only the key and the columns some model uses
+    feature_columns = dict.fromkeys(
+        feature["name"] for path in model_paths.values() for feature in LocalTabularPredictor.load(path).feature_spec
+    )
+    columns = [entity_key] + [name for name in feature_columns if name in dataset.schema.names and name != entity_key]
+    workers = workers or os.cpu_count()
+
+    fs, root = fsspec.core.url_to_fs(f"{output_path}/scores")
+    if fs.exists(root):
+        fs.rm(root, recursive=True)
+
+    print(f"🚀 Scoring with {len(model_paths)} models on {workers} processes ({len(columns)} columns, {rows_per_batch} rows per batch)")
+    started = time.time()
+    rows = 0
+    batches = 0
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(model_paths,)) as executor:
+        for batch in dataset.to_batches(columns=columns, batch_size=rows_per_batch):
+            if batch.num_rows == 0:
+                continue
+            pending.append(executor.submit(_score_batch, batches, batch, entity_key, output_path, buckets))
+            batches += 1
+            while len(pending) >= workers * BATCHES_IN_FLIGHT_PER_WORKER:
+                rows += pending.popleft().result()
+                print(f"📊 Scored {rows} rows ({rows / (time.time() - started):,.0f} rows/s)")
+        while pending:
+            rows += pending.popleft().result()
+
+    elapsed = time.time() - started
+    summary = {
+        "output_path": f"{output_path}/scores/",
+        "entity_key": entity_key,
+        "score_columns": list(model_paths.keys()),
+        "model_paths": model_paths,
+        "rows_scored": rows,
+        "batches": batches,
+        "workers": workers,
+        "buckets": buckets,
+        "elapsed_seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else None,
+        "scored_at": datetime.now(timezone.utc).isoformat()
+    }
+    with fsspec.open(f"{output_path}/_scoring_summary.json", 'w') as f:
+        f.write(json.dumps(summary, indent=2))
+    print(f"✅ Scored {rows} rows in {elapsed:.1f}s ({summary['rows_per_second'] or 0:,.0f} rows/s)")
+    return summary
@@ -0,0 +1,607 @@
+"""
+Streaming data profiling for S3 prefixes.
+
+Walks every supported object under an S3 prefix in chunks and maintains
+mergeable one-pass column statistics in bounded memory:
+- Null counts and row counts
+- Welford/Chan mean and variance for numeric columns
+- Min/max for numeric columns
+- Approximate distinct counts (exact below a threshold, HyperLogLog above)
+- Approximate quantiles (compactor-based mergeable sketch)
+
+Per-file partial profiles are merged and rendered into the same `analysis`
+dict shape returned by `explore_s3_data`.
+"""
+import math
+import base64
+import fsspec
+import numpy as np
+import pandas as pd
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+
+SUPPORTED_EXTENSIONS = ('.csv', '.json', '.parquet')
+
+# Rows per chunk when streaming an object
+DEFAULT_CHUNK_SIZE = 50000
+
+# Quantiles reported in sample_statistics
+REPORTED_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+def parse_s3_uri(s3_uri: str) -> Tuple[str, str]:
+    """Split 's3://bucket/prefix' into (bucket, prefix)"""
+    s3_parts = s3_uri.replace('s3://', '').split('/', 1)
+    bucket = s3_parts[0]
+    prefix = s3_parts[1] if len(s3_parts) > 1 else ''
+    return bucket, prefix
+
+
+def detect_format(key: str) -> Optional[str]:
+    """Return 'csv', 'json' or 'parquet' for a supported key, otherwise None"""
+    for ext in SUPPORTED_EXTENSIONS:
+        if key.endswith(ext):
+            return ext[1:]
+    return None
+
+
+def list_data_objects(bucket: str, prefix: str, s3_client=None) -> List[Dict[str, Any]]:
+    """List every supported data object under a prefix, following pagination"""
+    s3_client = s3_client or boto3.client('s3')
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            file_format = detect_format(obj['Key'])
+            if file_format:
+                objects.append({
+                    "key": obj['Key'],
+                    "size": obj.get('Size', 0),
+                    "etag": obj.get('ETag', '').strip('"'),
+                    "format": file_format
+                })
+    return objects
+
+
+def iter_object_chunks(path: str, file_format: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Yield DataFrame chunks of at most chunk_size rows from a CSV, JSON lines or Parquet object"""
+    if file_format == 'csv':
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            yield chunk
+    elif file_format == 'json':
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_size):
+            yield chunk
+    elif file_format == 'parquet':
+        import pyarrow.parquet as pq
+        with fsspec.open(path, 'rb') as f:
+            parquet_file = pq.ParquetFile(f)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+
+def _hash_values(values: pd.Series) -> np.ndarray:
+    """Stable 64-bit hashes for the non-null values of a Series"""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+class DistinctCounter:
+    """Approximate distinct counter: exact hash set up to a threshold, HyperLogLog beyond it"""
+
+    def __init__(self, precision: int = 12, exact_threshold: int = 2048):
+        self.precision = precision
+        self.exact_threshold = exact_threshold
+        self.exact_hashes = set()
+        self.registers = None
+
+    def _to_registers(self, hashes: np.ndarray):
+        if self.registers is None:
+            self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        if len(hashes) == 0:
+            return
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << remaining_bits) - 1)
+        # Position of the leftmost 1-bit within the remaining bits (1-based)
+        bit_length = np.zeros(len(remainder), dtype=np.int64)
+        nonzero = remainder > 0
+        bit_length[nonzero] = np.floor(np.log2(remainder[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (remaining_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if self.registers is not None:
+            self._to_registers(hashes)
+            return
+        self.exact_hashes.update(np.unique(hashes).tolist())
+        if len(self.exact_hashes) > self.exact_threshold:
+            self._to_registers(np.fromiter(self.exact_hashes, dtype=np.uint64))
+            self.exact_hashes = set()
+
+    def merge(self, other: "DistinctCounter"):
+        if other.registers is not None:
+            if self.registers is None:
+                self._to_registers(np.fromiter(self.exact_hashes, dtype=np.uint64, count=len(self.exact_hashes)))
+                self.exact_hashes = set()
+            np.maximum(self.registers, other.registers, out=self.registers)
+        else:
+            self.add_hashes(np.fromiter(other.exact_hashes, dtype=np.uint64, count=len(other.exact_hashes)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "exact_threshold": self.exact_threshold,
+            "exact_hashes": sorted(self.exact_hashes),
+            "registers": base64.b64encode(self.registers.tobytes()).decode('ascii') if self.registers is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DistinctCounter":
+        counter = cls(data["precision"], data["exact_threshold"])
+        counter.exact_hashes = set(int(value) for value in data["exact_hashes"])
+        if data["registers"] is not None:
+            counter.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return counter
+
+    def estimate(self) -> int:
+        if self.registers is None:
+            return len(self.exact_hashes)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw_estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zero_registers = int(np.count_nonzero(self.registers == 0))
+        if raw_estimate <= 2.5 * m and zero_registers > 0:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zero_registers)))
+        return int(round(raw_estimate))
+
+
+class QuantileSketch:
+    """Mergeable compactor-based quantile sketch with bounded memory (k values per level)"""
+
+    def __init__(self, k: int = 512, seed: int = 0):
+        self.k = k
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.k:
+                values = np.sort(self.levels[level])
+                if len(values) % 2 == 1:
+                    # Keep one value at this level so the promoted half stays balanced
+                    keep, values = values[-1:], values[:-1]
+                else:
+                    keep = np.empty(0, dtype=np.float64)
+                offset = int(self._rng.integers(0, 2))
+                promoted = values[offset::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def add(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values.astype(np.float64)])
+        self._compact()
+
+    def merge(self, other: "QuantileSketch"):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self._compact()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "levels": [level.tolist() for level in self.levels],
+            "rng_state": self._rng.bit_generator.state
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data["k"])
+        sketch.levels = [np.asarray(level, dtype=np.float64) for level in data["levels"]]
+        sketch._rng.bit_generator.state = data["rng_state"]
+        return sketch
+
+    def quantiles(self, qs: Tuple[float, ...] = REPORTED_QUANTILES) -> Dict[str, Optional[float]]:
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return {f"p{int(q * 100):02d}": None for q in qs}
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values)
+        values, weights = values[order], weights[order]
+        cumulative = np.cumsum(weights) / weights.sum()
+        return {
+            f"p{int(q * 100):02d}": float(values[min(np.searchsorted(cumulative, q), len(values) - 1)])
+            for q in qs
+        }
+
+
+def _widen_dtype(current: Optional[str], new: str) -> str:
+    """Combine dtypes seen in different chunks/files into one safe dtype"""
+    if current is None or current == new:
+        return new
+    numeric = ('int', 'uint', 'float', 'bool')
+    if current.startswith(numeric) and new.startswith(numeric):
+        return 'float64'
+    return 'object'
+
+
+class ColumnProfile:
+    """One-pass, mergeable statistics for a single column"""
+
+    def __init__(self, max_sample_values: int = 5):
+        self.dtype = None
+        self.count = 0
+        self.null_count = 0
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.distinct = DistinctCounter()
+        self.quantiles = QuantileSketch()
+        self.sample_values: List[str] = []
+        self.max_sample_values = max_sample_values
+
+    def _merge_moments(self, n: int, mean: float, m2: float):
+        """Chan et al. parallel combination of Welford running moments"""
+        if n == 0:
+            return
+        total = self.numeric_count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.numeric_count * n / total
+        self.numeric_count = total
+
+    def _merge_range(self, low, high):
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def update(self, series: pd.Series):
+        non_null = series.dropna()
+        if len(non_null) > 0 or self.dtype is None:
+            self.dtype = _widen_dtype(self.dtype, str(series.dtype))
+        self.count += len(series)
+        self.null_count += len(series) - len(non_null)
+        if len(non_null) == 0:
+            return
+
+        self.distinct.add_hashes(_hash_values(non_null))
+        if len(self.sample_values) < self.max_sample_values:
+            needed = self.max_sample_values - len(self.sample_values)
+            self.sample_values.extend(str(val) for val in non_null.head(needed).tolist())
+
+        if pd.api.types.is_numeric_dtype(non_null):
+            values = non_null.to_numpy(dtype=np.float64)
+            chunk_mean = float(values.mean())
+            self._merge_moments(len(values), chunk_mean, float(((values - chunk_mean) ** 2).sum()))
+            self._merge_range(float(values.min()), float(values.max()))
+            self.quantiles.add(values)
+
+    def merge(self, other: "ColumnProfile"):
+        if other.dtype is not None:
+            self.dtype = _widen_dtype(self.dtype, other.dtype)
+        self.count += other.count
+        self.null_count += other.null_count
+        self._merge_moments(other.numeric_count, other.mean, other.m2)
+        if other.min is not None:
+            self._merge_range(other.min, other.max)
+        self.distinct.merge(other.distinct)
+        self.quantiles.merge(other.quantiles)
+        needed = self.max_sample_values - len(self.sample_values)
+        if needed > 0:
+            self.sample_values.extend(other.sample_values[:needed])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "dtype": self.dtype,
+            "count": self.count,
+            "null_count": self.null_count,
+            "numeric_count": self.numeric_count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "distinct": self.distinct.to_dict(),
+            "quantiles": self.quantiles.to_dict(),
+            "sample_values": self.sample_values,
+            "max_sample_values": self.max_sample_values
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ColumnProfile":
+        profile = cls(data["max_sample_values"])
+        for field in ("dtype", "count", "null_count", "numeric_count", "mean", "m2", "min", "max", "sample_values"):
+            setattr(profile, field, data[field])
+        profile.distinct = DistinctCounter.from_dict(data["distinct"])
+        profile.quantiles = QuantileSketch.from_dict(data["quantiles"])
+        return profile
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.dtype is not None and self.dtype.startswith(('int', 'uint', 'float', 'bool'))
+
+    def statistics(self) -> Dict[str, Any]:
+        numeric = self.is_numeric and self.numeric_count > 0
+        return {
+            "mean": self.mean if numeric else None,
+            "std": math.sqrt(self.m2 / (self.numeric_count - 1)) if numeric and self.numeric_count > 1 else None,
+            "min": self.min if numeric else None,
+            "max": self.max if numeric else None,
+            "quantiles": self.quantiles.quantiles() if numeric else None,
+            "null_count": self.null_count,
+            "unique_values": self.distinct.estimate(),
+            "sample_values": self.sample_values
+        }
+
+
+class DatasetProfile:
+    """Mergeable profile of a whole dataset, keeping column order of first appearance"""
+
+    def __init__(self):
+        self.columns: Dict[str, ColumnProfile] = {}
+        self.row_count = 0
+        self.files_profiled = 0
+        self.bytes_profiled = 0
+
+    def update(self, df: pd.DataFrame):
+        self.row_count += len(df)
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile()
+                # Rows seen before this column appeared count as nulls
+                self.columns[col].count = self.columns[col].null_count = self.row_count - len(df)
+            self.columns[col].update(df[col])
+        for col, profile in self.columns.items():
+            if col not in df.columns:
+                profile.count += len(df)
+                profile.null_count += len(df)
+
+    def merge(self, other: "DatasetProfile"):
+        for col, profile in other.columns.items():
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile()
+                self.columns[col].count = self.columns[col].null_count = self.row_count
+            self.columns[col].merge(profile)
+        for col, profile in self.columns.items():
+            if col not in other.columns:
+                profile.count += other.row_count
+                profile.null_count += other.row_count
+        self.row_count += other.row_count
+        self.files_profiled += other.files_profiled
+        self.bytes_profiled += other.bytes_profiled
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable form, e.g. for the profile cache"""
+        return {
+            "columns": {col: profile.to_dict() for col, profile in self.columns.items()},
+            "row_count": self.row_count,
+            "files_profiled": self.files_profiled,
+            "bytes_profiled": self.bytes_profiled
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DatasetProfile":
+        profile = cls()
+        profile.columns = {col: ColumnProfile.from_dict(column) for col, column in data["columns"].items()}
+        profile.row_count = data["row_count"]
+        profile.files_profiled = data["files_profiled"]
+        profile.bytes_profiled = data["bytes_profiled"]
+        return profile
+
+    def to_analysis(self, s3_location: str) -> Dict[str, Any]:
+        """Render in the `analysis` dict shape used by explore_s3_data"""
+        data_types = {col: profile.dtype for col, profile in self.columns.items()}
+        return {
+            "s3_location": s3_location,
+            "total_sample_records": self.row_count,
+            "columns": list(self.columns),
+            "data_types": data_types,
+            "missing_values": {col: int(profile.null_count) for col, profile in self.columns.items()},
+            "numeric_columns": [col for col, profile in self.columns.items() if profile.is_numeric],
+            "categorical_columns": [col for col, dtype in data_types.items() if dtype == 'object'],
+            "date_columns": [col for col, dtype in data_types.items() if dtype.startswith('datetime')],
+            "sample_statistics": {col: profile.statistics() for col, profile in self.columns.items()},
+            "profiling_mode": "streaming",
+            "files_profiled": self.files_profiled,
+            "bytes_profiled": self.bytes_profiled
+        }
+
+
+def profile_object(path: str, file_format: str, size: int = 0,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> DatasetProfile:
+    """Profile a single object chunk by chunk"""
+    profile = DatasetProfile()
+    for chunk in iter_object_chunks(path, file_format, chunk_size):
+        profile.update(chunk)
+    profile.files_profiled = 1
+    profile.bytes_profiled = size
+    return profile
+
+
+def profile_s3_prefix(s3_prefix: str, objects: List[Dict[str, Any]] = None, max_workers: int = 8,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, cache=None) -> Dict[str, Any]:
+    """
+    Stream every supported object under an S3 prefix and return a merged analysis dict.
+
+    Args:
+        s3_prefix: S3 prefix path (e.g., 's3://bucket/path/to/data/')
+        objects: Pre-listed objects (dicts with key, size, etag, format); listed from S3 if not provided
+        max_workers: Number of objects profiled concurrently
+        chunk_size: Rows read per chunk; bounds memory to roughly max_workers * chunk_size rows
+        cache: ProfileCache for per-object profiles (optional); only new or changed objects are re-read
+    """
+    bucket, prefix = parse_s3_uri(s3_prefix)
+    if objects is None:
+        objects = list_data_objects(bucket, prefix)
+    if not objects:
+        raise ValueError(f"No supported data files (.csv, .json, .parquet) found in {s3_prefix}")
+
+    def _profile(obj):
+        if cache is not None:
+            cached = cache.get('streaming', bucket, obj)
+            if cached is not None:
+                return DatasetProfile.from_dict(cached)
+        partial = profile_object(f"s3://{bucket}/{obj['key']}", obj['format'], obj.get('size', 0), chunk_size)
+        if cache is not None:
+            cache.put('streaming', bucket, obj, partial.to_dict())
+        return partial
+
+    merged = DatasetProfile()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Merge in listing order so column order and sample values are deterministic
+        for partial in executor.map(_profile, objects):
+            merged.merge(partial)
+
+    return merged.to_analysis(s3_prefix)
+
+
+def _read_parquet_footer(path: str):
+    """Read only the footer (FileMetaData) of a Parquet object"""
+    import pyarrow.parquet as pq
+    # Small blocks so only the tail of the object is fetched
+    with fsspec.open(path, 'rb', block_size=1024 * 1024) as f:
+        return pq.read_metadata(f)
+
+
+def _statistic_value(value) -> Any:
+    """Convert a Parquet statistics value into something JSON serialisable"""
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return str(value)
+
+
+def profile_parquet_footers(s3_prefix: str, objects: List[Dict[str, Any]] = None, max_workers: int = 16,
+                            fallback_sample_size: int = 0) -> Dict[str, Any]:
+    """
+    Build an analysis dict from Parquet footers only, without decoding column pages.
+
+    Schema, row counts and per-row-group min/max/null counts are combined across all
+    files. Columns whose statistics are missing from any row group can optionally be
+    filled from a column-projected data sample.
+
+    Args:
+        s3_prefix: S3 prefix path (e.g., 's3://bucket/path/to/data/')
+        objects: Pre-listed objects (dicts with key, size, format); listed from S3 if not provided
+        max_workers: Number of footers read concurrently
+        fallback_sample_size: Rows to sample for columns without footer statistics (0 disables the fallback)
+    """
+    bucket, prefix = parse_s3_uri(s3_prefix)
+    if objects is None:
+        objects = list_data_objects(bucket, prefix)
+    non_parquet = [obj['key'] for obj in objects if obj['format'] != 'parquet']
+    if non_parquet:
+        raise ValueError(f"Metadata profiling requires Parquet files only; found: {non_parquet[:5]}")
+    if not objects:
+        raise ValueError(f"No Parquet files found in {s3_prefix}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        footers = list(executor.map(lambda obj: _read_parquet_footer(f"s3://{bucket}/{obj['key']}"), objects))
+
+    row_count = 0
+    data_types: Dict[str, str] = {}
+    null_counts: Dict[str, int] = {}
+    ranges: Dict[str, List[Any]] = {}
+    missing_stats = set()
+
+    for metadata in footers:
+        file_types = {
+            col: str(dtype)
+            for col, dtype in metadata.schema.to_arrow_schema().empty_table().to_pandas().dtypes.items()
+        }
+        for col, dtype in file_types.items():
+            if col not in data_types:
+                # Rows in earlier files without this column count as nulls
+                null_counts[col] = row_count
+            data_types[col] = _widen_dtype(data_types.get(col), dtype)
+        for col in data_types:
+            if col not in file_types:
+                null_counts[col] += metadata.num_rows
+
+        for rg in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg)
+            for i in range(row_group.num_columns):
+                column = row_group.column(i)
+                col = column.path_in_schema
+                if col not in data_types:
+                    # Nested leaf columns are not part of the flat analysis
+                    continue
+                stats = column.statistics
+                if stats is None or not stats.has_null_count:
+                    missing_stats.add(col)
+                    continue
+                null_counts[col] += stats.null_count
+                if stats.has_min_max:
+                    low, high = _statistic_value(stats.min), _statistic_value(stats.max)
+                    if not isinstance(low, float) or not isinstance(high, float):
+                        # Only numeric ranges are reported
+                        continue
+                    if col in ranges:
+                        ranges[col] = [min(ranges[col][0], low), max(ranges[col][1], high)]
+                    else:
+                        ranges[col] = [low, high]
+                elif stats.null_count < row_group.num_rows:
+                    missing_stats.add(col)
+        row_count += metadata.num_rows
+
+    numeric = ('int', 'uint', 'float', 'bool')
+    sample_statistics = {
+        col: {
+            "mean": None,
+            "std": None,
+            "min": ranges[col][0] if col in ranges and dtype.startswith(numeric) else None,
+            "max": ranges[col][1] if col in ranges and dtype.startswith(numeric) else None,
+            "null_count": null_counts[col],
+            "unique_values": None,
+            "sample_values": [],
+            "stats_source": "footer"
+        } for col, dtype in data_types.items()
+    }
+
+    sampled_columns = [col for col in data_types if col in missing_stats]
+    if fallback_sample_size and sampled_columns:
+        from data_sampling import reservoir_sample_objects
+        sample = reservoir_sample_objects(bucket, objects, fallback_sample_size, columns=sampled_columns)
+        for col in sampled_columns:
+            series = sample[col] if col in sample.columns else pd.Series(dtype=object)
+            is_numeric = pd.api.types.is_numeric_dtype(series) and series.notna().any()
+            null_fraction = float(series.isnull().mean()) if len(series) else 0.0
+            null_counts[col] = int(round(null_fraction * row_count))
+            sample_statistics[col] = {
+                "mean": float(series.mean()) if is_numeric else None,
+                "std": float(series.std()) if is_numeric else None,
+                "min": float(series.min()) if is_numeric else None,
+                "max": float(series.max()) if is_numeric else None,
+                "null_count": null_counts[col],
+                "unique_values": int(series.nunique()),
+                "sample_values": [str(val) for val in series.dropna().head(5).tolist()],
+                "stats_source": "sample"
+            }
+
+    return {
+        "s3_location": s3_prefix,
+        "total_sample_records": row_count,
+        "columns": list(data_types),
+        "data_types": data_types,
+        "missing_values": {col: int(count) for col, count in null_counts.items()},
+        "numeric_columns": [col for col, dtype in data_types.items() if dtype.startswith(numeric)],
+        "categorical_columns": [col for col, dtype in data_types.items() if dtype == 'object'],
+        "date_columns": [col for col, dtype in data_types.items() if dtype.startswith('datetime')],
+        "sample_statistics": sample_statistics,
+        "profiling_mode": "metadata",
+        "files_profiled": len(objects),
+        "columns_missing_statistics": sampled_columns
+    }
@@ -0,0 +1,296 @@
+"""
+Parallel reservoir sampling across every object in an S3 prefix.
+
+Objects are split into independent read tasks (newline-aligned byte ranges for
+CSV/JSON lines, row groups for Parquet) that run concurrently in a thread pool.
+Each task keeps a weighted reservoir (Efraimidis-Spirakis A-Res keys)
+of at most `sample_size` rows, and task reservoirs are merged by keeping the
+rows with the smallest keys. With unit weights this is a uniform sample
+without replacement over all rows in the prefix, and peak memory is bounded
+by roughly `sample_size` rows plus one read chunk per worker.
+"""
+import io
+import json
+import hashlib
+import boto3
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, Optional
+
+from data_profiling import list_data_objects, parse_s3_uri
+
+
+# Bytes per CSV/JSON range request
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+# Bytes fetched at a time when completing a line that crosses a range boundary
+LINE_LOOKAHEAD = 64 * 1024
+
+# Rows per batch when streaming a Parquet row group
+PARQUET_BATCH_SIZE = 50000
+
+
+class Reservoir:
+    """Bounded set of rows with the smallest sampling keys seen so far"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rows: Optional[pd.DataFrame] = None
+        self.keys = np.empty(0, dtype=np.float64)
+
+    def offer(self, rows: pd.DataFrame, keys: np.ndarray):
+        if len(rows) == 0:
+            return
+        if self.rows is not None:
+            rows = pd.concat([self.rows, rows], ignore_index=True)
+            keys = np.concatenate([self.keys, keys])
+        if len(keys) > self.capacity:
+            keep = np.argpartition(keys, self.capacity - 1)[:self.capacity]
+            rows = rows.iloc[keep].reset_index(drop=True)
+            keys = keys[keep]
+        self.rows = rows.reset_index(drop=True)
+        self.keys = keys
+
+    def merge(self, other: "Reservoir"):
+        if other.rows is not None:
+            self.offer(other.rows, other.keys)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable form (rows with their dtypes), e.g. for the profile cache"""
+        if self.rows is None:
+            return {"capacity": self.capacity, "columns": None, "dtypes": None, "data": None, "keys": []}
+        return {
+            "capacity": self.capacity,
+            "columns": list(self.rows.columns),
+            "dtypes": [str(dtype) for dtype in self.rows.dtypes],
+            "data": json.loads(self.rows.to_json(orient='split', index=False, date_format='iso'))["data"],
+            "keys": self.keys.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Reservoir":
+        reservoir = cls(data["capacity"])
+        if data["columns"] is not None:
+            rows = pd.DataFrame(data["data"], columns=data["columns"])
+            for column, dtype in zip(data["columns"], data["dtypes"]):
+                try:
+                    if dtype.startswith('datetime64'):
+                        rows[column] = pd.to_datetime(rows[column])
+                    rows[column] = rows[column].astype(dtype)
+                except (TypeError, ValueError):
+                    # Keep the decoded values if the original dtype cannot be restored
+                    pass
+            reservoir.rows = rows
+            reservoir.keys = np.asarray(data["keys"], dtype=np.float64)
+        return reservoir
+
+    def to_frame(self) -> pd.DataFrame:
+        if self.rows is None:
+            return pd.DataFrame()
+        # Order by key so the sample is independent of task completion order
+        return self.rows.iloc[np.argsort(self.keys, kind='stable')].reset_index(drop=True)
+
+
+def _sampling_keys(rows: pd.DataFrame, rng: np.random.Generator, weight_column: Optional[str]) -> np.ndarray:
+    """Exponential-clock keys: key = -ln(u) / w, smallest keys win"""
+    u = rng.random(len(rows))
+    if weight_column is None:
+        return -np.log1p(-u)
+    weights = pd.to_numeric(rows[weight_column], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        # Non-positive weights get an infinite key and are never sampled
+        return np.where(weights > 0, -np.log1p(-u) / np.where(weights > 0, weights, 1.0), np.inf)
+
+
+def _read_range(s3_client, bucket: str, key: str, start: int, end: int) -> bytes:
+    """Read bytes [start, end) of an object with a ranged GET"""
+    if end <= start:
+        return b''
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+    return response['Body'].read()
+
+
+def _read_aligned_lines(s3_client, bucket: str, key: str, start: int, end: int, size: int) -> bytes:
+    """
+    Read the complete lines whose first byte lies in [start, end).
+
+    The range is extended backwards by one byte to detect whether `start` is a
+    line boundary, and forwards in LINE_LOOKAHEAD steps until the last line is
+    terminated. Assumes records do not contain embedded newlines.
+    """
+    data = _read_range(s3_client, bucket, key, max(start - 1, 0), end)
+    if start > 0:
+        # Drop the partial line owned by the previous range
+        newline = data.find(b'\n')
+        if newline == -1:
+            return b''
+        data = data[newline + 1:]
+        if not data:
+            # The only newline ended the range, so no line starts inside it
+            return b''
+
+    position = end
+    while position < size and not data.endswith(b'\n'):
+        extra = _read_range(s3_client, bucket, key, position, min(position + LINE_LOOKAHEAD, size))
+        newline = extra.find(b'\n')
+        if newline != -1:
+            data += extra[:newline + 1]
+            break
+        data += extra
+        position += len(extra)
+    return data
+
+
+def _read_header(s3_client, bucket: str, key: str, size: int) -> bytes:
+    """Read the first line of a CSV object"""
+    return _read_aligned_lines(s3_client, bucket, key, 0, min(1, size), size)
+
+
+def plan_sampling_tasks(objects: List[Dict[str, Any]], s3_client=None, bucket: str = None,
+                        range_size: int = DEFAULT_RANGE_SIZE) -> List[Dict[str, Any]]:
+    """Split objects into independent read tasks: byte ranges for CSV/JSON, row groups for Parquet"""
+    tasks = []
+    for obj in objects:
+        size = obj.get('size', 0)
+        if obj['format'] == 'parquet':
+            import pyarrow.parquet as pq
+            import fsspec
+            with fsspec.open(f"s3://{bucket}/{obj['key']}", 'rb') as f:
+                num_row_groups = pq.ParquetFile(f).num_row_groups
+            for row_group in range(num_row_groups):
+                tasks.append({"object": obj, "row_group": row_group})
+        else:
+            header = _read_header(s3_client, bucket, obj['key'], size) if obj['format'] == 'csv' else b''
+            # The header line belongs to the first range; later ranges reuse it for parsing
+            for start in range(0, max(size, 1), range_size):
+                tasks.append({"object": obj, "start": start, "end": min(start + range_size, size), "header": header})
+    return tasks
+
+
+def _run_task(task: Dict[str, Any], s3_client, bucket: str, sample_size: int,
+              rng: np.random.Generator, weight_column: Optional[str],
+              columns: Optional[List[str]] = None) -> Reservoir:
+    """Sample one byte range or row group into its own reservoir"""
+    reservoir = Reservoir(sample_size)
+    obj = task['object']
+
+    if obj['format'] == 'parquet':
+        import pyarrow.parquet as pq
+        import fsspec
+        with fsspec.open(f"s3://{bucket}/{obj['key']}", 'rb') as f:
+            parquet_file = pq.ParquetFile(f)
+            if columns is not None:
+                available = set(parquet_file.schema_arrow.names)
+                read_columns = [col for col in columns + ([weight_column] if weight_column else []) if col in available]
+            else:
+                read_columns = None
+            for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_SIZE, row_groups=[task['row_group']],
+                                                   columns=read_columns):
+                rows = batch.to_pandas()
+                reservoir.offer(rows, _sampling_keys(rows, rng, weight_column))
+        return reservoir
+
+    data = _read_aligned_lines(s3_client, bucket, obj['key'], task['start'], task['end'], obj.get('size', 0))
+    if obj['format'] == 'csv':
+        if task['start'] > 0:
+            data = task['header'] + data
+        if not data.strip():
+            return reservoir
+        rows = pd.read_csv(io.BytesIO(data))
+    else:
+        if not data.strip():
+            return reservoir
+        rows = pd.read_json(io.BytesIO(data), lines=True)
+    if columns is not None:
+        rows = rows[[col for col in rows.columns if col in columns or col == weight_column]]
+
+    reservoir.offer(rows, _sampling_keys(rows, rng, weight_column))
+    return reservoir
+
+
+def _task_rng(seed: Optional[int], task: Dict[str, Any]) -> np.random.Generator:
+    """Per-task generator derived from the object identity, so cached and fresh reservoirs agree for a seed"""
+    if seed is None:
+        return np.random.default_rng()
+    obj = task['object']
+    identity = f"{obj['key']}:{obj.get('etag', '')}:{task.get('start', task.get('row_group'))}"
+    return np.random.default_rng([seed, int(hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16], 16)])
+
+
+def reservoir_sample_objects(bucket: str, objects: List[Dict[str, Any]], sample_size: int,
+                             max_workers: int = 8, seed: Optional[int] = None,
+                             weight_column: Optional[str] = None,
+                             range_size: int = DEFAULT_RANGE_SIZE,
+                             columns: Optional[List[str]] = None,
+                             cache=None) -> pd.DataFrame:
+    """
+    Draw a sample of `sample_size` rows across all objects, reading them concurrently.
+
+    Args:
+        bucket: S3 bucket holding the objects
+        objects: Listed objects (dicts with key, size, etag, format)
+        sample_size: Number of rows to return
+        max_workers: Number of concurrent read tasks
+        seed: Random seed for a reproducible sample (optional)
+        weight_column: Column holding per-row sampling weights (optional, uniform if not provided)
+        range_size: Bytes per CSV/JSON range request
+        columns: Columns to keep in the sample (optional, all columns if not provided);
+                 Parquet reads decode only these columns
+        cache: ProfileCache for per-object reservoirs (optional); only new or changed objects are re-read
+    """
+    cache_params = {"sample_size": sample_size, "seed": seed, "weight_column": weight_column, "columns": columns}
+    merged = Reservoir(sample_size)
+
+    # Per-object reservoirs are mergeable, so cached objects are merged without being read
+    uncached = []
+    for obj in objects:
+        cached = cache.get('sample', bucket, obj, cache_params) if cache is not None else None
+        if cached is not None:
+            merged.merge(Reservoir.from_dict(cached))
+        else:
+            uncached.append(obj)
+
+    s3_client = boto3.client('s3')
+    tasks = plan_sampling_tasks(uncached, s3_client, bucket, range_size)
+    remaining_tasks = {}
+    for task in tasks:
+        remaining_tasks[task['object']['key']] = remaining_tasks.get(task['object']['key'], 0) + 1
+    object_reservoirs = {}
+
+    def _collect(done):
+        for future in done:
+            obj, reservoir = future.result()
+            object_reservoirs.setdefault(obj['key'], Reservoir(sample_size)).merge(reservoir)
+            remaining_tasks[obj['key']] -= 1
+            if remaining_tasks[obj['key']] == 0:
+                # Object complete: cache its reservoir and fold it into the global sample
+                object_reservoir = object_reservoirs.pop(obj['key'])
+                if cache is not None:
+                    cache.put('sample', bucket, obj, object_reservoir.to_dict(), cache_params)
+                merged.merge(object_reservoir)
+
+    def _run(task):
+        return task['object'], _run_task(task, s3_client, bucket, sample_size, _task_rng(seed, task),
+                                         weight_column, columns)
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Keep at most max_workers tasks in flight so finished reservoirs are merged and released promptly
+        for task in tasks:
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            pending.add(executor.submit(_run, task))
+        _collect(wait(pending).done)
+
+    return merged.to_frame()
+
+
+def reservoir_sample_s3_prefix(s3_prefix: str, sample_size: int, **kwargs) -> pd.DataFrame:
+    """List every supported object under an S3 prefix and return a reservoir sample of its rows"""
+    bucket, prefix = parse_s3_uri(s3_prefix)
+    objects = list_data_objects(bucket, prefix)
+    if not objects:
+        raise ValueError(f"No supported data files (.csv, .json, .parquet) found in {s3_prefix}")
+    return reservoir_sample_objects(bucket, objects, sample_size, **kwargs)
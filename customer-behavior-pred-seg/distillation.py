@@ -0,0 +1,106 @@
+"""
+Distillation of trained propensity models into compact single models for low-latency scoring.
+
+AutoGluon ensembles are accurate but heavy to serve. After training, a shallow
+histogram gradient-boosting student is fitted to the teacher's predictions on a
+sample of the training rows (the transfer set), so it learns the ensemble's
+decision function rather than the raw labels. Fidelity to the teacher and the
+student's per-row inference latency are measured on the test split.
+
+Artefacts are written under the distilled model path:
+- model.joblib            student estimator with its feature encoding (see local_training)
+- model_metadata.json     student features, hyperparameters and fit statistics
+- distillation.json       teacher, transfer set size, fidelity and latency
+"""
+import json
+import time
+import fsspec
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any, Optional
+
+from local_training import LocalTabularPredictor
+
+
+# Training rows the teacher labels for the student
+DISTILLATION_MAX_ROWS = 200_000
+
+# Shallow trees keep the exported model small and inference in microseconds per row
+STUDENT_HYPERPARAMETERS = {"max_depth": 4, "max_leaf_nodes": 15, "max_iter": 300}
+
+RANDOM_STATE = 42
+
+
+def measure_fidelity(student_predictions: pd.Series, teacher_predictions: List[Any], classification: bool) -> Dict[str, float]:
+    """Agreement with the teacher for classifiers; R^2 and RMSE against the teacher for regressors"""
+    teacher = pd.Series(list(teacher_predictions), index=student_predictions.index)
+    if classification:
+        return {"agreement": float((student_predictions.astype(str) == teacher.astype(str)).mean())}
+    teacher = pd.to_numeric(teacher, errors='coerce')
+    errors = pd.to_numeric(student_predictions, errors='coerce') - teacher
+    variance = float(np.nanvar(teacher))
+    return {
+        "r2": float(1 - np.nanmean(errors ** 2) / variance) if variance else None,
+        "rmse": float(np.sqrt(np.nanmean(errors ** 2)))
+    }
+
+
+def distill_predictor(teacher, train_data: pd.DataFrame, test_features: pd.DataFrame, label: str,
+                      ignored_columns: List[str], classification: bool, output_path: str,
+                      teacher_test_predictions: Optional[List[Any]] = None,
+                      time_limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fit a compact student to a trained predictor and export it.
+
+    Args:
+        teacher: Trained predictor with predict() (TabularCloudPredictor or LocalTabularPredictor)
+        train_data: Training split the teacher was fitted on (the transfer set is sampled from it)
+        test_features: Test split without targets, used for fidelity and latency
+        label: Target column
+        ignored_columns: Columns the teacher did not use (the other targets)
+        classification: Whether the target is a class label
+        output_path: Where the student artefacts are written
+        teacher_test_predictions: Teacher predictions for test_features, if already computed
+        time_limit: Student training time limit in seconds (optional)
+    """
+    transfer = train_data.drop(columns=[label] + ignored_columns)
+    if len(transfer) > DISTILLATION_MAX_ROWS:
+        transfer = transfer.sample(n=DISTILLATION_MAX_ROWS, random_state=RANDOM_STATE)
+
+    print(f"🧑‍🏫 Labelling {len(transfer)} transfer rows with the teacher model...")
+    transfer[label] = list(teacher.predict(transfer))
+    if classification and transfer[label].nunique() < 2:
+        raise ValueError("Teacher predicts a single class on the transfer set; nothing to distil")
+
+    student = LocalTabularPredictor(output_path, hyperparameters=STUDENT_HYPERPARAMETERS)
+    student.fit(
+        predictor_init_args={"label": label, "problem_type": "binary" if classification else "regression"},
+        predictor_fit_args={"train_data": transfer, "time_limit": time_limit}
+    )
+
+    if teacher_test_predictions is None:
+        teacher_test_predictions = list(teacher.predict(test_features))
+
+    started = time.perf_counter()
+    student_predictions = student.predict(test_features)
+    latency_us = (time.perf_counter() - started) / max(len(test_features), 1) * 1e6
+
+    fs, root = fsspec.core.url_to_fs(f"{student.output_path}model.joblib")
+    distillation = {
+        "student": type(student.model).__name__,
+        "student_path": student.output_path,
+        "hyperparameters": STUDENT_HYPERPARAMETERS,
+        "transfer_rows": len(transfer),
+        "test_rows": len(test_features),
+        "fidelity": measure_fidelity(student_predictions, teacher_test_predictions, classification),
+        "latency_us_per_row": latency_us,
+        "model_bytes": fs.size(root),
+        "student_fit": student.fit_statistics
+    }
+    with fsspec.open(f"{student.output_path}distillation.json", 'w') as f:
+        f.write(json.dumps(distillation, indent=2, default=str))
+
+    print(f"✅ Distilled {type(student.model).__name__}: fidelity {distillation['fidelity']}, "
+          f"{latency_us:.2f} µs/row, {distillation['model_bytes'] / 1024:.0f} KiB")
+    distillation["student_predictions"] = student_predictions
+    return distillation
@@ -11,11 +11,28 @@ Deployed on Amazon Bedrock AgentCore Runtime.
 """
 import json
 import boto3
+import fsspec
 import pandas as pd
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 from strands import Agent, tool, ToolContext
+from data_profiling import parse_s3_uri, profile_parquet_footers, profile_s3_prefix
+from data_sampling import reservoir_sample_objects
+from profile_cache import get_profile_cache
+from s3_manifest import (
+    get_manifest, load_processed_inputs, manifest_dataset, manifest_name, manifest_version, plan_incremental_inputs,
+    save_manifest, sub_manifest
+)
+from formula_translation import FormulaTranslationError, translate_formulas
+from feature_plan import plan_feature_projections, render_feature_plan
+from feature_store import DEFAULT_ENTITY_KEY, check_entity_key, get_feature_store, plan_feature_reuse
+from local_feature_engine import compile_features, run_local_feature_engineering
+from training_scheduler import TrainingCancelled, TrainingConflict, TrainingJob, get_training_scheduler, report_progress
+from training_data import TrainingSplit, get_training_data_cache, read_training_frame
+from local_training import LocalTabularPredictor
+from distillation import distill_predictor
+from batch_scoring import run_batch_scoring
 
 
 # Get AWS account and region dynamically
@@ -36,6 +53,20 @@ def get_aws_account_id():
             AWS_ACCOUNT_ID = 'UNKNOWN'
     return AWS_ACCOUNT_ID
 
+def get_manifest_uri(s3_prefix: str) -> str:
+    """S3 location of the persisted listing manifest for a prefix"""
+    manifest_base = os.environ.get('MANIFEST_S3_URI') or f"s3://{os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')}/manifests/"
+    if not manifest_base.endswith('/'):
+        manifest_base += '/'
+    return f"{manifest_base}{manifest_name(s3_prefix)}"
+
+# Inputs up to this size are engineered locally instead of on Glue when execution_mode is "auto"
+LOCAL_EXECUTION_MAX_BYTES = int(os.environ.get('LOCAL_EXECUTION_MAX_BYTES', 2 * 1024 ** 3))
+
+def estimate_glue_workers(total_bytes: int) -> int:
+    """Size a G.1X Glue job from the input manifest: roughly one worker per 8 GiB of input, 2 to 50 workers"""
+    return max(2, min(50, -(-total_bytes // (8 * 1024 ** 3))))
+
 app = BedrockAgentCoreApp()
 
 class FeatureEngineeringState:
@@ -48,24 +79,33 @@ class FeatureEngineeringState:
         self.user_feedback = []
         self.conversation_stage = "initial"  # initial, s3_exploration, llm_features, user_features, confirmation, engineering
         self.s3_prefix = None
+        self.input_manifest = None
+        self.input_manifest_uri = None
         self.features_output_path = None
         self.glue_jobs_created = []
+        self.local_feature_runs = []
 
 # Global state instance
 conversation_state = FeatureEngineeringState()
 
-# Training job singleton to prevent concurrent training
-_active_training_jobs = {}
-_training_lock = False
-
 @tool(context=True)
-def explore_s3_data(s3_prefix: str, tool_context: ToolContext, sample_size: int = 1000) -> Dict[str, Any]:
+def explore_s3_data(s3_prefix: str, tool_context: ToolContext, sample_size: int = 1000,
+                    profile_mode: str = "sample", metadata_fallback: bool = True,
+                    use_cache: bool = True, append_only: bool = False) -> Dict[str, Any]:
     """
     Explore raw customer data from S3 prefix to understand structure and patterns.
     
     Args:
         s3_prefix: S3 prefix path (e.g., 's3://bucket/path/to/data/')
         sample_size: Number of records to sample for analysis (default: 1000)
+        profile_mode: "sample" profiles a uniform sample drawn across all data files, "streaming" profiles every
+                      object in the prefix in one bounded-memory pass, "metadata" reads only Parquet footers
+                      (default: "sample")
+        metadata_fallback: In "metadata" mode, sample data for columns whose footer statistics are missing (default: True)
+        use_cache: Reuse cached per-file profiles for files whose ETag and size are unchanged (default: True)
+        append_only: Files are only ever added to the prefix, with keys sorting after existing ones (e.g. date-stamped
+                     daily drops); refresh the saved listing by listing only the new keys instead of the whole
+                     prefix (default: False)
     """
     try:
         # Store S3 prefix in conversation state
@@ -78,51 +118,77 @@ def explore_s3_data(s3_prefix: str, tool_context: ToolContext, sample_size: int
                 "content": [{"text": "S3 prefix must start with 's3://'. Example: 's3://my-bucket/data/'"}]
             }
         
-        # Extract bucket and prefix
-        s3_parts = s3_prefix.replace('s3://', '').split('/', 1)
-        bucket = s3_parts[0]
-        prefix = s3_parts[1] if len(s3_parts) > 1 else ''
-        
-        # Initialize S3 client
-        s3_client = boto3.client('s3')
-        
-        # List objects in the prefix
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=10)
-        
-        if 'Contents' not in response:
+        valid_modes = ['sample', 'streaming', 'metadata']
+        if profile_mode not in valid_modes:
             return {
                 "status": "error",
-                "content": [{"text": f"No files found in S3 prefix: {s3_prefix}"}]
+                "content": [{"text": f"profile_mode must be one of: {', '.join(valid_modes)}"}]
             }
         
-        # Find the first data file (CSV, JSON, or Parquet)
-        data_file = None
-        for obj in response['Contents']:
-            key = obj['Key']
-            if key.endswith(('.csv', '.json', '.parquet')):
-                data_file = f"s3://{bucket}/{key}"
-                break
-        
-        if not data_file:
+        # Extract bucket and prefix
+        bucket, _ = parse_s3_uri(s3_prefix)
+        
+        # List every supported data file in the prefix via the persisted manifest (re-listed, or only new keys if append_only)
+        manifest_uri = get_manifest_uri(s3_prefix)
+        manifest, manifest_delta = get_manifest(s3_prefix, manifest_uri, append_only=append_only)
+        conversation_state.input_manifest = manifest
+        conversation_state.input_manifest_uri = manifest_uri
+        objects = manifest['objects']
+        if not objects:
             return {
                 "status": "error",
                 "content": [{"text": "No supported data files (.csv, .json, .parquet) found in the S3 prefix"}]
             }
         
-        # Read and analyze the data file
-        if data_file.endswith('.csv'):
-            df = pd.read_csv(data_file, nrows=sample_size)
-        elif data_file.endswith('.json'):
-            df = pd.read_json(data_file, lines=True, nrows=sample_size)
-        elif data_file.endswith('.parquet'):
-            df = pd.read_parquet(data_file)
-            if len(df) > sample_size:
-                df = df.sample(n=sample_size)
+        # Per-file profiles are cached by bucket/key/ETag/size, so only new or changed files are re-read
+        profile_cache = get_profile_cache() if use_cache else None
+        
+        if profile_mode == "streaming":
+            analysis = profile_s3_prefix(s3_prefix, objects=objects, cache=profile_cache)
+            analysis["files_from_cache"] = profile_cache.hits if profile_cache else 0
+            
+            conversation_state.raw_data_analysis = analysis
+            conversation_state.conversation_stage = "s3_exploration"
+            
+            return {
+                "status": "success",
+                "content": [
+                    {"text": f"Successfully profiled all {analysis['files_profiled']} data files in {s3_prefix}. Streamed {analysis['total_sample_records']} records with {len(analysis['columns'])} columns."},
+                    {"json": analysis}
+                ]
+            }
+        
+        if profile_mode == "metadata":
+            if any(obj['format'] != 'parquet' for obj in objects):
+                return {
+                    "status": "error",
+                    "content": [{"text": "profile_mode 'metadata' requires a prefix containing only Parquet files. Use 'sample' or 'streaming' instead."}]
+                }
+            
+            analysis = profile_parquet_footers(s3_prefix, objects=objects,
+                                               fallback_sample_size=sample_size if metadata_fallback else 0)
+            
+            conversation_state.raw_data_analysis = analysis
+            conversation_state.conversation_stage = "s3_exploration"
+            
+            return {
+                "status": "success",
+                "content": [
+                    {"text": f"Successfully profiled {analysis['files_profiled']} Parquet files in {s3_prefix} from footer metadata. Found {analysis['total_sample_records']} records with {len(analysis['columns'])} columns ({len(analysis['columns_missing_statistics'])} columns without footer statistics)."},
+                    {"json": analysis}
+                ]
+            }
+        
+        # Uniform reservoir sample across all files, read concurrently with byte-range requests
+        df = reservoir_sample_objects(bucket, objects, sample_size, cache=profile_cache)
         
         # Perform comprehensive data analysis
         analysis = {
-            "s3_location": data_file,
+            "s3_location": s3_prefix,
+            "profiling_mode": "sample",
             "total_sample_records": len(df),
+            "files_sampled": len(objects),
+            "files_from_cache": profile_cache.hits if profile_cache else 0,
             "columns": list(df.columns),
             "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
             "missing_values": {col: int(count) for col, count in df.isnull().sum().items()},
@@ -146,7 +212,7 @@ def explore_s3_data(s3_prefix: str, tool_context: ToolContext, sample_size: int
         return {
             "status": "success",
             "content": [
-                {"text": f"Successfully explored S3 data from {data_file}. Analyzed {analysis['total_sample_records']} sample records with {len(analysis['columns'])} columns."},
+                {"text": f"Successfully explored S3 data from {s3_prefix}. Analyzed {analysis['total_sample_records']} sample records drawn uniformly from {len(objects)} files with {len(analysis['columns'])} columns."},
                 {"json": analysis}
             ]
         }
@@ -440,7 +506,9 @@ def confirm_final_feature_list(confirmed_llm_features: List[str], tool_context:
 
 @tool(context=True)
 def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str, tool_context: ToolContext,
-                                          glue_role_arn: str = None) -> Dict[str, Any]:
+                                          glue_role_arn: str = None, export_csv: bool = False,
+                                          incremental: bool = False, reuse_features: bool = True,
+                                          entity_key: str = DEFAULT_ENTITY_KEY) -> Dict[str, Any]:
     """
     Create AWS Glue job with the confirmed feature list and deploy to AWS.
     
@@ -448,6 +516,12 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
         job_name: Name for the Glue job
         s3_output_path: S3 path where engineered features will be stored
         glue_role_arn: IAM role ARN for Glue job (optional, will use default if not provided)
+        export_csv: Also export a CSV copy under features_csv/, derived from the written Parquet (default: False)
+        incremental: Each run only processes input objects that are new since the last run and appends them
+                     as a feature_date partition under features/ (default: False)
+        reuse_features: Reuse feature columns already materialised in the feature store for the same input,
+                        and skip the job entirely if this exact feature set was already assembled (default: True)
+        entity_key: Unique row key used to join stored feature columns (default: customer_id)
     """
     try:
         # Store the feature engineering output path
@@ -465,11 +539,54 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
                 "content": [{"text": "No S3 data source available. Please explore S3 data first."}]
             }
         
+        # Feature store: reuse columns computed by earlier jobs over the same input version
+        feature_store = None
+        if reuse_features and conversation_state.input_manifest and not incremental:
+            key_problem = check_entity_key(entity_key, conversation_state.raw_data_analysis)
+            if key_problem:
+                print(f"Feature store disabled: {key_problem}")
+            else:
+                store_bucket = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
+                feature_store = plan_feature_reuse(get_feature_store(store_bucket), conversation_state.final_feature_list,
+                                                   conversation_state.input_manifest, entity_key)
+                print(f"Feature store: {len(feature_store['cached'])} cached, {len(feature_store['new_columns'])} to compute")
+        
+        if feature_store and feature_store['assembly']:
+            # This exact feature set was already assembled over the same input; point training at it
+            assembly = feature_store['assembly']
+            job_info = {
+                "job_name": job_name,
+                "reused_job_name": assembly['job_name'],
+                "input_path": conversation_state.s3_prefix,
+                "output_path": assembly['output_path'],
+                "record_count": assembly['record_count'],
+                "total_features": len(conversation_state.final_feature_list),
+                "status": "reused",
+                "created_at": datetime.now().isoformat()
+            }
+            # Recorded like a created job, so run_glue_job and the stage summary see the reused output
+            conversation_state.glue_jobs_created.append(job_info)
+            conversation_state.features_output_path = assembly['output_path']
+            conversation_state.conversation_stage = "engineering"
+            return {
+                "status": "success",
+                "content": [
+                    {"text": f"The confirmed feature set was already engineered over this input by job '{assembly['job_name']}'. "
+                             f"Reusing {assembly['output_path']} ({assembly['record_count']} records) instead of creating a new Glue job."},
+                    {"json": job_info}
+                ]
+            }
+        
         # Generate comprehensive Glue script
         script_content = generate_comprehensive_glue_script(
             conversation_state.final_feature_list,
             conversation_state.s3_prefix,
-            s3_output_path
+            s3_output_path,
+            conversation_state.raw_data_analysis['columns'] if conversation_state.raw_data_analysis else None,
+            conversation_state.raw_data_analysis['data_types'] if conversation_state.raw_data_analysis else None,
+            sampled_types=(conversation_state.raw_data_analysis or {}).get('profiling_mode', 'sample') == 'sample',
+            entity_key=entity_key,
+            feature_store=feature_store
         )
         
         # Create Glue client
@@ -482,6 +599,17 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
         if not glue_role_arn:
             glue_role_arn = f'arn:aws:iam::{get_aws_account_id()}:role/GlueServiceRole'
         
+        # Reuse the exploration manifest so the job reads an explicit file list and is sized from input bytes
+        manifest = conversation_state.input_manifest
+        manifest_path = conversation_state.input_manifest_uri or 'none'
+        number_of_workers = estimate_glue_workers(manifest['total_bytes']) if manifest else 2
+        
+        if incremental and not manifest:
+            return {
+                "status": "error",
+                "content": [{"text": "Incremental jobs track inputs through the listing manifest. Please explore S3 data first."}]
+            }
+        
         # Create Glue job definition
         job_definition = {
             'Name': job_name,
@@ -497,13 +625,17 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
                 '--enable-continuous-cloudwatch-log': 'true',
                 '--input_path': conversation_state.s3_prefix,
                 '--output_path': s3_output_path,
-                '--feature_count': str(len(conversation_state.final_feature_list))
+                '--feature_count': str(len(conversation_state.final_feature_list)),
+                '--manifest_path': manifest_path,
+                '--write_csv': 'true' if export_csv else 'false',
+                '--write_mode': 'overwrite',
+                '--partition_date': 'none'
             },
             'MaxRetries': 1,
             'Timeout': 120,
             'GlueVersion': '3.0',
             'WorkerType': 'G.1X',
-            'NumberOfWorkers': 2
+            'NumberOfWorkers': number_of_workers
         }
         
         # Create S3 client to upload script
@@ -547,6 +679,15 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
             },
             "input_path": conversation_state.s3_prefix,
             "output_path": s3_output_path,
+            "manifest_path": manifest_path,
+            "export_csv": export_csv,
+            "incremental": incremental,
+            "feature_store": {
+                "path": feature_store['path'],
+                "cached_features": [entry['feature_name'] for entry in feature_store['cached']],
+                "computed_features": list(feature_store['new_columns'])
+            } if feature_store else None,
+            "number_of_workers": number_of_workers,
             "script_content": script_content,
             "job_definition": job_definition,
             "status": "created",
@@ -564,6 +705,15 @@ def create_glue_job_with_confirmed_features(job_name: str, s3_output_path: str,
             ]
         }
         
+    except FormulaTranslationError as e:
+        return {
+            "status": "error",
+            "content": [
+                {"text": f"Some feature formulas could not be translated to PySpark: {', '.join(e.problems)}. "
+                         f"Please revise or remove these features and create the job again."},
+                {"json": {"untranslatable_formulas": e.problems}}
+            ]
+        }
     except Exception as e:
         return {
             "status": "error",
@@ -594,14 +744,63 @@ def run_glue_job(job_name: str, tool_context: ToolContext) -> Dict[str, Any]:
                 "content": [{"text": f"Job '{job_name}' not found in conversation history. Please create the job first."}]
             }
         
+        if job_info['status'] == "reused":
+            return {
+                "status": "success",
+                "content": [
+                    {"text": f"'{job_name}' reuses the features already engineered by job '{job_info['reused_job_name']}' "
+                             f"at {job_info['output_path']}; there is nothing to run."},
+                    {"json": job_info}
+                ]
+            }
+        
+        run_arguments = {
+            '--input_path': job_info['input_path'],
+            '--output_path': job_info['output_path'],
+            '--feature_count': str(job_info['total_features']),
+            '--manifest_path': job_info.get('manifest_path', 'none'),
+            '--write_csv': 'true' if job_info.get('export_csv') else 'false',
+            '--write_mode': 'overwrite',
+            '--partition_date': 'none'
+        }
+        run_capacity = {}
+        run_plan = None
+        
+        if job_info.get('incremental'):
+            # Only process input objects that are not yet reflected in the output (tracked by ETag)
+            manifest, _ = get_manifest(job_info['input_path'], get_manifest_uri(job_info['input_path']))
+            conversation_state.input_manifest = manifest
+            run_plan = plan_incremental_inputs(manifest, load_processed_inputs(job_info['output_path']))
+            print(f"Incremental run for {job_name}: {run_plan['write_mode']} ({run_plan['reason']})")
+            
+            if not run_plan['objects']:
+                return {
+                    "status": "success",
+                    "content": [
+                        {"text": f"No new input objects since the last run of '{job_name}'. Features are up to date."},
+                        {"json": {"job_name": job_name, "status": "up_to_date"}}
+                    ]
+                }
+            
+            # The run reads an explicit manifest of just these objects and is sized from their bytes
+            run_manifest = dict(manifest, objects=run_plan['objects'],
+                                total_bytes=sum(obj['size'] for obj in run_plan['objects']))
+            script_bucket = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
+            run_manifest_uri = f"s3://{script_bucket}/manifests/runs/{job_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+            save_manifest(run_manifest, run_manifest_uri)
+            
+            run_arguments.update({
+                '--manifest_path': run_manifest_uri,
+                '--write_mode': run_plan['write_mode'],
+                '--partition_date': datetime.now().strftime('%Y-%m-%d')
+            })
+            run_capacity = {'WorkerType': 'G.1X', 'NumberOfWorkers': estimate_glue_workers(run_manifest['total_bytes'])}
+        
         # Start the job run
         job_run_response = glue_client.start_job_run(
             JobName=job_name,
-            Arguments={
-                '--input_path': job_info['input_path'],
-                '--output_path': job_info['output_path'],
-                '--feature_count': str(job_info['total_features'])
-            }
+            Arguments=run_arguments,
+            **run_capacity
         )
         
         job_run_id = job_run_response['JobRunId']
@@ -610,6 +809,13 @@ def run_glue_job(job_name: str, tool_context: ToolContext) -> Dict[str, Any]:
         job_info['job_run_id'] = job_run_id
         job_info['status'] = 'running'
         job_info['started_at'] = datetime.now().isoformat()
+        if run_plan:
+            job_info['last_run_plan'] = {
+                "write_mode": run_plan['write_mode'],
+                "input_objects": len(run_plan['objects']),
+                "partition_date": run_arguments['--partition_date'],
+                "reason": run_plan['reason']
+            }
         
         return {
             "status": "success",
@@ -617,7 +823,8 @@ def run_glue_job(job_name: str, tool_context: ToolContext) -> Dict[str, Any]:
                 {"text": f"Successfully started Glue job '{job_name}'."},
                 {"text": f"Job run ID: {job_run_id}"},
                 {"text": f"Monitor progress: aws glue get-job-run --job-name {job_name} --run-id {job_run_id}"},
-                {"json": {"job_name": job_name, "job_run_id": job_run_id, "status": "running"}}
+                {"json": {"job_name": job_name, "job_run_id": job_run_id, "status": "running",
+                          "incremental_plan": job_info.get('last_run_plan') if run_plan else None}}
             ]
         }
         
@@ -627,6 +834,91 @@ def run_glue_job(job_name: str, tool_context: ToolContext) -> Dict[str, Any]:
             "content": [{"text": f"Error starting Glue job: {str(e)}"}]
         }
 
+@tool(context=True)
+def run_feature_engineering(s3_output_path: str, tool_context: ToolContext, job_name: str = None,
+                            execution_mode: str = "auto", glue_role_arn: str = None,
+                            export_csv: bool = False, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Engineer the confirmed features, choosing local (pandas/NumPy) or AWS Glue execution.
+    
+    Args:
+        s3_output_path: S3 path where engineered features will be stored
+        job_name: Name for the run / Glue job (optional, generated if not provided)
+        execution_mode: "auto" picks local execution for small inputs whose formulas all compile locally,
+                        "local" forces the local engine, "glue" forces a Glue job (default: "auto")
+        glue_role_arn: IAM role ARN for the Glue job (optional)
+        export_csv: Also write a CSV copy under features_csv/ (default: False)
+        incremental: Create an incremental Glue job that only processes new input objects (runs on Glue)
+    """
+    try:
+        valid_modes = ['auto', 'local', 'glue']
+        if execution_mode not in valid_modes:
+            return {
+                "status": "error",
+                "content": [{"text": f"execution_mode must be one of: {', '.join(valid_modes)}"}]
+            }
+        
+        if incremental and execution_mode == "local":
+            return {
+                "status": "error",
+                "content": [{"text": "Incremental feature engineering runs on Glue. Use execution_mode 'auto' or 'glue'."}]
+            }
+        
+        if not conversation_state.final_feature_list:
+            return {
+                "status": "error",
+                "content": [{"text": "No confirmed features available. Please confirm feature list first."}]
+            }
+        
+        if not conversation_state.input_manifest:
+            return {
+                "status": "error",
+                "content": [{"text": "No S3 data source available. Please explore S3 data first."}]
+            }
+        
+        job_name = job_name or f"feature-engineering-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        manifest = conversation_state.input_manifest
+        plan = compile_features(conversation_state.final_feature_list)
+        
+        if execution_mode == "auto":
+            fits_locally = manifest['total_bytes'] <= LOCAL_EXECUTION_MAX_BYTES and not plan['unsupported'] and not incremental
+            execution_mode = "local" if fits_locally else "glue"
+            print(f"Selected {execution_mode} execution for {manifest['total_bytes']} input bytes ({len(plan['unsupported'])} formulas need Glue)")
+        
+        if execution_mode == "glue":
+            created = create_glue_job_with_confirmed_features(job_name, s3_output_path, tool_context, glue_role_arn,
+                                                              export_csv, incremental)
+            if created["status"] != "success" or created["content"][-1]["json"]["status"] == "reused":
+                return created
+            return run_glue_job(job_name, tool_context)
+        
+        conversation_state.features_output_path = s3_output_path
+        result = run_local_feature_engineering(
+            conversation_state.final_feature_list,
+            manifest['objects'],
+            manifest['bucket'],
+            s3_output_path,
+            job_name,
+            input_path=conversation_state.s3_prefix,
+            write_csv=export_csv
+        )
+        conversation_state.local_feature_runs.append(result)
+        conversation_state.conversation_stage = "engineering"
+        
+        return {
+            "status": "success",
+            "content": [
+                {"text": f"Engineered {len(plan['compiled'])} features locally over {result['record_count']} records and wrote them to {s3_output_path}."},
+                {"json": result}
+            ]
+        }
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "content": [{"text": f"Error running feature engineering: {str(e)}"}]
+        }
+
 @tool(context=True)
 def test_autogluon_availability(tool_context: ToolContext) -> Dict[str, Any]:
     """
@@ -686,97 +978,192 @@ def test_autogluon_availability(tool_context: ToolContext) -> Dict[str, Any]:
             "content": [{"text": f"Error testing AutoGluon availability: {str(e)}"}]
         }
 
-@tool(context=True)
-def train_propensity_models(model_type: str, features_s3_path: str = None, tool_context: ToolContext = None, 
-                          models_output_path: str = None,
-                          time_limit: int = 120) -> Dict[str, Any]:
+# Training backends: AutoGluon Cloud for final models, local histogram gradient boosting for fast iteration
+TRAINING_BACKENDS = ["autogluon_cloud", "local"]
+
+# Test set scoring: rows per real-time request and concurrent requests against the endpoint
+EVALUATION_MODES = ["batch", "endpoint", "none"]
+EVALUATION_BATCH_SIZE = 500
+EVALUATION_MAX_CONCURRENCY = 4
+
+def score_test_features(cloud_predictor, test_features: pd.DataFrame, evaluation_mode: str) -> List[Any]:
     """
-    Train a single propensity model using AutoGluon Cloud TabularCloudPredictor with streaming progress updates.
+    Score every test record with a trained TabularCloudPredictor.
     
-    Args:
-        model_type: Which propensity model to train - must be one of: "churn", "call", "spend_change"
-        features_s3_path: S3 path to the engineered features (optional, uses raw data if not provided)
-        models_output_path: S3 path where trained models will be stored
-        time_limit: Training time limit in seconds (default: 120)
+    "batch" runs one SageMaker batch transform job without an endpoint. "endpoint" deploys a
+    temporary endpoint, sends micro-batches of EVALUATION_BATCH_SIZE rows concurrently and always
+    cleans the endpoint up.
     """
-    global _active_training_jobs, _training_lock
+    from concurrent.futures import ThreadPoolExecutor
     
-    _training_lock = True
+    if evaluation_mode == "batch":
+        return list(cloud_predictor.predict(test_features))
+    
+    print("⏳ Deploying temporary endpoint (this may take a few minutes)...")
+    cloud_predictor.deploy()
     try:
-        import pandas as pd
-        from autogluon.cloud import TabularCloudPredictor
-        from sklearn.model_selection import train_test_split
-        import boto3
-        import os
-        import time
-        
-        # Track this training job
-        job_id = f"{model_type}_{int(time.time())}"
-        _active_training_jobs[model_type] = job_id
-        
-        # Validate model type
-        valid_models = {
-            "churn": {"name": "churn_propensity", "target": "churn_after_migration"},
-            "call": {"name": "call_propensity", "target": "number_of_calls_post_migration"},
-            "spend_change": {"name": "spend_change_propensity", "target": "change_in_spend"}
-        }
-        
-        if model_type not in valid_models:
-            return {
-                "status": "error",
-                "content": [{"text": f"Invalid model_type '{model_type}'. Must be one of: {list(valid_models.keys())}"}]
-            }
-        
-        model_config = valid_models[model_type]
+        batches = [test_features.iloc[start:start + EVALUATION_BATCH_SIZE]
+                   for start in range(0, len(test_features), EVALUATION_BATCH_SIZE)]
+        predictions = []
+        with ThreadPoolExecutor(max_workers=EVALUATION_MAX_CONCURRENCY) as executor:
+            for batch_number, batch_predictions in enumerate(executor.map(cloud_predictor.predict_real_time, batches), 1):
+                predictions.extend(list(batch_predictions))
+                print(f"📊 Progress: {len(predictions)}/{len(test_features)} records ({batch_number}/{len(batches)} requests)")
+        return predictions
+    finally:
+        cloud_predictor.cleanup_deployment()
+        print("🧹 Cleaned up temporary endpoint")
+
+def evaluate_predictions(actual: pd.Series, predictions: List[Any], classification: bool) -> Dict[str, float]:
+    """Accuracy for the churn classifier, RMSE/MAE for the regression targets"""
+    import numpy as np
+    
+    predicted = pd.Series(predictions, index=actual.index)
+    if classification:
+        return {"accuracy": float((predicted.astype(str) == actual.astype(str)).mean())}
+    errors = pd.to_numeric(predicted, errors='coerce') - pd.to_numeric(actual, errors='coerce')
+    return {"rmse": float(np.sqrt(np.nanmean(errors ** 2))), "mae": float(np.nanmean(np.abs(errors)))}
+
+# Propensity models: model_type -> model name and target column
+PROPENSITY_MODELS = {
+    "churn": {"name": "churn_propensity", "target": "churn_after_migration"},
+    "call": {"name": "call_propensity", "target": "number_of_calls_post_migration"},
+    "spend_change": {"name": "spend_change_propensity", "target": "change_in_spend"}
+}
+
+def read_training_data(features_s3_path: str, partition_start: str = None, partition_end: str = None,
+                       manifest: Dict[str, Any] = None) -> pd.DataFrame:
+    """
+    Read engineered features (or the explored raw data as a fallback) for model training.
+    
+    Feature outputs are read from the Parquet part files, falling back to the CSV copy, through
+    Arrow: part files in parallel, bookkeeping columns skipped and dtypes downcast.
+    """
+    import pyarrow.dataset as ds
+    import s3fs
+    
+    # Targets and the entity key keep their full precision
+    keep_columns = [spec['target'] for spec in PROPENSITY_MODELS.values()] + [DEFAULT_ENTITY_KEY]
+    
+    try:
+        if features_s3_path.endswith('/'):
+            # Reuse the output listing the data version was computed from instead of listing again
+            if manifest is None:
+                manifest, _ = get_manifest(features_s3_path, get_manifest_uri(features_s3_path))
+            try:
+                parquet_path = features_s3_path + "features/"
+                # Incremental outputs are partitioned by feature_date; read all of them or just the requested range
+                dataset = manifest_dataset(sub_manifest(manifest, parquet_path), 'parquet', partition_column='feature_date',
+                                           partition_start=partition_start, partition_end=partition_end)
+                data = read_training_frame(dataset, keep_columns=keep_columns)
+                print(f"✅ Loaded engineered features from Parquet: {parquet_path}"
+                      + (f" (feature_date {partition_start or '...'} to {partition_end or '...'})" if partition_start or partition_end else ""))
+            except ValueError:
+                # A partition range needs the partitioned Parquet output
+                if partition_start or partition_end:
+                    raise
+                csv_path = features_s3_path + "features_csv/"
+                data = read_training_frame(manifest_dataset(sub_manifest(manifest, csv_path), 'csv'),
+                                           keep_columns=keep_columns)
+                print(f"✅ Loaded engineered features from CSV: {csv_path}")
+        else:
+            file_format = 'parquet' if features_s3_path.endswith('.parquet') else 'csv'
+            data = read_training_frame(ds.dataset(features_s3_path.replace('s3://', ''), format=file_format,
+                                                  filesystem=s3fs.S3FileSystem()), keep_columns=keep_columns)
+    except:
+        # Fallback to raw data
+        print("📊 Falling back to raw data...")
+        if conversation_state.s3_prefix:
+            data = pd.read_csv(conversation_state.s3_prefix)
+        else:
+            raise Exception("No feature data or raw data path available. Please run feature engineering first.")
+    
+    memory_mb = data.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"🧮 Training data in memory: {memory_mb:.1f} MB")
+    return data
+
+def load_training_split(features_s3_path: str, partition_start: str = None, partition_end: str = None) -> TrainingSplit:
+    """
+    Load and split training data once per (path, partition range, version) for all propensity models.
+    
+    The version is the listing of a features directory (or the ETag of a single file), so rewritten
+    features are loaded again while repeated and concurrent trainings share one load and one split.
+    """
+    manifest = None
+    try:
+        if features_s3_path.endswith('/'):
+            manifest, _ = get_manifest(features_s3_path, get_manifest_uri(features_s3_path))
+            version = manifest_version(manifest)
+        else:
+            bucket, key = parse_s3_uri(features_s3_path)
+            version = boto3.client('s3').head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    except Exception as e:
+        # Unversioned data (e.g. the raw data fallback) is never shared with a later load
+        print(f"⚠️ Could not determine the version of {features_s3_path}: {e}")
+        version = f"unversioned-{datetime.now().isoformat()}"
+    
+    return get_training_data_cache().get_split(
+        (features_s3_path, partition_start, partition_end), version,
+        lambda: read_training_data(features_s3_path, partition_start, partition_end, manifest),
+        stratify_column=PROPENSITY_MODELS["churn"]["target"]
+    )
+
+def resolve_training_paths(features_s3_path: str = None, models_output_path: str = None):
+    """Default the features path to the last feature engineering output and the models path to the Glue bucket"""
+    bucket_name = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
+    if not features_s3_path:
+        features_s3_path = conversation_state.features_output_path or f"s3://{bucket_name}/features/"
+    if not models_output_path:
+        models_output_path = f"s3://{bucket_name}/models/"
+    return features_s3_path, models_output_path
+
+def validate_training_request(model_types: List[str], evaluation_mode: str, backend: str = "autogluon_cloud") -> Optional[str]:
+    """Error message for an invalid training request, or None"""
+    invalid = [model_type for model_type in model_types if model_type not in PROPENSITY_MODELS]
+    if invalid:
+        return f"Invalid model_type '{invalid[0]}'. Must be one of: {list(PROPENSITY_MODELS.keys())}"
+    if evaluation_mode not in EVALUATION_MODES:
+        return f"Invalid evaluation_mode '{evaluation_mode}'. Must be one of: {EVALUATION_MODES}"
+    if backend not in TRAINING_BACKENDS:
+        return f"Invalid backend '{backend}'. Must be one of: {TRAINING_BACKENDS}"
+    if backend == "local" and evaluation_mode == "endpoint":
+        return "evaluation_mode 'endpoint' needs the autogluon_cloud backend; local models are scored in-process with 'batch'"
+    return None
+
+def setup_training_session():
+    """Configure the default boto3 session once, before training threads create clients from it"""
+    aws_region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
+    if not aws_region:
+        raise ValueError("AWS_REGION or AWS_DEFAULT_REGION environment variable must be set")
+    boto3.setup_default_session(region_name=aws_region)
+
+def run_propensity_training(model_type: str, features_s3_path: str, models_output_path: str,
+                            time_limit: int = 120, partition_start: str = None, partition_end: str = None,
+                            evaluation_mode: str = "batch", backend: str = "autogluon_cloud",
+                            distill: bool = False, job: TrainingJob = None) -> Dict[str, Any]:
+    """
+    Train one propensity model with AutoGluon Cloud TabularCloudPredictor or the local backend.
+    
+    Runs on a training scheduler worker; progress is recorded on the job, and a cancelled job
+    stops before training and before evaluation.
+    """
+    def checkpoint():
+        if job is not None:
+            job.check_cancelled()
+    
+    try:
+        model_config = PROPENSITY_MODELS[model_type]
         model_name = model_config["name"]
         target_column = model_config["target"]
         
         # Stream progress update
-        print(f"🚀 Starting {model_name} training pipeline...")
+        report_progress(f"🚀 Starting {model_name} training pipeline...")
+        report_progress(f"📊 Loading data from: {features_s3_path}")
         
-        # Use engineered features from conversation state if available
-        if not features_s3_path:
-            if conversation_state.features_output_path:
-                features_s3_path = conversation_state.features_output_path
-            else:
-                # Use dynamic bucket name
-                bucket_name = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
-                features_s3_path = f"s3://{bucket_name}/features/"
-        
-        # Set default models output path if not provided
-        if not models_output_path:
-            bucket_name = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
-            models_output_path = f"s3://{bucket_name}/models/"
-        
-        print(f"📊 Loading data from: {features_s3_path}")
-        
-        # Load and prepare data
-        try:
-            if features_s3_path.endswith('/'):
-                # Load from features directory - try CSV first, then parquet
-                try:
-                    csv_path = features_s3_path + "features_csv/"
-                    data = pd.read_csv(csv_path)
-                    print(f"✅ Loaded engineered features from CSV: {csv_path}")
-                except:
-                    parquet_path = features_s3_path + "features/"
-                    data = pd.read_parquet(parquet_path)
-                    print(f"✅ Loaded engineered features from Parquet: {parquet_path}")
-            elif features_s3_path.endswith('.parquet'):
-                data = pd.read_parquet(features_s3_path)
-            else:
-                data = pd.read_csv(features_s3_path)
-        except:
-            # Fallback to raw data
-            print("📊 Falling back to raw data...")
-            bucket_name = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
-            # Use the same bucket but raw-data path
-            if conversation_state.s3_prefix:
-                data = pd.read_csv(conversation_state.s3_prefix)
-            else:
-                raise Exception("No feature data or raw data path available. Please run feature engineering first.")
-        
-        print(f"✅ Loaded data: {len(data)} rows, {len(data.columns)} columns")
+        split = load_training_split(features_s3_path, partition_start, partition_end)
+        data = split.data
+        report_progress(f"✅ Loaded data: {len(data)} rows, {len(data.columns)} columns (version {split.version[:12]})")
+        checkpoint()
         
         # Check if target column exists
         if target_column not in data.columns:
@@ -785,42 +1172,38 @@ def train_propensity_models(model_type: str, features_s3_path: str = None, tool_
                 "content": [{"text": f"Target column '{target_column}' not found in data. Available columns: {list(data.columns)}"}]
             }
         
-        print(f"🎯 Training {model_name} model for target: {target_column}")
+        report_progress(f"🎯 Training {model_name} model for target: {target_column}")
         
         try:
-            # Split data for this model
-            if target_column == "churn_after_migration":
-                # Binary classification - stratify
-                train_data, test_data = train_test_split(data, test_size=0.2, random_state=42, stratify=data[target_column])
-            else:
-                # Regression - no stratification
-                train_data, test_data = train_test_split(data, test_size=0.2, random_state=42)
+            # One shared split for all targets (stratified on churn); train and test are views of the cached data
+            train_data, test_data = split.train, split.test
+            report_progress(f"📈 Data split: {len(train_data)} train, {len(test_data)} test"
+                            + (f" (stratified on {split.stratify_column})" if split.stratify_column else ""))
             
-            print(f"📈 Data split: {len(train_data)} train, {len(test_data)} test")
+            # The other propensity targets are outcomes, not features
+            other_targets = split.excluded_columns(target_column, [model["target"] for model in PROPENSITY_MODELS.values()])
             
-            # Remove target from test data for prediction
-            test_features = test_data.drop(columns=[target_column])
+            # Remove targets from test data for prediction
+            test_features = test_data.drop(columns=[target_column] + other_targets)
             
             # Configure predictor
-            predictor_init_args = {"label": target_column}
+            predictor_init_args = {"label": target_column, "learner_kwargs": {"ignored_columns": other_targets}}
             predictor_fit_args = {"train_data": train_data, "time_limit": time_limit}
             
-            # Train model with TabularCloudPredictor
+            # Train model with TabularCloudPredictor, or locally with the same fit/leaderboard/predict calls
             model_output_path = f"{models_output_path}{model_name}/"
+            if backend == "local":
+                model_output_path += "local/"
+                cloud_predictor = LocalTabularPredictor(cloud_output_path=model_output_path)
+            else:
+                from autogluon.cloud import TabularCloudPredictor
+                cloud_predictor = TabularCloudPredictor(cloud_output_path=model_output_path)
             
-            # Configure AWS session with explicit region
-            aws_region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
-            if not aws_region:
-                raise ValueError("AWS_REGION or AWS_DEFAULT_REGION environment variable must be set")
-            boto3.setup_default_session(region_name=aws_region)
-            
-            # Initialize TabularCloudPredictor
-            cloud_predictor = TabularCloudPredictor(cloud_output_path=model_output_path)
-            
-            print(f"🔄 Starting model training (time limit: {time_limit}s)...")
+            checkpoint()
+            report_progress(f"🔄 Starting {backend} model training (time limit: {time_limit}s)...")
             # Fit the model
             cloud_predictor.fit(predictor_init_args=predictor_init_args, predictor_fit_args=predictor_fit_args)
-            print(f"✅ Model training completed successfully")
+            report_progress(f"✅ Model training completed successfully")
             
             # Get model performance
             try:
@@ -832,72 +1215,78 @@ def train_propensity_models(model_type: str, features_s3_path: str = None, tool_
                 print(f"⚠️ Could not generate leaderboard: {e}")
                 leaderboard_dict = None
             
-            # Deploy and run real-time predictions
-            try:
-                print(f"🚀 Deploying {model_name} model for real-time inference...")
-                print("⏳ Waiting for endpoint creation (this may take a few minutes)...")
-                cloud_predictor.deploy()
-                print(f"✅ Inference endpoint deployed successfully")
-                
-                # Limit to 300 test records as requested
-                test_limit = min(300, len(test_features))
-                test_features_limited = test_features.head(test_limit)
-                test_data_limited = test_data.head(test_limit)
-                
-                print(f"🔮 Running individual predictions for {model_name} ({test_limit} records):")
-                
-                individual_predictions = []
-                for idx, (_, row) in enumerate(test_features_limited.iterrows()):
-                    # Convert row to DataFrame for prediction
-                    single_record = pd.DataFrame([row])
-                    prediction = cloud_predictor.predict_real_time(single_record)
-                    individual_predictions.append(prediction[0] if hasattr(prediction, '__len__') else prediction)
+            # Score every test record: one batch transform, or micro-batches against a temporary endpoint
+            predictions = None
+            test_data_with_predictions = None
+            evaluation_metrics = None
+            test_limit = 0
+            checkpoint()
+            if evaluation_mode == "none":
+                report_progress(f"⏭️ Skipping test set evaluation for {model_name}")
+            else:
+                try:
+                    report_progress(f"🔮 Scoring {len(test_features)} test records for {model_name} ({evaluation_mode} inference)...")
+                    predictions = score_test_features(cloud_predictor, test_features, evaluation_mode)
+                    test_limit = len(predictions)
+                    report_progress(f"✅ Predictions completed: {len(predictions)} predictions")
                     
                     # Print results for first 10 records with features
-                    if idx < 10:
-                        actual_value = test_data_limited.iloc[idx][target_column]
-                        print(f"Record {idx+1:3d}: Actual={actual_value:8.3f}, Predicted={individual_predictions[-1]:8.3f}")
-                        
-                        # Print all features for this record
-                        feature_str = ", ".join([f"{col}={row[col]:.3f}" if pd.api.types.is_numeric_dtype(row[col]) else f"{col}={row[col]}" 
-                                               for col in test_features_limited.columns])
+                    for idx in range(min(10, test_limit)):
+                        row = test_features.iloc[idx]
+                        actual_value = test_data.iloc[idx][target_column]
+                        print(f"Record {idx+1:3d}: Actual={actual_value!s:>8}, Predicted={predictions[idx]!s:>8}")
+                        feature_str = ", ".join([f"{col}={row[col]:.3f}" if pd.api.types.is_numeric_dtype(type(row[col])) else f"{col}={row[col]}"
+                                               for col in test_features.columns])
                         print(f"         Features: {feature_str}")
                         print()
                     
-                    # Stream progress updates every 50 records
-                    elif (idx + 1) % 50 == 0:
-                        progress_pct = ((idx + 1) / test_limit) * 100
-                        print(f"📊 Progress: {idx + 1}/{test_limit} records ({progress_pct:.1f}%)")
-                
-                print(f"✅ Individual predictions completed: {len(individual_predictions)} predictions")
-                
-                cloud_predictor.cleanup_deployment()
-                print(f"🧹 Cleaned up deployment for {model_name}")
-                
-                # Use individual predictions for final results
-                predictions = individual_predictions
-                
-                # Merge predictions with original test data (includes all features + target)
-                test_data_with_predictions = test_data_limited.copy()
-                test_data_with_predictions[f'{target_column}_predicted'] = predictions
-                
-                # Save merged results to S3 model folder
-                s3_client = boto3.client('s3')
-                bucket_name = model_output_path.replace('s3://', '').split('/')[0]
-                results_key = '/'.join(model_output_path.replace('s3://', '').split('/')[1:]) + 'test_results_with_predictions.csv'
-                
-                local_file = f"/tmp/test_results_{model_name}.csv"
-                test_data_with_predictions.to_csv(local_file, index=False)
-                s3_client.upload_file(local_file, bucket_name, results_key)
-                
-                results_s3_path = f"s3://{bucket_name}/{results_key}"
-                print(f"💾 Saved test results with predictions to {results_s3_path}")
-                
-            except Exception as e:
-                print(f"⚠️ Real-time prediction failed: {e}")
-                predictions = None
-                test_data_with_predictions = None
-                test_limit = 0
+                    evaluation_metrics = evaluate_predictions(test_data[target_column], predictions,
+                                                              classification=target_column == "churn_after_migration")
+                    report_progress(f"📏 Test metrics for {model_name}: {evaluation_metrics}")
+                    
+                    # Merge predictions with original test data (includes all features + target)
+                    test_data_with_predictions = test_data.copy()
+                    test_data_with_predictions[f'{target_column}_predicted'] = predictions
+                    
+                    # Save merged results to S3 model folder
+                    s3_client = boto3.client('s3')
+                    bucket_name = model_output_path.replace('s3://', '').split('/')[0]
+                    results_key = '/'.join(model_output_path.replace('s3://', '').split('/')[1:]) + 'test_results_with_predictions.csv'
+                    
+                    local_file = f"/tmp/test_results_{model_name}.csv"
+                    test_data_with_predictions.to_csv(local_file, index=False)
+                    s3_client.upload_file(local_file, bucket_name, results_key)
+                    
+                    results_s3_path = f"s3://{bucket_name}/{results_key}"
+                    report_progress(f"💾 Saved test results with predictions to {results_s3_path}")
+                    
+                except Exception as e:
+                    print(f"⚠️ Test set prediction failed: {e}")
+                    predictions = None
+                    test_data_with_predictions = None
+                    test_limit = 0
+            
+            # Compact student for low-latency scoring, fitted to this model's predictions
+            distillation = None
+            if distill:
+                checkpoint()
+                try:
+                    report_progress(f"🧪 Distilling {model_name} into a compact scoring model...")
+                    distillation = distill_predictor(
+                        cloud_predictor, train_data, test_features, target_column, other_targets,
+                        classification=target_column == "churn_after_migration",
+                        output_path=f"{model_output_path}distilled/",
+                        teacher_test_predictions=predictions, time_limit=time_limit
+                    )
+                    distillation["evaluation_metrics"] = evaluate_predictions(
+                        test_data[target_column], list(distillation.pop("student_predictions")),
+                        classification=target_column == "churn_after_migration"
+                    )
+                    report_progress(f"✅ Distilled model: fidelity {distillation['fidelity']}, "
+                                    f"{distillation['latency_us_per_row']:.2f} µs/row, saved to {distillation['student_path']}")
+                except Exception as e:
+                    report_progress(f"⚠️ Distillation failed: {e}")
+                    distillation = {"error": str(e)}
             
             training_result = {
                 "model_name": model_name,
@@ -907,14 +1296,20 @@ def train_propensity_models(model_type: str, features_s3_path: str = None, tool_
                 "train_size": len(train_data),
                 "test_size": len(test_data),
                 "predictions_tested": test_limit,
+                "backend": backend,
+                "evaluation_mode": evaluation_mode,
+                "evaluation_metrics": evaluation_metrics,
                 "leaderboard": leaderboard_dict,
                 "predictions_count": len(predictions) if predictions is not None else 0,
                 "results_s3_path": results_s3_path if predictions is not None else None,
+                "distillation": distillation,
                 "status": "completed"
             }
             
+        except TrainingCancelled:
+            raise
         except Exception as e:
-            print(f"❌ Error training {model_name}: {str(e)}")
+            report_progress(f"❌ Error training {model_name}: {str(e)}")
             training_result = {
                 "model_name": model_name,
                 "model_type": model_type,
@@ -946,9 +1341,11 @@ def train_propensity_models(model_type: str, features_s3_path: str = None, tool_
                     {"text": f"🎯 Target Variable: {target_column}"},
                     {"text": f"📊 Training Data: {training_result['train_size']} records"},
                     {"text": f"🧪 Test Data: {training_result['test_size']} records"},
-                    {"text": f"🔮 Predictions: {training_result['predictions_count']} individual predictions on {training_result.get('predictions_tested', 0)} test records"},
+                    {"text": f"🔮 Predictions: {training_result['predictions_count']} {evaluation_mode} predictions on {training_result.get('predictions_tested', 0)} test records"},
                     {"text": f"💾 Model saved to: {training_result['output_path']}"},
                     {"text": f"📁 Results saved to: {training_result.get('results_s3_path', 'N/A')}"},
+                    *([{"text": f"🧪 Distilled model: {distillation['student_path']} (fidelity {distillation['fidelity']}, "
+                                f"{distillation['latency_us_per_row']:.2f} µs/row)"}] if distillation and "error" not in distillation else []),
                     {"json": summary}
                 ]
             }
@@ -962,18 +1359,300 @@ def train_propensity_models(model_type: str, features_s3_path: str = None, tool_
                 ]
             }
         
+    except TrainingCancelled:
+        raise
     except Exception as e:
         return {
             "status": "error",
             "content": [{"text": f"Error training model: {str(e)}"}]
         }
-    finally:
-        # Always clean up singleton state
-        _training_lock = False
-        if model_type in _active_training_jobs:
-            del _active_training_jobs[model_type]
 
-def generate_comprehensive_glue_script(final_features: List[Dict], input_s3_path: str, output_s3_path: str) -> str:
+def format_training_job(job: TrainingJob) -> Dict[str, Any]:
+    """Status of a training job with the text of its result once finished"""
+    status = job.to_dict()
+    if job.result is not None:
+        status["result"] = [item['text'] for item in job.result.get('content', []) if 'text' in item]
+    return status
+
+@tool(context=True)
+def train_propensity_models(model_type: str, features_s3_path: str = None, tool_context: ToolContext = None, 
+                          models_output_path: str = None,
+                          time_limit: int = 120, partition_start: str = None,
+                          partition_end: str = None, evaluation_mode: str = "batch",
+                          backend: str = "autogluon_cloud", distill: bool = False) -> Dict[str, Any]:
+    """
+    Train a single propensity model using AutoGluon Cloud TabularCloudPredictor (or locally) and wait for it to finish.
+    
+    Args:
+        model_type: Which propensity model to train - must be one of: "churn", "call", "spend_change"
+        features_s3_path: S3 path to the engineered features (optional, uses raw data if not provided)
+        models_output_path: S3 path where trained models will be stored
+        time_limit: Training time limit in seconds (default: 120)
+        partition_start: First feature_date partition (YYYY-MM-DD) to train on, for incremental outputs (optional)
+        partition_end: Last feature_date partition (YYYY-MM-DD) to train on, for incremental outputs (optional)
+        evaluation_mode: How the whole test split is scored - "batch" (batch transform, no endpoint),
+                         "endpoint" (temporary real-time endpoint, parallel micro-batches) or "none" (default: "batch")
+        backend: "autogluon_cloud" for final models or "local" for fast local histogram gradient boosting
+                 on the same split (default: "autogluon_cloud")
+        distill: Also fit and export a compact gradient-boosting student to the trained model's predictions,
+                 for microsecond-per-row batch scoring (default: False)
+    """
+    from concurrent.futures import CancelledError
+    
+    try:
+        error = validate_training_request([model_type], evaluation_mode, backend)
+        if error:
+            return {"status": "error", "content": [{"text": error}]}
+        
+        features_s3_path, models_output_path = resolve_training_paths(features_s3_path, models_output_path)
+        if backend == "autogluon_cloud":
+            setup_training_session()
+        
+        # Runs on the shared scheduler so it can overlap with jobs submitted by submit_training_jobs
+        try:
+            job = get_training_scheduler().submit(
+                model_type, run_propensity_training, dedupe_key=(model_type, backend), features_s3_path=features_s3_path,
+                models_output_path=models_output_path, time_limit=time_limit, partition_start=partition_start,
+                partition_end=partition_end, evaluation_mode=evaluation_mode, backend=backend, distill=distill
+            )
+        except TrainingConflict as e:
+            return {"status": "error", "content": [{"text": str(e)}, {"json": e.job.to_dict()}]}
+        print(f"🆔 Training job {job.job_id} ({job.status})")
+        try:
+            return job.future.result()
+        except CancelledError:
+            return {"status": "error", "content": [{"text": f"Training job {job.job_id} was cancelled before it started"}]}
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "content": [{"text": f"Error training model: {str(e)}"}]
+        }
+
+@tool(context=True)
+def submit_training_jobs(tool_context: ToolContext, model_types: List[str] = None, features_s3_path: str = None,
+                         models_output_path: str = None, time_limit: int = 120, partition_start: str = None,
+                         partition_end: str = None, evaluation_mode: str = "batch",
+                         backend: str = "autogluon_cloud", distill: bool = False) -> Dict[str, Any]:
+    """
+    Start training several propensity models concurrently and return their job ids without waiting.
+    
+    The jobs share one load of the training data. Poll get_training_status for progress and results.
+    
+    Args:
+        model_types: Models to train - any of "churn", "call", "spend_change" (default: all three)
+        features_s3_path: S3 path to the engineered features (optional, uses raw data if not provided)
+        models_output_path: S3 path where trained models will be stored
+        time_limit: Training time limit in seconds per model (default: 120)
+        partition_start: First feature_date partition (YYYY-MM-DD) to train on, for incremental outputs (optional)
+        partition_end: Last feature_date partition (YYYY-MM-DD) to train on, for incremental outputs (optional)
+        evaluation_mode: How the whole test split is scored - "batch", "endpoint" or "none" (default: "batch")
+        backend: "autogluon_cloud" or "local" (histogram gradient boosting, seconds per model) (default: "autogluon_cloud")
+        distill: Also export a compact student model per target for low-latency scoring (default: False)
+    """
+    try:
+        model_types = list(dict.fromkeys(model_types or PROPENSITY_MODELS.keys()))
+        error = validate_training_request(model_types, evaluation_mode, backend)
+        if error:
+            return {"status": "error", "content": [{"text": error}]}
+        
+        features_s3_path, models_output_path = resolve_training_paths(features_s3_path, models_output_path)
+        if backend == "autogluon_cloud":
+            setup_training_session()
+        
+        scheduler = get_training_scheduler()
+        jobs, conflicts = [], []
+        for model_type in model_types:
+            try:
+                jobs.append(scheduler.submit(
+                    model_type, run_propensity_training, dedupe_key=(model_type, backend), features_s3_path=features_s3_path,
+                    models_output_path=models_output_path, time_limit=time_limit, partition_start=partition_start,
+                    partition_end=partition_end, evaluation_mode=evaluation_mode, backend=backend, distill=distill
+                ))
+            except TrainingConflict as e:
+                conflicts.append(str(e))
+        
+        if not jobs:
+            return {"status": "error", "content": [{"text": f"⚠️ {conflict}"} for conflict in conflicts]}
+        
+        return {
+            "status": "success",
+            "content": [
+                {"text": f"🚀 Submitted {len(jobs)} training jobs ({scheduler.max_workers} run at a time)"},
+                *[{"text": f"🆔 {job.job_id}: {job.status}"} for job in jobs],
+                *[{"text": f"⚠️ Not submitted: {conflict}"} for conflict in conflicts],
+                {"text": "Use get_training_status to follow progress and cancel_training_job to stop a job."},
+                {"json": {"jobs": [job.to_dict() for job in jobs], "features_s3_path": features_s3_path,
+                          "models_output_path": models_output_path}}
+            ]
+        }
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "content": [{"text": f"Error submitting training jobs: {str(e)}"}]
+        }
+
+@tool(context=True)
+def get_training_status(tool_context: ToolContext, job_id: str = None) -> Dict[str, Any]:
+    """
+    Show the state, latest progress and results of training jobs.
+    
+    Args:
+        job_id: Training job to show (optional, shows all jobs if not provided)
+    """
+    scheduler = get_training_scheduler()
+    if job_id:
+        job = scheduler.get(job_id)
+        if job is None:
+            return {"status": "error", "content": [{"text": f"Training job '{job_id}' not found"}]}
+        jobs = [job]
+    else:
+        jobs = scheduler.jobs()
+        if not jobs:
+            return {"status": "success", "content": [{"text": "No training jobs have been submitted yet."}]}
+    
+    return {
+        "status": "success",
+        "content": [
+            *[{"text": f"🆔 {job.job_id}: {job.status}"
+                       + (f" - {job.progress[-1]['message']}" if job.progress else "")} for job in jobs],
+            {"json": {"jobs": [format_training_job(job) for job in jobs]}}
+        ]
+    }
+
+@tool(context=True)
+def cancel_training_job(job_id: str, tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    Cancel a queued or running training job. Running jobs stop before their next stage (training or evaluation).
+    
+    Args:
+        job_id: Training job to cancel
+    """
+    scheduler = get_training_scheduler()
+    job = scheduler.get(job_id)
+    if job is None:
+        return {"status": "error", "content": [{"text": f"Training job '{job_id}' not found"}]}
+    if not scheduler.cancel(job_id):
+        return {"status": "error", "content": [{"text": f"Training job '{job_id}' already finished ({job.status})"}]}
+    
+    return {
+        "status": "success",
+        "content": [
+            {"text": f"🛑 Training job {job_id} " + ("cancelled" if job.status == 'cancelled' else "will stop before its next stage")},
+            {"json": job.to_dict()}
+        ]
+    }
+
+def find_scoring_model(models_output_path: str, model_name: str) -> Optional[str]:
+    """Path of the exported in-process model for a propensity model: the distilled student, else the local model"""
+    for variant in ("distilled", "local"):
+        path = f"{models_output_path}{model_name}/{variant}/"
+        fs, root = fsspec.core.url_to_fs(f"{path}model.joblib")
+        if fs.exists(root):
+            return path
+    return None
+
+@tool(context=True)
+def score_customer_base(tool_context: ToolContext, model_types: List[str] = None, features_s3_path: str = None,
+                        models_output_path: str = None, output_path: str = None,
+                        entity_key: str = DEFAULT_ENTITY_KEY, workers: int = None) -> Dict[str, Any]:
+    """
+    Score every customer with the trained propensity models and write the scores as partitioned Parquet.
+    
+    Uses the distilled (or local backend) model of each target, streams the feature table in record
+    batches and scores them on a process pool across all cores in bounded memory.
+    
+    Args:
+        model_types: Models to score - any of "churn", "call", "spend_change" (default: all with an exported model)
+        features_s3_path: S3 path to the engineered features (default: the last feature engineering output)
+        models_output_path: S3 path where trained models are stored
+        output_path: S3 path for the scores (default: s3://{GLUE_SCRIPT_BUCKET}/scores/)
+        entity_key: Customer identifier column written with every score (default: customer_id)
+        workers: Scoring processes (default: all cores)
+    """
+    try:
+        requested = list(dict.fromkeys(model_types or PROPENSITY_MODELS.keys()))
+        error = validate_training_request(requested, "batch", "local")
+        if error:
+            return {"status": "error", "content": [{"text": error}]}
+        
+        features_s3_path, models_output_path = resolve_training_paths(features_s3_path, models_output_path)
+        if not output_path:
+            bucket_name = os.environ.get('GLUE_SCRIPT_BUCKET', f'feature-engineering-{get_aws_account_id()}')
+            output_path = f"s3://{bucket_name}/scores/"
+        
+        model_paths, missing = {}, []
+        for model_type in requested:
+            model_name = PROPENSITY_MODELS[model_type]["name"]
+            path = find_scoring_model(models_output_path, model_name)
+            if path:
+                model_paths[model_name] = path
+            else:
+                missing.append(model_type)
+        if not model_paths or (model_types and missing):
+            return {
+                "status": "error",
+                "content": [{"text": f"No exported scoring model for {missing}. Train with distill=True (or backend=\"local\") first."}]
+            }
+        
+        features_manifest, _ = get_manifest(features_s3_path, get_manifest_uri(features_s3_path))
+        dataset = manifest_dataset(sub_manifest(features_manifest, features_s3_path + "features/"), 'parquet')
+        
+        summary = run_batch_scoring(dataset, model_paths, output_path, entity_key=entity_key, workers=workers)
+        
+        return {
+            "status": "success",
+            "content": [
+                {"text": f"✅ Scored {summary['rows_scored']} customers with {', '.join(model_paths)}"},
+                {"text": f"⚡ {summary['rows_per_second']:,.0f} rows/second on {summary['workers']} processes ({summary['elapsed_seconds']:.1f}s)"},
+                {"text": f"📁 Scores written to: {summary['output_path']} (partitioned by customer_bucket, keyed by {entity_key})"},
+                *([{"text": f"⏭️ No exported model for: {', '.join(missing)}"}] if missing else []),
+                {"json": summary}
+            ]
+        }
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "content": [{"text": f"Error scoring customer base: {str(e)}"}]
+        }
+
+def generate_input_schema_code(data_types: Dict[str, str], sampled_types: bool = True,
+                               entity_key: str = DEFAULT_ENTITY_KEY) -> str:
+    """
+    Render the explored data types as a Spark StructType literal for the Glue script.
+    
+    Integers are read as LongType and floats as DoubleType whatever their pandas width. When the
+    types come from a sample, integer columns are widened to DoubleType, since rows outside the
+    sample may hold decimals that a permissive read would turn into nulls; types from full-pass
+    (streaming or metadata) profiles are kept. A numeric entity key is always read as LongType.
+    Everything else is read as StringType; date columns are converted in engineer_features as before.
+    """
+    if not data_types:
+        return "None"
+    
+    fields = []
+    for col, dtype in data_types.items():
+        if dtype == 'bool':
+            spark_type = "BooleanType()"
+        elif col == entity_key and dtype.startswith(('int', 'uint', 'Int', 'UInt', 'float', 'Float')):
+            spark_type = "LongType()"
+        elif dtype == 'uint64':
+            spark_type = "DecimalType(20, 0)" if not sampled_types else "DoubleType()"
+        elif dtype.startswith(('int', 'uint', 'Int', 'UInt')):
+            spark_type = "DoubleType()" if sampled_types else "LongType()"
+        elif dtype.startswith(('float', 'Float')):
+            spark_type = "DoubleType()"
+        else:
+            spark_type = "StringType()"
+        fields.append(f"    StructField({col!r}, {spark_type}, True),")
+    return "StructType([\n" + "\n".join(fields) + "\n])"
+
+def generate_comprehensive_glue_script(final_features: List[Dict], input_s3_path: str, output_s3_path: str,
+                                       input_columns: List[str] = None, input_data_types: Dict[str, str] = None,
+                                       sampled_types: bool = True, entity_key: str = DEFAULT_ENTITY_KEY,
+                                       feature_store: Dict[str, Any] = None) -> str:
     """Generate comprehensive AWS Glue PySpark script based on confirmed feature list"""
     
     # Separate features by type
@@ -981,42 +1660,32 @@ def generate_comprehensive_glue_script(final_features: List[Dict], input_s3_path
     user_features = [f for f in final_features if f.get('source') == 'user']
     raw_columns = [f for f in final_features if f.get('source') == 'raw_data']
     
-    # Generate feature engineering code
-    feature_code = ""
+    # Features already materialised in the feature store are joined in, only the rest are computed
+    computed_features = llm_features + user_features
+    if feature_store:
+        computed_features = [f for f in computed_features if f['feature_name'] in feature_store['new_columns']]
     
-    # Add LLM-generated features
-    for feature in llm_features:
-        feature_code += f"""
-    # LLM Feature: {feature['feature_name']} - {feature['description']}
-    if all(col in df.columns for col in {feature['source_columns']}):
-        try:
-            feature_df = feature_df.withColumn(
-                '{feature['feature_name']}',
-                {convert_formula_to_spark(feature.get('formula', feature['feature_name']))}
-            )
-            print(f"Successfully created LLM feature: {feature['feature_name']}")
-        except Exception as e:
-            print(f"Error creating LLM feature {feature['feature_name']}: {{e}}")
-    """
+    # Translate every formula up front: compiled locally, cached, or batched into a few LLM requests
+    translations = translate_formulas(
+        [feature.get('formula', feature['feature_name']) for feature in computed_features],
+        input_columns,
+        derived_columns=[feature['feature_name'] for feature in final_features]
+    )
     
-    # Add user-suggested features
-    for feature in user_features:
-        feature_code += f"""
-    # User Feature: {feature['feature_name']} - {feature['description']}
-    if all(col in df.columns for col in {feature['source_columns']}):
-        try:
-            feature_df = feature_df.withColumn(
-                '{feature['feature_name']}',
-                {convert_formula_to_spark(feature.get('formula', feature['feature_name']))}
-            )
-            print(f"Successfully created user feature: {feature['feature_name']}")
-        except Exception as e:
-            print(f"Error creating user feature {feature['feature_name']}: {{e}}")
-    """
+    # Plan the features as a few select projections with shared subexpressions computed once
+    projection_plan = plan_feature_projections(computed_features, translations)
+    print(f"Planned {len(computed_features)} features in {len(projection_plan['stages'])} projections "
+          f"with {projection_plan['shared_subexpressions']} shared subexpressions")
+    feature_code = render_feature_plan(projection_plan)
+    
+    store_code = repr({key: value for key, value in feature_store.items() if key != 'assembly'}) if feature_store else "None"
     
     # Raw columns are passed through as-is
     raw_column_names = [f['feature_name'] for f in raw_columns]
     
+    # Explicit input schema from exploration, so CSV/JSON reads skip the inferSchema pass over the data
+    input_schema_code = generate_input_schema_code(input_data_types, sampled_types, entity_key)
+    
     script_template = f"""
 import sys
 from awsglue.transforms import *
@@ -1028,9 +1697,12 @@ from pyspark.sql import functions as F
 from pyspark.sql.types import *
 from pyspark.sql.window import Window
 import boto3
+import json
+from datetime import datetime
 
 # Get job arguments
-args = getResolvedOptions(sys.argv, ['JOB_NAME', 'input_path', 'output_path', 'feature_count'])
+args = getResolvedOptions(sys.argv, ['JOB_NAME', 'input_path', 'output_path', 'feature_count', 'manifest_path', 'write_csv',
+                                     'write_mode', 'partition_date'])
 
 # Initialize Glue context
 sc = SparkContext()
@@ -1044,32 +1716,148 @@ print(f"Input path: {{args['input_path']}}")
 print(f"Output path: {{args['output_path']}}")
 print(f"Expected features: {{args['feature_count']}}")
 
+# Input schema from data exploration (None falls back to schema inference)
+input_schema = {input_schema_code}
+
+def csv_reader():
+    \"\"\"CSV reader using the explored schema (header names are validated against it)\"\"\"
+    reader = spark.read.option("header", "true")
+    if input_schema is not None:
+        return reader.option("enforceSchema", "false").schema(input_schema)
+    return reader.option("inferSchema", "true")
+
+def json_reader():
+    return spark.read.schema(input_schema) if input_schema is not None else spark.read
+
+def read_input_files(paths, file_format):
+    \"\"\"Read a list of input files of one format\"\"\"
+    if file_format == 'json':
+        return json_reader().json(paths)
+    if file_format == 'parquet':
+        return spark.read.parquet(*paths)
+    return csv_reader().csv(paths)
+
 # Read input data from S3
 try:
     # Try different file formats
     input_path = args['input_path']
-    if input_path.endswith('/'):
+    manifest_path = args['manifest_path']
+    if manifest_path != 'none':
+        # Read the explicit file list from the listing manifest instead of globbing the prefix
+        manifest_bucket, manifest_key = manifest_path.replace('s3://', '').split('/', 1)
+        manifest = json.loads(boto3.client('s3').get_object(Bucket=manifest_bucket, Key=manifest_key)['Body'].read())
+        paths_by_format = {{}}
+        for obj in manifest['objects']:
+            paths_by_format.setdefault(obj['format'], []).append(f"s3://{{manifest['bucket']}}/{{obj['key']}}")
+        print(f"Reading {{len(manifest['objects'])}} files from manifest: {{manifest_path}}")
+        frames = [read_input_files(paths, file_format) for file_format, paths in paths_by_format.items()]
+        df = frames[0]
+        for frame in frames[1:]:
+            df = df.unionByName(frame, allowMissingColumns=True)
+    elif input_path.endswith('/'):
         # Read all files in directory
-        df = spark.read.option("header", "true").option("inferSchema", "true").csv(input_path + "*.csv")
+        df = csv_reader().csv(input_path + "*.csv")
     else:
         # Read specific file
         if input_path.endswith('.csv'):
-            df = spark.read.option("header", "true").option("inferSchema", "true").csv(input_path)
+            df = csv_reader().csv(input_path)
         elif input_path.endswith('.json'):
-            df = spark.read.json(input_path)
+            df = json_reader().json(input_path)
         elif input_path.endswith('.parquet'):
             df = spark.read.parquet(input_path)
         else:
             # Default to CSV
-            df = spark.read.option("header", "true").option("inferSchema", "true").csv(input_path)
+            df = csv_reader().csv(input_path)
     
-    print(f"Successfully loaded data with {{df.count()}} records and {{len(df.columns)}} columns")
+    # No count here: every action would re-read the input, the record count comes from the written output
+    print(f"Successfully loaded data with {{len(df.columns)}} columns")
     print(f"Columns: {{df.columns}}")
     
 except Exception as e:
     print(f"Error reading input data: {{e}}")
     raise e
 
+def project_features(frame, definitions, drop_columns=()):
+    \"\"\"Add one stage of feature definitions to frame with a single select projection\"\"\"
+    expressions = {{}}
+    for name, kind, required_columns, build in definitions:
+        if not all(col in frame.columns for col in required_columns):
+            print(f"Skipping {{kind}} feature {{name}}: missing source columns")
+            continue
+        try:
+            expressions[name] = build()
+        except Exception as e:
+            print(f"Error creating {{kind}} feature {{name}}: {{e}}")
+    
+    def projection(selected):
+        columns = [selected[col].alias(col) if col in selected else F.col(col)
+                   for col in frame.columns if col not in drop_columns]
+        columns += [expression.alias(name) for name, expression in selected.items() if name not in frame.columns]
+        return frame.select(*columns)
+    
+    try:
+        projected = projection(expressions)
+    except Exception as e:
+        # Find the failing expressions (analysis only, no data is read) and project the rest
+        print(f"Combined projection failed, validating features individually: {{e}}")
+        valid = {{}}
+        for name, expression in expressions.items():
+            try:
+                frame.select(expression.alias(name))
+                valid[name] = expression
+            except Exception as e:
+                print(f"Error creating feature {{name}}: {{e}}")
+        expressions = valid
+        projected = projection(expressions)
+    
+    print(f"Successfully created {{len(expressions)}} columns in one projection: {{list(expressions)}}")
+    return projected
+
+# Feature store plan: cached feature columns to join and new columns to register (None disables the store)
+feature_store = {store_code}
+
+def verify_entity_key(frame, store):
+    \"\"\"Stored columns are joined on the entity key, so fail before joining or registering unless it is unique and non-null\"\"\"
+    key = store['entity_key']
+    counts = frame.agg(F.count(F.lit(1)).alias('rows'), F.count(F.col(key)).alias('non_null'),
+                       F.countDistinct(F.col(key)).alias('distinct')).collect()[0]
+    if not counts['rows'] == counts['non_null'] == counts['distinct']:
+        raise ValueError(f"Entity key '{{key}}' is not unique and non-null in the input ({{counts['rows']}} rows, "
+                         f"{{counts['non_null']}} non-null, {{counts['distinct']}} distinct); rerun without feature reuse")
+
+def join_cached_features(frame, store):
+    \"\"\"Join feature columns already materialised in the feature store for this input version\"\"\"
+    batches = {{}}
+    for entry in store['cached']:
+        batches.setdefault(entry['batch_path'], []).append(entry)
+    for batch_path, entries in batches.items():
+        frame = frame.drop(*[entry['feature_name'] for entry in entries if entry['feature_name'] in frame.columns])
+        batch_df = spark.read.parquet(batch_path).select(
+            F.col(store['entity_key']), *[F.col(entry['column']).alias(entry['feature_name']) for entry in entries]
+        )
+        frame = frame.join(batch_df, on=store['entity_key'], how='left')
+        print(f"Reused {{len(entries)}} cached features from {{batch_path}}")
+    return frame
+
+def register_feature_store_columns(frame, store, output_path, record_count):
+    \"\"\"Materialise newly computed feature columns once and register them and this feature set in the store\"\"\"
+    store_bucket, store_prefix = store['path'].replace('s3://', '').split('/', 1)
+    s3_client = boto3.client('s3')
+    new_columns = {{name: entry for name, entry in store['new_columns'].items() if name in frame.columns}}
+    if new_columns:
+        batch_path = f"{{store['path']}}batches/{{args['JOB_NAME']}}-{{datetime.utcnow().strftime('%Y%m%d%H%M%S')}}/"
+        frame.select(
+            F.col(store['entity_key']), *[F.col(name).alias(entry['column']) for name, entry in new_columns.items()]
+        ).write.mode('overwrite').option("compression", "snappy").parquet(batch_path)
+        for name, entry in new_columns.items():
+            s3_client.put_object(Bucket=store_bucket, Key=f"{{store_prefix}}columns/{{entry['hash']}}.json", Body=json.dumps({{
+                "feature_name": name, "batch_path": batch_path, "column": entry['column'], "job_name": args['JOB_NAME']
+            }}).encode('utf-8'))
+        print(f"Registered {{len(new_columns)}} feature columns in the feature store: {{batch_path}}")
+    s3_client.put_object(Bucket=store_bucket, Key=f"{{store_prefix}}assemblies/{{store['set_hash']}}.json", Body=json.dumps({{
+        "output_path": output_path, "record_count": record_count, "job_name": args['JOB_NAME']
+    }}).encode('utf-8'))
+
 def engineer_features(df):
     \"\"\"Engineer all confirmed features for propensity models\"\"\"
     
@@ -1096,8 +1884,16 @@ def engineer_features(df):
     
     print(f"Date columns processed: {{date_cols}}")
     
-    # Feature engineering code (LLM + User features)
-    {feature_code}
+    if feature_store is not None:
+        verify_entity_key(feature_df, feature_store)
+        feature_df = join_cached_features(feature_df, feature_store)
+    
+    # Feature engineering plan (LLM + User features): one select per stage instead of one withColumn per feature
+{feature_code}
+    for stage_index, definitions in enumerate(feature_plan):
+        # Intermediate columns are dropped in the last projection
+        drop_columns = intermediate_columns if stage_index == len(feature_plan) - 1 else []
+        feature_df = project_features(feature_df, definitions, drop_columns)
     
     # Add raw columns (pass-through)
     raw_columns = {raw_column_names}
@@ -1124,25 +1920,55 @@ except Exception as e:
     print(f"Error during feature engineering: {{e}}")
     raise e
 
+def list_output_files(path):
+    \"\"\"Every object under an S3 output path\"\"\"
+    bucket, prefix = path.replace('s3://', '').split('/', 1)
+    files = set()
+    for page in boto3.client('s3').get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        files.update(f"s3://{{bucket}}/{{obj['Key']}}" for obj in page.get('Contents', []))
+    return files
+
 # Write results to S3
 try:
-    output_path = args['output_path']
+    output_path = args['output_path'].rstrip('/')
+    features_path = output_path + "/features/"
+    write_mode = args['write_mode']
+    partition_date = args['partition_date']
     
-    # Write as Parquet for better performance
-    engineered_df.write.mode('overwrite').option("compression", "snappy").parquet(output_path + "/features/")
+    if partition_date != 'none':
+        # Incremental layout: each run appends (or rebuilds) a feature_date partition
+        existing_files = list_output_files(features_path)
+        engineered_df.withColumn("feature_date", F.lit(partition_date)).write.mode(write_mode) \\
+            .partitionBy("feature_date").option("compression", "snappy").parquet(features_path)
+        new_files = sorted(path for path in list_output_files(features_path) - existing_files if path.endswith('.parquet'))
+        # Later steps read just this run's Parquet files instead of recomputing the features
+        written_df = spark.read.option("basePath", features_path).parquet(*new_files) if new_files else None
+    else:
+        # Write as Parquet for better performance; this is the only pass over the engineered pipeline
+        engineered_df.write.mode('overwrite').option("compression", "snappy").parquet(features_path)
+        # Later steps read the written Parquet instead of recomputing the features
+        written_df = spark.read.parquet(features_path)
     
-    # Also write as CSV for easy inspection
-    engineered_df.write.mode('overwrite').option("header", "true").csv(output_path + "/features_csv/")
+    record_count = written_df.count() if written_df is not None else 0
     
-    print(f"Successfully wrote engineered features to {{output_path}}")
+    # Optional CSV copy for easy inspection, derived from the Parquet output
+    if args['write_csv'] == 'true' and written_df is not None:
+        csv_writer = written_df.write.mode(write_mode).option("header", "true")
+        if partition_date != 'none':
+            csv_writer = csv_writer.partitionBy("feature_date")
+        csv_writer.csv(output_path + "/features_csv/")
+    
+    print(f"Successfully wrote {{record_count}} engineered feature records to {{output_path}} ({{write_mode}})")
     
     # Write feature metadata
     feature_metadata = {{
         "job_name": args['JOB_NAME'],
         "input_path": args['input_path'],
         "output_path": output_path,
-        "feature_count": len(engineered_df.columns),
-        "record_count": engineered_df.count(),
+        "feature_count": len(written_df.columns) if written_df is not None else len(engineered_df.columns),
+        "record_count": record_count,
+        "write_mode": write_mode,
+        "partition_date": partition_date,
         "processing_timestamp": str(F.current_timestamp()),
         "features": {{
             "llm_generated": {len(llm_features)},
@@ -1153,7 +1979,27 @@ try:
     
     # Convert metadata to DataFrame and write
     metadata_df = spark.createDataFrame([feature_metadata])
-    metadata_df.write.mode('overwrite').json(output_path + "/metadata/")
+    metadata_df.write.mode(write_mode).json(output_path + "/metadata/")
+    
+    if feature_store is not None and written_df is not None:
+        register_feature_store_columns(written_df, feature_store, output_path, record_count)
+    
+    if partition_date != 'none' and manifest_path != 'none':
+        # Record the processed inputs (key -> ETag) so the next incremental run only picks up new objects
+        ledger_bucket, ledger_key = (output_path.rstrip('/') + "/_processed_inputs.json").replace('s3://', '').split('/', 1)
+        s3_client = boto3.client('s3')
+        processed = {{}}
+        if write_mode == 'append':
+            try:
+                processed = json.loads(s3_client.get_object(Bucket=ledger_bucket, Key=ledger_key)['Body'].read())['objects']
+            except s3_client.exceptions.NoSuchKey:
+                pass
+        processed.update({{obj['key']: obj['etag'] for obj in manifest['objects']}})
+        s3_client.put_object(Bucket=ledger_bucket, Key=ledger_key, Body=json.dumps({{
+            "input_path": args['input_path'],
+            "updated_at": partition_date,
+            "objects": processed
+        }}).encode('utf-8'))
     
     print("Feature engineering job completed successfully")
     
@@ -1166,63 +2012,6 @@ job.commit()
     
     return script_template
 
-def convert_formula_to_spark(formula: str) -> str:
-    """Convert mathematical formula to PySpark SQL expression using Claude 3.7 Sonnet"""
-    if not formula or formula.strip() == "":
-        return "F.lit(None)"
-    
-    # Simple column reference
-    if formula.replace('_', '').replace(' ', '').isalnum():
-        return f"F.col('{formula.strip()}')"
-    
-    try:
-        # Use Claude 3.7 Sonnet to convert formula
-        bedrock = boto3.client('bedrock-runtime', region_name=AWS_REGION)
-        
-        prompt = f"""Convert this mathematical formula to a PySpark SQL expression using pyspark.sql.functions (imported as F):
-
-Formula: {formula}
-
-Rules:
-- Use F.col('column_name') for column references
-- Use F.when().otherwise() for conditional logic
-- Use standard operators: +, -, *, /, %, ==, !=, <, >, <=, >=
-- Use F.lit() for literal values
-- Use parentheses for proper precedence
-- Return only the PySpark expression, no explanation
-
-Example conversions:
-- "age + 5" → "F.col('age') + 5"
-- "if status == 'active' then 1 else 0" → "F.when(F.col('status') == 'active', 1).otherwise(0)"
-- "calls / tenure" → "F.col('calls') / F.col('tenure')"
-
-PySpark expression:"""
-
-        response = bedrock.invoke_model(
-            modelId='us.anthropic.claude-3-7-sonnet-20250219-v1:0',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 200,
-                "temperature": 0,
-                "messages": [{"role": "user", "content": prompt}]
-            })
-        )
-        
-        result = json.loads(response['body'].read())
-        spark_expression = result['content'][0]['text'].strip()
-        
-        # Clean up the response
-        if spark_expression.startswith('```'):
-            spark_expression = spark_expression.split('\n')[1:-1]
-            spark_expression = '\n'.join(spark_expression)
-        
-        return spark_expression.strip()
-        
-    except Exception as e:
-        print(f"Error converting formula with Claude: {e}")
-        # Fallback to simple column reference
-        return f"F.col('{formula.strip()}')"
-
 # Initialize the main agent with enhanced tools
 feature_agent = Agent(
     name="EnhancedTelecomFeatureEngineer",
@@ -1233,8 +2022,13 @@ feature_agent = Agent(
         confirm_final_feature_list,
         create_glue_job_with_confirmed_features,
         run_glue_job,
+        run_feature_engineering,
         test_autogluon_availability,
-        train_propensity_models
+        train_propensity_models,
+        submit_training_jobs,
+        get_training_status,
+        cancel_training_job,
+        score_customer_base
     ]
 )
 
@@ -1256,16 +2050,23 @@ You focus on three key propensity models:
 - Spend change propensity (likelihood to change spending patterns post-migration)
 
 WORKFLOW TOOLS:
-- explore_s3_data: Analyze raw customer data from S3
+- explore_s3_data: Analyze raw customer data from S3 (profile_mode="streaming" profiles every file in the prefix instead of a sample, profile_mode="metadata" reads only Parquet footers)
 - generate_llm_features: Create AI-generated features for propensity models
 - add_user_suggested_feature: Add custom user-defined features
 - confirm_final_feature_list: Finalize feature selection for engineering
 - create_glue_job_with_confirmed_features: Create AWS Glue ETL job
 - run_glue_job: Execute a previously created Glue job
+- run_feature_engineering: Engineer the confirmed features, automatically running small inputs locally and large ones on Glue
 - train_propensity_models: Train a single propensity model using AutoGluon Cloud (requires model_type: "churn", "call", or "spend_change")
   * "churn" = Churn Propensity Model (predicts churn_after_migration)
   * "call" = Call Propensity Model (predicts number_of_calls_post_migration) 
   * "spend_change" = Spend Change Propensity Model (predicts change_in_spend)
+  * backend="local" trains a fast local gradient-boosting model for feature iteration; the default "autogluon_cloud" is for final models
+  * distill=True also exports a compact single model fitted to the trained model's predictions, for fast batch scoring
+- submit_training_jobs: Start training several propensity models concurrently (default: all three) and return their job ids immediately
+- get_training_status: Show the state, latest progress and results of training jobs
+- cancel_training_job: Cancel a queued or running training job
+- score_customer_base: Score every customer with the distilled/local propensity models and write partitioned Parquet scores
 
 IMPORTANT: Only use the specific tool that the user requests. Do not automatically chain tools together.
 - If user asks to "explore S3 data", only call explore_s3_data and show the data analysis
@@ -1274,7 +2075,11 @@ IMPORTANT: Only use the specific tool that the user requests. Do not automatical
 - If user asks to "confirm features", only call confirm_final_feature_list
 - If user asks to "create Glue job", only call create_glue_job_with_confirmed_features
 - If user asks to "run Glue job", only call run_glue_job
+- If user asks to "run feature engineering" or "engineer features", only call run_feature_engineering
 - If user asks to "train models", ask which model type they want to train ("churn", "call", or "spend_change"), then call train_propensity_models with the specified model_type
+- If user asks to train several or all models, call submit_training_jobs with those model_types
+- If user asks about training progress, only call get_training_status
+- If user asks to score all customers or run batch scoring, only call score_customer_base
 
 Wait for explicit user requests before proceeding to the next step.
 Be interactive and respond to what the user specifically asks for.
@@ -1288,21 +2093,6 @@ async def agent_invocation(payload):
     # Extract session context
     session_id = payload.get("session_id", "default-session")
     
-    # Check if training is in progress and user is requesting training
-    global _training_lock, _active_training_jobs
-    training_keywords = ["train", "training", "model", "propensity"]
-    user_requesting_training = any(keyword in user_message.lower() for keyword in training_keywords)
-    
-    if user_requesting_training and (_training_lock or _active_training_jobs):
-        active_jobs = list(_active_training_jobs.keys()) if _active_training_jobs else []
-        return {
-            "response": f"🚧 **Training In Progress**\n\nA model training job is currently running. Please wait for it to complete before starting a new training session.\n\n**Active Jobs:** {', '.join(active_jobs) if active_jobs else 'General training lock active'}\n\n**Current Status:** The existing training process is running and should not be interrupted. You can check the logs or wait for completion notification.\n\n**Available Actions:**\n- Check training progress in CloudWatch logs\n- Explore other features while waiting\n- Try again in a few minutes\n\nThe training typically takes 2-5 minutes depending on data size and model complexity.",
-            "conversation_stage": conversation_state.conversation_stage,
-            "session_id": session_id,
-            "training_blocked": True,
-            "active_training_jobs": active_jobs
-        }
-    
     # Add comprehensive conversation stage context
     stage_context = f"\n\nConversation Stage: {conversation_state.conversation_stage}"
     
@@ -1314,8 +2104,13 @@ async def agent_invocation(payload):
         stage_context += f"\nUser Features: {len(conversation_state.user_suggested_features)} suggested"
     elif conversation_state.conversation_stage == "confirmation" and conversation_state.final_feature_list:
         stage_context += f"\nConfirmed Features: {len(conversation_state.final_feature_list)} total features"
-    elif conversation_state.conversation_stage == "engineering" and conversation_state.glue_jobs_created:
-        stage_context += f"\nGlue Jobs: {len(conversation_state.glue_jobs_created)} created"
+    elif conversation_state.conversation_stage == "engineering" and (conversation_state.glue_jobs_created or conversation_state.local_feature_runs):
+        stage_context += f"\nGlue Jobs: {len(conversation_state.glue_jobs_created)} created, Local Runs: {len(conversation_state.local_feature_runs)}"
+    
+    # Training jobs run in the background across invocations
+    active_jobs = get_training_scheduler().active_jobs()
+    if active_jobs:
+        stage_context += f"\nTraining Jobs: {', '.join(f'{job.job_id} ({job.status})' for job in active_jobs)} - use get_training_status for progress"
     
     # Add available actions based on current stage
     if conversation_state.conversation_stage == "initial":
@@ -1327,7 +2122,7 @@ async def agent_invocation(payload):
     elif conversation_state.conversation_stage == "user_features":
         stage_context += "\nNext: Use confirm_final_feature_list to finalize your feature selection"
     elif conversation_state.conversation_stage == "confirmation":
-        stage_context += "\nNext: Use create_glue_job_with_confirmed_features to build the data pipeline"
+        stage_context += "\nNext: Use run_feature_engineering (local or Glue, picked automatically) or create_glue_job_with_confirmed_features to build the data pipeline"
     elif conversation_state.conversation_stage == "engineering":
         stage_context += "\nNext: Use run_glue_job to execute feature engineering, then train_propensity_models for ML training (specify model_type: churn, call, or spend_change)"
     
@@ -1351,7 +2146,8 @@ async def agent_invocation(payload):
                 "user_features_count": len(conversation_state.user_suggested_features),
                 "final_features_count": len(conversation_state.final_feature_list),
                 "glue_jobs_count": len(conversation_state.glue_jobs_created)
-            }
+            },
+            "active_training_jobs": [job.job_id for job in active_jobs]
         }
         
     except Exception as e:
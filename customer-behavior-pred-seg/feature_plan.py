@@ -0,0 +1,253 @@
+"""
+Projection planning for the features of a generated Glue script.
+
+Instead of one withColumn per feature, the confirmed LLM/user features are
+planned as a dependency DAG and emitted as a few select projections:
+- references to earlier features are inlined, so dependent features do not
+  need their own projection (features are applied in list order, so a name
+  refers to the most recent earlier feature of that name, else the input column)
+- subexpressions shared by several features are computed once as intermediate
+  columns (`_cse_<n>`) in a preceding projection and dropped at the end
+- formulas outside the local grammar use their translated expression as-is;
+  only those referencing other features by column force an extra projection
+"""
+import re
+from collections import Counter
+from typing import Dict, List, Any
+
+from formula_compiler import FormulaParseError, parse_formula, render_spark
+
+
+INTERMEDIATE_PREFIX = '_cse_'
+
+_COLUMN_REFERENCE = re.compile(r"""F\.col\(\s*['"]([^'"]+)['"]\s*\)""")
+
+# Nodes that are not worth precomputing
+_LEAF_KINDS = ('literal', 'column', 'spark')
+
+
+def _children(node) -> List:
+    kind = node[0]
+    if kind in _LEAF_KINDS:
+        return []
+    if kind == 'binary':
+        return [node[2], node[3]]
+    if kind in ('negate', 'not'):
+        return [node[1]]
+    if kind == 'isin':
+        return [node[1]] + list(node[2])
+    if kind in ('call', 'function'):
+        return list(node[2])
+    if kind == 'when':
+        return [part for branch in node[1] for part in branch] + [node[2]]
+    raise FormulaParseError(f"Unknown AST node: {kind}")
+
+
+def _replace_columns(node, replace):
+    """Rebuild an AST with every column node passed through replace(node)"""
+    kind = node[0]
+    if kind == 'column':
+        return replace(node)
+    if kind in ('literal', 'spark'):
+        return node
+    if kind == 'binary':
+        return (kind, node[1], _replace_columns(node[2], replace), _replace_columns(node[3], replace))
+    if kind in ('negate', 'not'):
+        return (kind, _replace_columns(node[1], replace))
+    if kind == 'isin':
+        return (kind, _replace_columns(node[1], replace), [_replace_columns(v, replace) for v in node[2]])
+    if kind == 'call':
+        return (kind, node[1], [_replace_columns(arg, replace) for arg in node[2]])
+    if kind == 'when':
+        return (kind, [(_replace_columns(c, replace), _replace_columns(v, replace)) for c, v in node[1]],
+                _replace_columns(node[2], replace))
+    if kind == 'function':
+        return (kind, node[1], [_replace_columns(arg, replace) for arg in node[2]]) + tuple(node[3:])
+    raise FormulaParseError(f"Unknown AST node: {kind}")
+
+
+def _node_columns(node) -> List[str]:
+    """Column names an AST reads, including those inside embedded translated expressions"""
+    columns = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current[0] == 'column':
+            columns.append(current[1])
+        elif current[0] == 'spark':
+            columns.extend(_COLUMN_REFERENCE.findall(current[1]))
+        else:
+            stack.extend(_children(current))
+    return list(dict.fromkeys(columns))
+
+
+def _select_shared(asts: List) -> Dict[str, Any]:
+    """Maximal non-trivial subtrees occurring more than once across the feature ASTs"""
+    counts = Counter()
+
+    def _count(node):
+        if node[0] in _LEAF_KINDS:
+            return
+        counts[repr(node)] += 1
+        for child in _children(node):
+            _count(child)
+
+    for ast in asts:
+        _count(ast)
+
+    shared = {}
+
+    def _visit(node):
+        if node[0] in _LEAF_KINDS:
+            return
+        if counts[repr(node)] > 1:
+            shared.setdefault(repr(node), node)
+            return
+        for child in _children(node):
+            _visit(child)
+
+    for ast in asts:
+        _visit(ast)
+    return shared
+
+
+def plan_feature_projections(features: List[Dict], translations: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Plan the LLM/user features as a list of select projections.
+
+    Args:
+        features: LLM and user features in application order
+        translations: formula -> PySpark expression, used for formulas the local compiler cannot parse
+
+    Returns a dict with `stages` (lists of definitions with name, kind, description,
+    required_columns and expression), `intermediate_columns` and `shared_subexpressions`.
+    """
+    entries = []
+    latest = {}  # feature name -> index of the most recent feature with that name
+
+    for feature in features:
+        formula = feature.get('formula', feature['feature_name'])
+        try:
+            ast = parse_formula(formula)
+        except FormulaParseError:
+            ast = ('spark', translations[formula])
+
+        entry = {"feature": feature, "required": [], "depends_on": set()}
+
+        def _require(name, entry=entry):
+            """Resolve a column name to the input column or an earlier feature; True if that feature is inlinable"""
+            index = latest.get(name)
+            if index is None:
+                if name not in entry["required"]:
+                    entry["required"].append(name)
+                return False
+            dependency = entries[index]
+            if not dependency["inlinable"]:
+                entry["depends_on"].add(index)
+                if name not in entry["required"]:
+                    entry["required"].append(name)
+                return False
+            for col in dependency["required"]:
+                if col not in entry["required"]:
+                    entry["required"].append(col)
+            return True
+
+        for col in feature.get('source_columns', []):
+            _require(col)
+
+        if ast[0] == 'spark':
+            # Translated expressions can only refer to earlier features by column
+            for col in _COLUMN_REFERENCE.findall(ast[1]):
+                if col in latest:
+                    entry["depends_on"].add(latest[col])
+                    if col not in entry["required"]:
+                        entry["required"].append(col)
+        else:
+            ast = _replace_columns(ast, lambda node: entries[latest[node[1]]]["ast"] if _require(node[1]) else node)
+        entry["ast"] = ast
+        entry["inlinable"] = not entry["depends_on"]
+
+        latest[feature['feature_name']] = len(entries)
+        entries.append(entry)
+
+    shared = _select_shared([entry["ast"] for entry in entries])
+    intermediates = {
+        key: {"name": f"{INTERMEDIATE_PREFIX}{i}", "node": node, "columns": _node_columns(node), "stage": None}
+        for i, (key, node) in enumerate(shared.items())
+    }
+    intermediates_by_name = {intermediate["name"]: intermediate for intermediate in intermediates.values()}
+
+    # A feature (or intermediate) goes one projection after everything it reads as a column
+    for entry in entries:
+        used = []
+
+        def _substitute(node, used=used):
+            if node[0] == 'spark':
+                return f"({node[1]})"
+            intermediate = intermediates.get(repr(node))
+            if intermediate is None:
+                return None
+            if intermediate["name"] not in used:
+                used.append(intermediate["name"])
+            return f"F.col({intermediate['name']!r})"
+
+        entry["expression"] = render_spark(entry["ast"], _substitute)
+        entry["used"] = used
+        dependency_stages = {entries[index]["feature"]['feature_name']: entries[index]["stage"] for index in entry["depends_on"]}
+        stage = max((dependency_stage + 1 for dependency_stage in dependency_stages.values()), default=0)
+        for name in used:
+            intermediate = intermediates_by_name[name]
+            if intermediate["stage"] is None:
+                intermediate["stage"] = max(
+                    (dependency_stages[col] + 1 for col in intermediate["columns"] if col in dependency_stages), default=0
+                )
+            stage = max(stage, intermediate["stage"] + 1)
+        entry["stage"] = stage
+
+    # Features nothing else reads as a column all go in the last projection, keeping their column order
+    referenced = set().union(*(entry["depends_on"] for entry in entries))
+    final_stage = max([entry["stage"] for entry in entries] + [0])
+
+    stages = [[] for _ in range(final_stage + 1)]
+    for intermediate in intermediates.values():
+        stages[intermediate["stage"]].append({
+            "name": intermediate["name"],
+            "kind": "intermediate",
+            "description": "Shared subexpression",
+            "required_columns": intermediate["columns"],
+            "expression": render_spark(intermediate["node"], lambda node: f"({node[1]})" if node[0] == 'spark' else None)
+        })
+    for index, entry in enumerate(entries):
+        feature = entry["feature"]
+        stages[entry["stage"] if index in referenced else final_stage].append({
+            "name": feature['feature_name'],
+            "kind": "LLM" if feature.get('source') == 'llm' else "user",
+            "description": feature.get('description', ''),
+            "required_columns": entry["required"] + entry["used"],
+            "expression": entry["expression"]
+        })
+
+    return {
+        "stages": [stage for stage in stages if stage],
+        "intermediate_columns": [intermediate["name"] for intermediate in intermediates.values()],
+        "shared_subexpressions": len(intermediates)
+    }
+
+
+def render_feature_plan(plan: Dict[str, Any], indent: str = "    ") -> str:
+    """Render a projection plan as the `feature_plan` literal of the Glue script"""
+    lines = [f"{indent}feature_plan = ["]
+    for stage in plan["stages"]:
+        lines.append(f"{indent}    [")
+        for definition in stage:
+            description = ' '.join(str(definition['description']).split())
+            label = "Shared subexpression" if definition['kind'] == 'intermediate' else f"{definition['kind']} Feature: {definition['name']} - {description}"
+            lines.append(f"{indent}        # {label}")
+            lines.append(
+                f"{indent}        ({definition['name']!r}, {definition['kind']!r}, {definition['required_columns']!r}, "
+                f"lambda: {definition['expression']}),"
+            )
+        lines.append(f"{indent}    ],")
+    lines.append(f"{indent}]")
+    lines.append(f"{indent}intermediate_columns = {plan['intermediate_columns']!r}")
+    return "\n".join(lines)
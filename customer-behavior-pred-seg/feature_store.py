@@ -0,0 +1,165 @@
+"""
+Versioned feature store that lets Glue jobs reuse already materialised feature columns.
+
+Every LLM/user feature is content-hashed from its normalised formula, its source
+columns and the version of the input data (derived from the listing manifest's
+keys and ETags). Glue jobs write newly computed feature columns once, keyed by an
+entity key column, and register them in the store; later jobs over the same input
+join those columns back instead of recomputing them. A whole feature set that was
+already assembled is reused without starting a job at all.
+
+Layout under the store URI:
+- {input_version}/batches/{job}-{timestamp}/   Parquet: entity key + feature columns (named f_<hash>)
+- {input_version}/columns/{feature_hash}.json   where a feature column is materialised
+- {input_version}/assemblies/{set_hash}.json    output path of an assembled feature set
+
+Configuration (environment variables):
+- FEATURE_STORE_URI: store location (default: s3://{GLUE_SCRIPT_BUCKET}/feature-store/)
+"""
+import os
+import re
+import json
+import hashlib
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+from data_profiling import parse_s3_uri
+from formula_translation import normalize_formula
+from s3_manifest import manifest_version
+
+
+FEATURE_STORE_VERSION = 1
+
+DEFAULT_ENTITY_KEY = 'customer_id'
+
+
+def _digest(identity: Any) -> str:
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def input_version(manifest: Dict[str, Any]) -> str:
+    """Version of an input dataset: changes whenever any object is added, removed or rewritten"""
+    return manifest_version(manifest)
+
+
+def feature_hash(feature: Dict[str, Any], version: str, dependencies: Dict[str, str] = None) -> str:
+    """
+    Content hash of a feature definition over one input version (independent of the feature name).
+
+    dependencies maps the names of earlier features the formula refers to onto their hashes,
+    so a feature built on another feature changes whenever that feature's definition does.
+    """
+    return _digest({
+        "store_version": FEATURE_STORE_VERSION,
+        "formula": normalize_formula(feature.get('formula', feature['feature_name'])),
+        "source_columns": sorted(feature.get('source_columns', [])),
+        "dependencies": dependencies or {},
+        "input_version": version
+    })
+
+
+def check_entity_key(entity_key: str, analysis: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Reason the entity key cannot be used to join feature columns, or None if it is unique and non-null.
+
+    Exploration only screens the key; the Glue job verifies it exactly before joining or registering columns.
+    """
+    if not analysis or entity_key not in analysis.get('columns', []):
+        return f"entity key column '{entity_key}' not found in the explored data"
+    unique_values = analysis.get('sample_statistics', {}).get(entity_key, {}).get('unique_values')
+    if unique_values is None:
+        # Footer metadata profiles carry no distinct counts
+        return f"uniqueness of entity key column '{entity_key}' is unknown from the explored data"
+    missing = analysis.get('missing_values', {}).get(entity_key, 0)
+    if missing or unique_values < analysis['total_sample_records']:
+        return f"entity key column '{entity_key}' is not unique and non-null in the explored data"
+    return None
+
+
+class FeatureStore:
+    """Lookup side of the feature store; Glue jobs write batches and register them"""
+
+    def __init__(self, uri: str, s3_client=None):
+        self.uri = uri if uri.endswith('/') else uri + '/'
+        self.bucket, self.prefix = parse_s3_uri(self.uri)
+        self.s3_client = s3_client or boto3.client('s3')
+
+    def version_path(self, version: str) -> str:
+        return f"{self.uri}{version}/"
+
+    def _get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def _exists(self, s3_path: str) -> bool:
+        bucket, prefix = parse_s3_uri(s3_path)
+        return self.s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1).get('KeyCount', 0) > 0
+
+    def lookup_columns(self, version: str, hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Registered column entries for the given feature hashes (missing hashes are omitted)"""
+        registered = set()
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}{version}/columns/"):
+            registered.update(obj['Key'].rsplit('/', 1)[-1][:-len('.json')] for obj in page.get('Contents', []))
+
+        wanted = [h for h in dict.fromkeys(hashes) if h in registered]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            entries = executor.map(lambda h: self._get_json(f"{self.prefix}{version}/columns/{h}.json"), wanted)
+            return {h: entry for h, entry in zip(wanted, entries) if entry is not None}
+
+    def lookup_assembly(self, version: str, set_hash: str) -> Optional[Dict[str, Any]]:
+        """Assembled output of an identical feature set, if it still exists"""
+        assembly = self._get_json(f"{self.prefix}{version}/assemblies/{set_hash}.json")
+        if assembly and self._exists(assembly['output_path'].rstrip('/') + '/features/'):
+            return assembly
+        return None
+
+
+def plan_feature_reuse(store: FeatureStore, final_features: List[Dict], manifest: Dict[str, Any],
+                       entity_key: str = DEFAULT_ENTITY_KEY) -> Dict[str, Any]:
+    """
+    Split the confirmed LLM/user features into columns already in the store and columns to compute.
+
+    Returns the store plan embedded into the Glue script: path, entity_key, input_version,
+    set_hash, `cached` column entries, `new_columns` (feature name -> hash and stored column)
+    and `assembly` (an existing output of the identical feature set, or None).
+    """
+    version = input_version(manifest)
+    engineered = [f for f in final_features if f.get('source') in ('llm', 'user')]
+    hashes = {}
+    for feature in engineered:
+        references = set(re.findall(r'\w+', feature.get('formula', ''))) | set(feature.get('source_columns', []))
+        dependencies = {name: h for name, h in hashes.items() if name in references}
+        hashes[feature['feature_name']] = feature_hash(feature, version, dependencies)
+
+    set_hash = _digest({
+        "features": sorted(hashes.items()),
+        "raw_columns": sorted(f['feature_name'] for f in final_features if f.get('source') == 'raw_data'),
+        "entity_key": entity_key
+    })
+
+    registered = store.lookup_columns(version, list(hashes.values()))
+    cached, new_columns = [], {}
+    for name, h in hashes.items():
+        if h in registered:
+            cached.append({"feature_name": name, "batch_path": registered[h]['batch_path'], "column": registered[h]['column']})
+        else:
+            new_columns[name] = {"hash": h, "column": f"f_{h[:16]}"}
+
+    return {
+        "path": store.version_path(version),
+        "entity_key": entity_key,
+        "input_version": version,
+        "set_hash": set_hash,
+        "cached": cached,
+        "new_columns": new_columns,
+        "assembly": store.lookup_assembly(version, set_hash)
+    }
+
+
+def get_feature_store(default_bucket: str) -> FeatureStore:
+    """Return the FeatureStore configured by FEATURE_STORE_URI (or under the Glue script bucket)"""
+    return FeatureStore(os.environ.get('FEATURE_STORE_URI', f"s3://{default_bucket}/feature-store/"))
@@ -0,0 +1,381 @@
+"""
+Deterministic local compiler from feature formulas to PySpark expressions.
+
+Parses the formula grammar the agent asks the LLM to produce into an AST and
+renders it as a `pyspark.sql.functions` (imported as F) expression string:
+- Arithmetic: + - * / % and ^ or ** for powers, unary minus
+- Comparisons: == = != <> < > <= >=, `x in (a, b)`
+- Boolean logic: and/or/not (also &&, ||, !)
+- Conditionals: `if c then a [elif c2 then b] else d`, `a if c else d`,
+  `CASE WHEN c THEN a ... ELSE d END`, and `if(c, a, d)` / `iif(c, a, d)`
+- Column references (bare or `backtick quoted`), numeric/string/boolean/null literals
+- Common functions (abs, sqrt, log, exp, round, floor, ceil, min/max, coalesce, ...)
+
+Formulas outside the grammar raise FormulaParseError so callers can fall back
+to the LLM translation.
+"""
+import re
+from typing import Callable, List, Tuple, Any, Optional
+
+
+class FormulaParseError(ValueError):
+    """Raised when a formula is outside the grammar supported by the local compiler"""
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\d+(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<quoted>`[^`]+`)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>\*\*|==|!=|<>|<=|>=|&&|\|\||[-+*/%^<>=!(),?:])
+""", re.VERBOSE)
+
+# Functions whose literal arguments (kept as plain Python values) come before the column arguments
+LEADING_LITERAL_FUNCTIONS = {'F.log'}
+
+_KEYWORDS = {'if', 'then', 'elif', 'else', 'and', 'or', 'not', 'in', 'case', 'when', 'end',
+             'true', 'false', 'null', 'none', 'is'}
+
+# name -> (PySpark function, min args, max args)
+_FUNCTIONS = {
+    'abs': ('F.abs', 1, 1),
+    'sqrt': ('F.sqrt', 1, 1),
+    'log': ('F.log', 1, 2),
+    'ln': ('F.log', 1, 1),
+    'log10': ('F.log10', 1, 1),
+    'log2': ('F.log2', 1, 1),
+    'log1p': ('F.log1p', 1, 1),
+    'exp': ('F.exp', 1, 1),
+    'floor': ('F.floor', 1, 1),
+    'ceil': ('F.ceil', 1, 1),
+    'ceiling': ('F.ceil', 1, 1),
+    'round': ('F.round', 1, 2),
+    'pow': ('F.pow', 2, 2),
+    'power': ('F.pow', 2, 2),
+    'min': ('F.least', 2, None),
+    'least': ('F.least', 2, None),
+    'max': ('F.greatest', 2, None),
+    'greatest': ('F.greatest', 2, None),
+    'coalesce': ('F.coalesce', 1, None),
+    'isnull': ('F.isnull', 1, 1),
+    'is_null': ('F.isnull', 1, 1),
+    'lower': ('F.lower', 1, 1),
+    'upper': ('F.upper', 1, 1),
+    'length': ('F.length', 1, 1),
+    'len': ('F.length', 1, 1),
+}
+
+_COMPARISON_OPS = {'==': '==', '=': '==', '!=': '!=', '<>': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+
+
+def tokenize(formula: str) -> List[Tuple[str, str]]:
+    """Split a formula into (kind, text) tokens"""
+    tokens = []
+    position = 0
+    while position < len(formula):
+        match = _TOKEN_PATTERN.match(formula, position)
+        if not match:
+            raise FormulaParseError(f"Unexpected character {formula[position]!r} at position {position}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        position = match.end()
+        if kind == 'ws':
+            continue
+        if kind == 'name' and text.lower() in _KEYWORDS:
+            tokens.append(('keyword', text.lower()))
+        elif kind == 'op' and text in ('&&', '||', '!'):
+            tokens.append(('keyword', {'&&': 'and', '||': 'or', '!': 'not'}[text]))
+        else:
+            tokens.append((kind, text))
+    tokens.append(('eof', ''))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing tuple-based AST nodes"""
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[str, str]:
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def advance(self) -> Tuple[str, str]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def accept(self, kind: str, text: Optional[str] = None) -> bool:
+        token_kind, token_text = self.peek()
+        if token_kind == kind and (text is None or token_text == text):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind: str, text: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise FormulaParseError(f"Expected {text or kind} but found {token[1] or 'end of formula'!r}")
+        return self.advance()
+
+    def parse(self):
+        node = self.conditional()
+        self.expect('eof')
+        return node
+
+    def conditional(self):
+        if self.peek() == ('keyword', 'if'):
+            start = self.position
+            try:
+                return self.if_then_else()
+            except FormulaParseError:
+                # Not `if ... then ... else`; retry as the function form if(c, a, b)
+                self.position = start
+
+        node = self.or_expr()
+        if self.accept('keyword', 'if'):
+            condition = self.or_expr()
+            self.expect('keyword', 'else')
+            return ('when', [(condition, node)], self.conditional())
+        if self.accept('op', '?'):
+            value = self.conditional()
+            self.expect('op', ':')
+            return ('when', [(node, value)], self.conditional())
+        return node
+
+    def if_then_else(self):
+        self.expect('keyword', 'if')
+        condition = self.conditional()
+        self.expect('keyword', 'then')
+        branches = [(condition, self.conditional())]
+        while self.accept('keyword', 'elif'):
+            condition = self.conditional()
+            self.expect('keyword', 'then')
+            branches.append((condition, self.conditional()))
+        otherwise = self.conditional() if self.accept('keyword', 'else') else ('literal', None)
+        return ('when', branches, otherwise)
+
+    def or_expr(self):
+        node = self.and_expr()
+        while self.accept('keyword', 'or'):
+            node = ('binary', '|', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.accept('keyword', 'and'):
+            node = ('binary', '&', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.not_expr())
+        return self.comparison()
+
+    def comparison(self):
+        node = self.additive()
+        kind, text = self.peek()
+        if kind == 'op' and text in _COMPARISON_OPS:
+            self.advance()
+            return ('binary', _COMPARISON_OPS[text], node, self.additive())
+        if kind == 'keyword' and text == 'is':
+            self.advance()
+            negate = self.accept('keyword', 'not')
+            self.expect('keyword', 'null')
+            return ('call', 'isNotNull' if negate else 'isNull', [node])
+        negate = kind == 'keyword' and text == 'not' and self.peek(1) == ('keyword', 'in')
+        if negate:
+            self.advance()
+        if self.accept('keyword', 'in'):
+            self.expect('op', '(')
+            values = [self.additive()]
+            while self.accept('op', ','):
+                values.append(self.additive())
+            self.expect('op', ')')
+            node = ('isin', node, values)
+            return ('not', node) if negate else node
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while True:
+            kind, text = self.peek()
+            if kind == 'op' and text in ('+', '-'):
+                self.advance()
+                node = ('binary', text, node, self.multiplicative())
+            else:
+                return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while True:
+            kind, text = self.peek()
+            if kind == 'op' and text in ('*', '/', '%'):
+                self.advance()
+                node = ('binary', text, node, self.unary())
+            else:
+                return node
+
+    def unary(self):
+        if self.accept('op', '-'):
+            return ('negate', self.unary())
+        if self.accept('op', '+'):
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        node = self.primary()
+        kind, text = self.peek()
+        if kind == 'op' and text in ('^', '**'):
+            self.advance()
+            # Right associative, binds tighter than unary minus on the left
+            return ('function', 'F.pow', [node, self.unary()])
+        return node
+
+    def primary(self):
+        kind, text = self.advance()
+        if kind == 'number':
+            value = float(text) if any(c in text for c in '.eE') else int(text)
+            return ('literal', value)
+        if kind == 'string':
+            return ('literal', re.sub(r"\\(.)", r"\1", text[1:-1]))
+        if kind == 'quoted':
+            return ('column', text[1:-1])
+        if kind == 'keyword' and text in ('true', 'false'):
+            return ('literal', text == 'true')
+        if kind == 'keyword' and text in ('null', 'none'):
+            return ('literal', None)
+        if kind == 'keyword' and text == 'case':
+            return self.case_expression()
+        if kind == 'keyword' and text == 'if' and self.peek() == ('op', '('):
+            # Function form: if(condition, value, otherwise)
+            return self.function_call('if')
+        if kind == 'name':
+            if self.peek() == ('op', '('):
+                return self.function_call(text)
+            return ('column', text)
+        if kind == 'op' and text == '(':
+            node = self.conditional()
+            self.expect('op', ')')
+            return node
+        raise FormulaParseError(f"Unexpected token {text or 'end of formula'!r}")
+
+    def case_expression(self):
+        branches = []
+        while self.accept('keyword', 'when'):
+            condition = self.conditional()
+            self.expect('keyword', 'then')
+            branches.append((condition, self.conditional()))
+        if not branches:
+            raise FormulaParseError("CASE requires at least one WHEN branch")
+        otherwise = self.conditional() if self.accept('keyword', 'else') else ('literal', None)
+        self.expect('keyword', 'end')
+        return ('when', branches, otherwise)
+
+    def function_call(self, name: str):
+        self.expect('op', '(')
+        args = []
+        if not self.accept('op', ')'):
+            args.append(self.conditional())
+            while self.accept('op', ','):
+                args.append(self.conditional())
+            self.expect('op', ')')
+
+        lowered = name.lower()
+        if lowered in ('if', 'iif'):
+            if len(args) != 3:
+                raise FormulaParseError(f"{name}() takes exactly 3 arguments")
+            return ('when', [(args[0], args[1])], args[2])
+        if lowered not in _FUNCTIONS:
+            raise FormulaParseError(f"Unsupported function: {name}")
+        function, min_args, max_args = _FUNCTIONS[lowered]
+        if len(args) < min_args or (max_args is not None and len(args) > max_args):
+            raise FormulaParseError(f"Wrong number of arguments for {name}(): {len(args)}")
+        if lowered == 'log' and len(args) == 2:
+            # log(x, base) -> F.log(base, x); PySpark takes the base as a plain float, not a Column
+            base = args[1]
+            if base[0] != 'literal' or isinstance(base[1], bool) or not isinstance(base[1], (int, float)):
+                raise FormulaParseError("log() base must be a numeric literal")
+            return ('function', function, [args[0]], [float(base[1])])
+        if lowered == 'round' and len(args) == 2:
+            if args[1][0] != 'literal' or not isinstance(args[1][1], int):
+                raise FormulaParseError("round() scale must be an integer literal")
+            return ('function', function, [args[0]], [args[1][1]])
+        return ('function', function, args)
+
+
+def parse_formula(formula: str):
+    """Parse a formula into an AST, raising FormulaParseError outside the supported grammar"""
+    if not formula or not formula.strip():
+        raise FormulaParseError("Empty formula")
+    return _Parser(tokenize(formula)).parse()
+
+
+def render_spark(node, substitute: Optional[Callable] = None) -> str:
+    """
+    Render an AST node as a PySpark Column expression string.
+
+    `substitute(node)` may return a replacement rendering for any node (e.g. a
+    reference to a precomputed column), or None to render the node normally.
+    """
+    if substitute is not None:
+        replacement = substitute(node)
+        if replacement is not None:
+            return replacement
+    kind = node[0]
+    if kind == 'literal':
+        return f"F.lit({node[1]!r})"
+    if kind == 'column':
+        return f"F.col({node[1]!r})"
+    if kind == 'binary':
+        _, op, left, right = node
+        # Always parenthesise: Python's & and | bind tighter than comparisons
+        return f"({render_spark(left, substitute)} {op} {render_spark(right, substitute)})"
+    if kind == 'negate':
+        return f"(-{render_spark(node[1], substitute)})"
+    if kind == 'not':
+        return f"(~{render_spark(node[1], substitute)})"
+    if kind == 'isin':
+        return f"{render_spark(node[1], substitute)}.isin({', '.join(render_spark(v, substitute) for v in node[2])})"
+    if kind == 'call':
+        return f"{render_spark(node[2][0], substitute)}.{node[1]}()"
+    if kind == 'when':
+        _, branches, otherwise = node
+        rendered = "F"
+        for condition, value in branches:
+            rendered += f".when({render_spark(condition, substitute)}, {render_spark(value, substitute)})"
+        return f"{rendered}.otherwise({render_spark(otherwise, substitute)})"
+    if kind == 'function':
+        args = [render_spark(arg, substitute) for arg in node[2]]
+        if len(node) > 3:
+            extras = [repr(extra) for extra in node[3]]
+            args = extras + args if node[1] in LEADING_LITERAL_FUNCTIONS else args + extras
+        return f"{node[1]}({', '.join(args)})"
+    raise FormulaParseError(f"Unknown AST node: {kind}")
+
+
+def formula_columns(node) -> List[str]:
+    """Column names referenced by an AST, in first-reference order"""
+    columns = []
+
+    def _walk(current):
+        if isinstance(current, tuple) and current and isinstance(current[0], str):
+            if current[0] == 'column':
+                if current[1] not in columns:
+                    columns.append(current[1])
+                return
+            for part in current[1:]:
+                _walk(part)
+        elif isinstance(current, (list, tuple)):
+            for part in current:
+                _walk(part)
+
+    _walk(node)
+    return columns
+
+
+def compile_formula(formula: str) -> str:
+    """Compile a formula to a PySpark expression string, raising FormulaParseError if unsupported"""
+    return render_spark(parse_formula(formula))
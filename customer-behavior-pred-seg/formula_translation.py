@@ -0,0 +1,274 @@
+"""
+Formula-to-PySpark translation with a persistent cache and batched LLM fallback.
+
+Formulas are compiled locally first (formula_compiler). Formulas the compiler
+cannot parse are looked up in a disk-backed (or S3-backed) cache keyed by the
+normalised formula text plus the input column schema, and the remaining
+misses from a whole feature list are translated by Claude in a few concurrent
+batched requests with structured per-formula JSON output. Every LLM answer is
+validated before it is cached or used: it must be a PySpark expression built
+from F./Window calls and literals that only references known columns. Formulas
+without a valid translation are reported as untranslatable.
+
+Configuration (environment variables):
+- TRANSLATION_CACHE_DIR: local cache directory (default: /tmp/formula-cache)
+- TRANSLATION_CACHE_MAX_BYTES: local cache size bound in bytes (default: 64 MiB)
+- TRANSLATION_CACHE_S3_URI: use S3 instead of local disk (e.g. 's3://bucket/formula-cache/')
+"""
+import os
+import re
+import ast
+import json
+import hashlib
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from formula_compiler import FormulaParseError, compile_formula, tokenize
+from profile_cache import LocalDiskCacheBackend, S3CacheBackend
+
+
+TRANSLATION_MODEL_ID = 'us.anthropic.claude-3-7-sonnet-20250219-v1:0'
+
+# Formulas per Bedrock request and concurrent requests
+TRANSLATION_BATCH_SIZE = 20
+TRANSLATION_MAX_CONCURRENCY = 4
+
+DEFAULT_TRANSLATION_CACHE_DIR = '/tmp/formula-cache'
+DEFAULT_TRANSLATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class FormulaTranslationError(ValueError):
+    """Raised when formulas have no valid PySpark translation"""
+
+    def __init__(self, problems: Dict[str, str]):
+        self.problems = problems
+        super().__init__("Could not translate formulas to PySpark: " +
+                         "; ".join(f"'{formula}' ({reason})" for formula, reason in problems.items()))
+
+
+# Names a translated expression may use; everything else is reached through calls on these
+_EXPRESSION_NAMES = {'F', 'Window'}
+
+_EXPRESSION_NODES = (
+    ast.Expression, ast.Call, ast.Attribute, ast.Name, ast.Load, ast.Constant, ast.keyword,
+    ast.BinOp, ast.UnaryOp, ast.Compare, ast.List, ast.Tuple,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow, ast.BitAnd, ast.BitOr, ast.Invert,
+    ast.USub, ast.UAdd, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE
+)
+
+
+def validate_expression(expression: str, columns: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Check a translated PySpark expression, returning the problem or None if it is valid.
+
+    The expression must compile, may only use F./Window calls, operators and
+    literals, and its F.col() references must be in `columns` (when given).
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+        compile(tree, '<translation>', 'eval')
+    except SyntaxError as e:
+        return f"syntax error: {e.msg}"
+
+    uses_functions = False
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            return f"unsupported syntax {type(node).__name__}"
+        if isinstance(node, ast.Name):
+            if node.id not in _EXPRESSION_NAMES:
+                return f"unknown name '{node.id}'"
+            uses_functions = True
+        elif isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            return f"private attribute '{node.attr}'"
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+              and isinstance(node.func.value, ast.Name) and node.func.value.id == 'F'
+              and node.func.attr in ('col', 'column')):
+            if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+                return "F.col() without a literal column name"
+            if columns is not None and node.args[0].value not in columns:
+                return f"unknown column '{node.args[0].value}'"
+    if not uses_functions:
+        return "not a pyspark.sql.functions expression"
+    return None
+
+
+def normalize_formula(formula: str) -> str:
+    """Canonical formula text: token-normalised where possible, otherwise whitespace-collapsed"""
+    try:
+        return ' '.join(text for kind, text in tokenize(formula) if kind != 'eof')
+    except FormulaParseError:
+        return re.sub(r'\s+', ' ', formula.strip())
+
+
+def translation_cache_key(formula: str, columns: Optional[List[str]] = None) -> str:
+    identity = {"formula": normalize_formula(formula), "columns": sorted(columns or [])}
+    return 'formula-' + hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """Persistent formula -> PySpark expression cache"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, formula: str, columns: Optional[List[str]] = None) -> Optional[str]:
+        try:
+            data = self.backend.get(translation_cache_key(formula, columns))
+        except Exception as e:
+            print(f"⚠️ Translation cache read failed: {e}")
+            return None
+        return json.loads(data)['expression'] if data is not None else None
+
+    def put(self, formula: str, expression: str, columns: Optional[List[str]] = None):
+        try:
+            self.backend.put(translation_cache_key(formula, columns),
+                             json.dumps({"formula": formula, "expression": expression}).encode('utf-8'))
+        except Exception as e:
+            print(f"⚠️ Translation cache write failed: {e}")
+
+
+_default_cache = None
+
+
+def get_translation_cache() -> TranslationCache:
+    """Return the TranslationCache configured by environment variables"""
+    global _default_cache
+    if _default_cache is None:
+        s3_uri = os.environ.get('TRANSLATION_CACHE_S3_URI')
+        if s3_uri:
+            backend = S3CacheBackend(s3_uri)
+        else:
+            backend = LocalDiskCacheBackend(
+                os.environ.get('TRANSLATION_CACHE_DIR', DEFAULT_TRANSLATION_CACHE_DIR),
+                int(os.environ.get('TRANSLATION_CACHE_MAX_BYTES', DEFAULT_TRANSLATION_CACHE_MAX_BYTES))
+            )
+        _default_cache = TranslationCache(backend)
+    return _default_cache
+
+
+def _clean_expression(expression: str) -> str:
+    expression = expression.strip()
+    if expression.startswith('```'):
+        expression = '\n'.join(expression.split('\n')[1:-1])
+    return expression.strip()
+
+
+def _translate_batch(formulas: List[str], columns: Optional[List[str]]) -> Dict[str, str]:
+    """Translate one batch of formulas in a single Bedrock request"""
+    bedrock = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION'))
+
+    numbered = "\n".join(f"{i}: {formula}" for i, formula in enumerate(formulas))
+    column_hint = f"\nAvailable columns: {', '.join(columns)}\n" if columns else ""
+    prompt = f"""Convert each mathematical formula below to a PySpark SQL expression using pyspark.sql.functions (imported as F).
+{column_hint}
+Formulas:
+{numbered}
+
+Rules:
+- Use F.col('column_name') for column references
+- Use F.when().otherwise() for conditional logic
+- Use standard operators: +, -, *, /, %, ==, !=, <, >, <=, >=
+- Use F.lit() for literal values
+- Use parentheses for proper precedence
+
+Example conversions:
+- "age + 5" → "F.col('age') + 5"
+- "if status == 'active' then 1 else 0" → "F.when(F.col('status') == 'active', 1).otherwise(0)"
+- "calls / tenure" → "F.col('calls') / F.col('tenure')"
+
+Return only a JSON object of the form {{"translations": [{{"id": 0, "expression": "..."}}]}} with one entry per formula id, no explanation."""
+
+    response = bedrock.invoke_model(
+        modelId=TRANSLATION_MODEL_ID,
+        body=json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 200 * len(formulas) + 200,
+            "temperature": 0,
+            "messages": [{"role": "user", "content": prompt}]
+        })
+    )
+
+    result = json.loads(response['body'].read())
+    response_text = result['content'][0]['text']
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    parsed = json.loads(json_match.group() if json_match else response_text)
+
+    translations = {}
+    for entry in parsed.get('translations', []):
+        index = int(entry.get('id', -1))
+        if 0 <= index < len(formulas) and entry.get('expression'):
+            translations[formulas[index]] = _clean_expression(entry['expression'])
+    return translations
+
+
+def translate_formulas(formulas: List[str], columns: Optional[List[str]] = None,
+                       cache: Optional[TranslationCache] = None,
+                       derived_columns: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Translate a list of formulas to PySpark expressions.
+
+    Local compilation is tried first, then the translation cache, then batched
+    concurrent Bedrock requests for whatever is left. Cached and LLM expressions
+    are validated (validate_expression) and only valid ones are cached. Formulas
+    left without a valid translation raise FormulaTranslationError.
+
+    Args:
+        formulas: Formula strings (duplicates are translated once)
+        columns: Input column schema, part of the cache key (optional)
+        cache: TranslationCache to use (optional, defaults to the configured cache)
+        derived_columns: Feature names computed before these formulas, which they may also reference (optional)
+    """
+    cache = cache or get_translation_cache()
+    known_columns = list(columns) + list(derived_columns or []) if columns is not None else None
+    translations = {}
+    pending = []
+    problems = {}
+
+    for formula in dict.fromkeys(formulas):
+        if not formula or formula.strip() == "":
+            translations[formula] = "F.lit(None)"
+            continue
+        try:
+            translations[formula] = compile_formula(formula)
+            continue
+        except FormulaParseError as e:
+            print(f"Local formula compiler could not parse '{formula}' ({e})")
+        cached = cache.get(formula, columns)
+        problem = validate_expression(cached, known_columns) if cached is not None else None
+        if cached is not None and problem is None:
+            translations[formula] = cached
+        else:
+            if problem:
+                print(f"⚠️ Ignoring cached translation of '{formula}': {problem}")
+            pending.append(formula)
+
+    if pending:
+        print(f"Translating {len(pending)} formulas with Claude in batches of {TRANSLATION_BATCH_SIZE}")
+        batches = [pending[i:i + TRANSLATION_BATCH_SIZE] for i in range(0, len(pending), TRANSLATION_BATCH_SIZE)]
+
+        def _safe_batch(batch):
+            try:
+                return _translate_batch(batch, columns)
+            except Exception as e:
+                print(f"Error converting formulas with Claude: {e}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=TRANSLATION_MAX_CONCURRENCY) as executor:
+            for batch_translations in executor.map(_safe_batch, batches):
+                for formula, expression in batch_translations.items():
+                    problem = validate_expression(expression, known_columns)
+                    if problem:
+                        print(f"⚠️ Rejected translation of '{formula}' ({expression}): {problem}")
+                        problems[formula] = problem
+                        continue
+                    translations[formula] = expression
+                    cache.put(formula, expression, columns)
+
+        for formula in pending:
+            if formula not in translations and formula not in problems:
+                problems[formula] = "no translation returned"
+
+    if problems:
+        raise FormulaTranslationError(problems)
+    return translations
@@ -0,0 +1,323 @@
+"""
+Vectorized local feature execution engine (pandas/NumPy) as an alternative to Glue.
+
+Evaluates the confirmed feature formulas as vectorized column expressions over
+input chunks and writes the same output layout as the generated Glue job:
+- {output_path}/features/      snappy Parquet part files
+- {output_path}/features_csv/  CSV part files with header
+- {output_path}/metadata/      JSON feature metadata
+
+Formulas are parsed with formula_compiler, so the engine evaluates the same
+AST the Glue script is rendered from. Null semantics follow Spark where it
+matters for features: division by zero and invalid logarithms yield null.
+"""
+import json
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+from data_profiling import DEFAULT_CHUNK_SIZE, iter_object_chunks
+from formula_compiler import LEADING_LITERAL_FUNCTIONS, FormulaParseError, parse_formula
+
+
+def _to_series(value, index: pd.Index) -> pd.Series:
+    if isinstance(value, pd.Series):
+        return value
+    return pd.Series([value] * len(index), index=index)
+
+
+def _null_invalid(values) -> Any:
+    """Replace +/-inf produced by NumPy with null, as Spark returns null for these cases"""
+    if isinstance(values, pd.Series):
+        return values.replace([np.inf, -np.inf], np.nan)
+    return values
+
+
+def _divide(left, right):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = left / right
+    if isinstance(right, pd.Series):
+        return result.where(right != 0)
+    return np.nan if right == 0 else result
+
+
+def _modulo(left, right):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Spark's % keeps the sign of the dividend, like fmod
+        result = np.fmod(left, right)
+    if isinstance(right, pd.Series):
+        return result.where(right != 0)
+    return np.nan if right == 0 else result
+
+
+def _log(*args):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if len(args) == 2:
+            base, value = args
+            result = np.log(value) / np.log(base)
+        else:
+            result = np.log(args[0])
+    return _null_invalid(result)
+
+
+def _nary(reducer):
+    """Row-wise least/greatest that skips nulls, like Spark"""
+    def _apply(*args):
+        index = next((arg.index for arg in args if isinstance(arg, pd.Series)), None)
+        if index is None:
+            return reducer(pd.Series(args), skipna=True)
+        frame = pd.concat([_to_series(arg, index) for arg in args], axis=1)
+        return reducer(frame, axis=1, skipna=True)
+    return _apply
+
+
+def _coalesce(*args):
+    result = args[0]
+    for arg in args[1:]:
+        result = result.fillna(arg) if isinstance(result, pd.Series) else (arg if pd.isnull(result) else result)
+    return result
+
+
+_FUNCTIONS = {
+    'F.abs': lambda x: np.abs(x),
+    'F.sqrt': lambda x: _null_invalid(np.sqrt(x.where(x >= 0)) if isinstance(x, pd.Series) else np.sqrt(x)),
+    'F.log': _log,
+    'F.log10': lambda x: _log(10, x),
+    'F.log2': lambda x: _log(2, x),
+    'F.log1p': lambda x: _log(x + 1),
+    'F.exp': lambda x: np.exp(x),
+    'F.floor': lambda x: np.floor(x),
+    'F.ceil': lambda x: np.ceil(x),
+    'F.round': lambda x, scale=0: np.round(x, scale),
+    'F.pow': lambda x, y: _null_invalid(np.power(x.astype(float) if isinstance(x, pd.Series) else float(x), y)),
+    'F.least': _nary(lambda values, **kwargs: values.min(**kwargs)),
+    'F.greatest': _nary(lambda values, **kwargs: values.max(**kwargs)),
+    'F.coalesce': _coalesce,
+    'F.isnull': lambda x: x.isnull() if isinstance(x, pd.Series) else pd.isnull(x),
+    'F.lower': lambda x: x.str.lower(),
+    'F.upper': lambda x: x.str.upper(),
+    'F.length': lambda x: x.str.len(),
+}
+
+
+def evaluate(node, df: pd.DataFrame):
+    """Evaluate a formula AST over a DataFrame, returning a Series or scalar"""
+    kind = node[0]
+    if kind == 'literal':
+        return np.nan if node[1] is None else node[1]
+    if kind == 'column':
+        if node[1] not in df.columns:
+            raise KeyError(f"Column not found: {node[1]}")
+        return df[node[1]]
+    if kind == 'binary':
+        _, op, left_node, right_node = node
+        left, right = evaluate(left_node, df), evaluate(right_node, df)
+        if op == '+':
+            return left + right
+        if op == '-':
+            return left - right
+        if op == '*':
+            return left * right
+        if op == '/':
+            return _divide(left, right)
+        if op == '%':
+            return _modulo(left, right)
+        if op == '&':
+            return _to_series(left, df.index).fillna(False).astype(bool) & _to_series(right, df.index).fillna(False).astype(bool)
+        if op == '|':
+            return _to_series(left, df.index).fillna(False).astype(bool) | _to_series(right, df.index).fillna(False).astype(bool)
+        comparisons = {'==': 'eq', '!=': 'ne', '<': 'lt', '>': 'gt', '<=': 'le', '>=': 'ge'}
+        return getattr(_to_series(left, df.index), comparisons[op])(right)
+    if kind == 'negate':
+        return -evaluate(node[1], df)
+    if kind == 'not':
+        return ~_to_series(evaluate(node[1], df), df.index).fillna(False).astype(bool)
+    if kind == 'isin':
+        values = [evaluate(value, df) for value in node[2]]
+        return _to_series(evaluate(node[1], df), df.index).isin(values)
+    if kind == 'call':
+        value = _to_series(evaluate(node[2][0], df), df.index)
+        return value.isnull() if node[1] == 'isNull' else value.notnull()
+    if kind == 'when':
+        _, branches, otherwise = node
+        conditions = [_to_series(evaluate(condition, df), df.index).fillna(False).astype(bool).to_numpy()
+                      for condition, _ in branches]
+        choices = [_to_series(evaluate(value, df), df.index).to_numpy() for _, value in branches]
+        default = _to_series(evaluate(otherwise, df), df.index).to_numpy()
+        if any(choice.dtype == object for choice in choices) or default.dtype == object:
+            choices = [choice.astype(object) for choice in choices]
+            default = default.astype(object)
+        return pd.Series(np.select(conditions, choices, default=default), index=df.index)
+    if kind == 'function':
+        args = [evaluate(arg, df) for arg in node[2]]
+        if len(node) > 3:
+            args = list(node[3]) + args if node[1] in LEADING_LITERAL_FUNCTIONS else args + list(node[3])
+        return _FUNCTIONS[node[1]](*args)
+    raise FormulaParseError(f"Unknown AST node: {kind}")
+
+
+def compile_features(final_features: List[Dict]) -> Dict[str, Any]:
+    """
+    Parse the formulas of LLM and user features for local execution.
+
+    Returns a dict with `compiled` [(feature, ast)] and `unsupported` feature names
+    whose formulas are outside the local grammar.
+    """
+    compiled, unsupported = [], []
+    for feature in final_features:
+        if feature.get('source') not in ('llm', 'user'):
+            continue
+        try:
+            compiled.append((feature, parse_formula(feature.get('formula', feature['feature_name']))))
+        except FormulaParseError:
+            unsupported.append(feature['feature_name'])
+    return {"compiled": compiled, "unsupported": unsupported}
+
+
+def engineer_features_frame(df: pd.DataFrame, compiled: List, job_name: str,
+                            processing_time: datetime) -> pd.DataFrame:
+    """Apply compiled features to one chunk, mirroring engineer_features in the Glue script"""
+    feature_df = df.copy()
+
+    # Convert date columns; like F.to_date in Glue, only string and datetime columns are converted
+    for col in df.columns:
+        if 'date' in col.lower() or 'time' in col.lower():
+            if not (pd.api.types.is_object_dtype(feature_df[col]) or pd.api.types.is_string_dtype(feature_df[col])
+                    or pd.api.types.is_datetime64_any_dtype(feature_df[col])):
+                continue
+            converted = pd.to_datetime(feature_df[col], errors='coerce')
+            if converted.notna().any() or feature_df[col].isna().all():
+                feature_df[col] = converted.dt.date
+
+    for feature, ast in compiled:
+        if not all(col in df.columns for col in feature.get('source_columns', [])):
+            continue
+        try:
+            feature_df[feature['feature_name']] = _to_series(evaluate(ast, feature_df), feature_df.index)
+        except Exception as e:
+            print(f"Error creating feature {feature['feature_name']}: {e}")
+
+    feature_df['feature_engineering_timestamp'] = pd.Timestamp(processing_time)
+    feature_df['job_name'] = job_name
+    return feature_df
+
+
+def _widen_type(current: pa.DataType, new: pa.DataType) -> pa.DataType:
+    """Narrowest type holding the values of both types"""
+    if current == new or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    numeric = (pa.types.is_integer, pa.types.is_floating, pa.types.is_boolean)
+    if any(check(current) for check in numeric) and any(check(new) for check in numeric):
+        if pa.types.is_floating(current) or pa.types.is_floating(new):
+            return pa.float64()
+        return pa.int64()
+    return pa.string()
+
+
+def _widen_schema(schema: pa.Schema, chunk_schema: pa.Schema) -> pa.Schema:
+    """Schema of the parts so far widened to also hold a new chunk; columns new in the chunk are appended"""
+    fields = [pa.field(field.name, _widen_type(field.type, chunk_schema.field(field.name).type))
+              if field.name in chunk_schema.names else field for field in schema]
+    return pa.schema(fields + [field for field in chunk_schema if field.name not in schema.names])
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Table in the given schema, with columns it lacks filled with typed nulls"""
+    return pa.table([table.column(field.name).cast(field.type) if field.name in table.column_names
+                     else pa.nulls(table.num_rows, field.type) for field in schema], schema=schema)
+
+
+def _clear_output(path: str):
+    fs, root = fsspec.core.url_to_fs(path)
+    if fs.exists(root):
+        fs.rm(root, recursive=True)
+
+
+def run_local_feature_engineering(final_features: List[Dict], objects: List[Dict[str, Any]], bucket: str,
+                                  output_path: str, job_name: str, input_path: str = None,
+                                  chunk_size: int = DEFAULT_CHUNK_SIZE, write_csv: bool = True) -> Dict[str, Any]:
+    """
+    Engineer features locally, chunk by chunk, and write the Glue output layout.
+
+    Args:
+        final_features: Confirmed feature list
+        objects: Input objects (dicts with key, format), e.g. from the listing manifest
+        bucket: S3 bucket holding the input objects
+        output_path: S3 (or local) output path; features/, features_csv/ and metadata/ are written under it
+        job_name: Value of the job_name metadata column
+        input_path: Input prefix recorded in the metadata (optional)
+        chunk_size: Rows per chunk; bounds memory for larger-than-memory inputs
+        write_csv: Also write the features_csv/ copy
+    """
+    output_path = output_path.rstrip('/')
+    plan = compile_features(final_features)
+    processing_time = datetime.now(timezone.utc)
+    run_id = processing_time.strftime('%Y%m%d%H%M%S')
+
+    for sub_dir in ('features', 'features_csv', 'metadata'):
+        _clear_output(f"{output_path}/{sub_dir}/")
+
+    schema = None
+    part_schemas = []
+    record_count = 0
+    for obj in objects:
+        for chunk in iter_object_chunks(f"s3://{bucket}/{obj['key']}", obj['format'], chunk_size):
+            feature_df = engineer_features_frame(chunk, plan['compiled'], job_name, processing_time)
+            table = pa.Table.from_pandas(feature_df, preserve_index=False).replace_schema_metadata(None)
+            # Each part is written as it comes; the schema across parts only ever widens
+            schema = table.schema if schema is None else _widen_schema(schema, table.schema)
+            part_schemas.append(table.schema)
+
+            part = len(part_schemas) - 1
+            with fsspec.open(f"{output_path}/features/part-{part:05d}-{run_id}.snappy.parquet", 'wb') as f:
+                pq.write_table(table, f, compression='snappy')
+            if write_csv:
+                with fsspec.open(f"{output_path}/features_csv/part-{part:05d}-{run_id}.csv", 'w') as f:
+                    feature_df.to_csv(f, index=False)
+
+            record_count += len(feature_df)
+
+    # One final pass gives every part the same schema: a chunk that was all null, held integers where
+    # later chunks hold decimals, or lacked a column is rewritten once in the widened schema
+    rewritten = 0
+    for part, part_schema in enumerate(part_schemas):
+        if not part_schema.equals(schema):
+            path = f"{output_path}/features/part-{part:05d}-{run_id}.snappy.parquet"
+            with fsspec.open(path, 'rb') as f:
+                written = pq.read_table(f)
+            with fsspec.open(path, 'wb') as f:
+                pq.write_table(_conform(written, schema), f, compression='snappy')
+            rewritten += 1
+    if rewritten:
+        print(f"Rewrote {rewritten} of {len(part_schemas)} parts in the widened output schema")
+    columns = schema.names if schema is not None else []
+
+    llm_count = len([f for f in final_features if f.get('source') == 'llm'])
+    user_count = len([f for f in final_features if f.get('source') == 'user'])
+    raw_count = len([f for f in final_features if f.get('source') == 'raw_data'])
+    feature_metadata = {
+        "job_name": job_name,
+        "input_path": input_path,
+        "output_path": output_path,
+        "feature_count": len(columns),
+        "record_count": record_count,
+        "processing_timestamp": processing_time.isoformat(),
+        "execution_engine": "local",
+        "features": {
+            "llm_generated": llm_count,
+            "user_suggested": user_count,
+            "raw_columns": raw_count
+        },
+        "unsupported_features": plan['unsupported']
+    }
+    with fsspec.open(f"{output_path}/metadata/part-00000-{run_id}.json", 'w') as f:
+        f.write(json.dumps(feature_metadata) + "\n")
+
+    feature_metadata["parts_written"] = len(part_schemas)
+    return feature_metadata
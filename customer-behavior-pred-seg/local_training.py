@@ -0,0 +1,200 @@
+"""
+Local histogram gradient-boosting training backend for fast offline iteration.
+
+LocalTabularPredictor trains scikit-learn's HistGradientBoostingClassifier or
+HistGradientBoostingRegressor (multi-core via OpenMP) and exposes the subset of
+the TabularCloudPredictor interface the training pipeline uses - fit, leaderboard
+and predict - so the same targets, splits and evaluation code run locally in
+seconds while AutoGluon Cloud is kept for final models.
+
+Artefacts are written under the predictor's output path:
+- model.joblib            fitted estimator with its feature encoding
+- model_metadata.json     target, features, validation score and fit statistics
+"""
+import json
+import time
+import fsspec
+import joblib
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any, Optional
+
+
+# HistGradientBoosting bins categorical codes into at most 255 categories
+MAX_CATEGORIES = 255
+
+# Boosting iterations per fit call; fitting continues until early stopping or the time limit
+ITERATIONS_PER_ROUND = 50
+MAX_ITERATIONS = 1000
+
+VALIDATION_FRACTION = 0.1
+RANDOM_STATE = 42
+
+
+def _is_classification(label: pd.Series, problem_type: Optional[str] = None) -> bool:
+    """AutoGluon's problem_type if given; otherwise non-numeric and two-valued labels are classes"""
+    if problem_type:
+        return problem_type != 'regression'
+    if not pd.api.types.is_numeric_dtype(label) or pd.api.types.is_bool_dtype(label):
+        return True
+    return label.nunique() <= 2
+
+
+def build_feature_spec(data: pd.DataFrame, columns: List[str]) -> List[Dict[str, Any]]:
+    """Encoding of each usable feature column: numeric, or categorical with its category list"""
+    spec = []
+    for column in columns:
+        values = data[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            spec.append({"name": column, "kind": "numeric"})
+            continue
+        categories = values.cat.categories if pd.api.types.is_categorical_dtype(values) else values.dropna().unique()
+        if 0 < len(categories) <= MAX_CATEGORIES:
+            spec.append({"name": column, "kind": "categorical", "categories": [str(c) for c in categories]})
+    return spec
+
+
+def encode_features(data: pd.DataFrame, spec: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Numeric matrix for the estimator: categoricals become codes, unseen and missing values NaN"""
+    encoded = {}
+    for feature in spec:
+        values = data[feature["name"]] if feature["name"] in data.columns else pd.Series(np.nan, index=data.index)
+        if feature["kind"] == "numeric":
+            encoded[feature["name"]] = pd.to_numeric(values, errors='coerce').astype(np.float32)
+        else:
+            codes = pd.Categorical(values.astype(str).where(values.notna()), categories=feature["categories"]).codes
+            encoded[feature["name"]] = np.where(codes < 0, np.nan, codes).astype(np.float32)
+    return pd.DataFrame(encoded, index=data.index)
+
+
+class LocalTabularPredictor:
+    """HistGradientBoosting model with the fit/leaderboard/predict surface of TabularCloudPredictor"""
+
+    def __init__(self, cloud_output_path: str, hyperparameters: Optional[Dict[str, Any]] = None):
+        self.output_path = cloud_output_path if cloud_output_path.endswith('/') else cloud_output_path + '/'
+        self.hyperparameters = hyperparameters or {}
+        self.model = None
+        self.label = None
+        self.feature_spec = None
+        self.classification = None
+        self.fit_statistics = None
+
+    def fit(self, predictor_init_args: Dict[str, Any], predictor_fit_args: Dict[str, Any]) -> "LocalTabularPredictor":
+        """
+        Fit on predictor_fit_args["train_data"] predicting predictor_init_args["label"].
+
+        Columns listed in predictor_init_args["learner_kwargs"]["ignored_columns"] are not used, and
+        boosting stops at early stopping or predictor_fit_args["time_limit"] seconds.
+        """
+        from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+
+        train_data = predictor_fit_args["train_data"]
+        time_limit = predictor_fit_args.get("time_limit")
+        self.label = predictor_init_args["label"]
+        ignored = set(predictor_init_args.get("learner_kwargs", {}).get("ignored_columns", []))
+
+        train_data = train_data[train_data[self.label].notna()]
+        label = train_data[self.label]
+        self.classification = _is_classification(label, predictor_init_args.get("problem_type"))
+        if self.classification and not pd.api.types.is_numeric_dtype(label):
+            label = label.astype(str)
+
+        columns = [column for column in train_data.columns if column != self.label and column not in ignored]
+        self.feature_spec = build_feature_spec(train_data, columns)
+        dropped = sorted(set(columns) - {feature["name"] for feature in self.feature_spec})
+        if dropped:
+            print(f"⏭️ Skipping {len(dropped)} high-cardinality or unusable columns: {dropped}")
+        features = encode_features(train_data, self.feature_spec)
+
+        hyperparameters = dict(self.hyperparameters)
+        max_iterations = hyperparameters.pop('max_iter', MAX_ITERATIONS)
+        estimator = HistGradientBoostingClassifier if self.classification else HistGradientBoostingRegressor
+        self.model = estimator(
+            max_iter=min(ITERATIONS_PER_ROUND, max_iterations),
+            categorical_features=[feature["kind"] == "categorical" for feature in self.feature_spec] or None,
+            early_stopping=True,
+            validation_fraction=VALIDATION_FRACTION,
+            scoring='accuracy' if self.classification else 'neg_root_mean_squared_error',
+            warm_start=True,
+            random_state=RANDOM_STATE,
+            **hyperparameters
+        )
+
+        started = time.time()
+        while True:
+            self.model.fit(features, label)
+            stopped_early = self.model.n_iter_ < self.model.max_iter
+            out_of_time = time_limit is not None and time.time() - started >= time_limit
+            if stopped_early or out_of_time or self.model.max_iter >= max_iterations:
+                break
+            self.model.set_params(max_iter=min(self.model.max_iter + ITERATIONS_PER_ROUND, max_iterations))
+        fit_time = time.time() - started
+
+        self.fit_statistics = {
+            "fit_time": fit_time,
+            "iterations": int(self.model.n_iter_),
+            "score_val": float(np.max(self.model.validation_score_)),
+            "eval_metric": 'accuracy' if self.classification else 'root_mean_squared_error',
+            "train_rows": len(train_data),
+            "features": len(self.feature_spec),
+            "skipped_columns": dropped
+        }
+        print(f"✅ {type(self.model).__name__}: {self.fit_statistics['iterations']} iterations in {fit_time:.1f}s, "
+              f"validation {self.fit_statistics['eval_metric']} {abs(self.fit_statistics['score_val']):.4f}")
+        self.save()
+        return self
+
+    def save(self):
+        """Write the fitted model and its metadata to the output path"""
+        with fsspec.open(f"{self.output_path}model.joblib", 'wb') as f:
+            joblib.dump({"model": self.model, "label": self.label, "feature_spec": self.feature_spec,
+                         "classification": self.classification}, f)
+        metadata = {
+            "backend": "local",
+            "estimator": type(self.model).__name__,
+            "label": self.label,
+            "classification": self.classification,
+            "hyperparameters": self.hyperparameters,
+            "feature_spec": self.feature_spec,
+            "fit_statistics": self.fit_statistics
+        }
+        with fsspec.open(f"{self.output_path}model_metadata.json", 'w') as f:
+            f.write(json.dumps(metadata, indent=2, default=str))
+        print(f"💾 Saved local model to {self.output_path}model.joblib")
+
+    @classmethod
+    def load(cls, output_path: str) -> "LocalTabularPredictor":
+        """Load a model written by save()"""
+        predictor = cls(output_path)
+        with fsspec.open(f"{predictor.output_path}model.joblib", 'rb') as f:
+            saved = joblib.load(f)
+        predictor.model = saved["model"]
+        predictor.label = saved["label"]
+        predictor.feature_spec = saved["feature_spec"]
+        predictor.classification = saved["classification"]
+        return predictor
+
+    def leaderboard(self) -> pd.DataFrame:
+        """Single-row leaderboard with the columns of an AutoGluon leaderboard"""
+        return pd.DataFrame([{
+            "model": type(self.model).__name__,
+            "score_val": self.fit_statistics["score_val"],
+            "eval_metric": self.fit_statistics["eval_metric"],
+            "pred_time_val": None,
+            "fit_time": self.fit_statistics["fit_time"],
+            "stack_level": 1,
+            "can_infer": True,
+            "fit_order": 1
+        }])
+
+    def predict(self, test_data: pd.DataFrame) -> pd.Series:
+        """Predict the label for every row (multi-core)"""
+        predictions = self.model.predict(encode_features(test_data, self.feature_spec))
+        return pd.Series(predictions, index=test_data.index, name=self.label)
+
+    def predict_proba(self, test_data: pd.DataFrame) -> pd.DataFrame:
+        """Class probabilities for every row, one column per class (classifiers only)"""
+        if not self.classification:
+            raise ValueError("predict_proba is only available for classification models")
+        probabilities = self.model.predict_proba(encode_features(test_data, self.feature_spec))
+        return pd.DataFrame(probabilities, index=test_data.index, columns=list(self.model.classes_))
@@ -0,0 +1,181 @@
+"""
+Content-addressed cache for per-object data profiles and samples.
+
+Entries are keyed by bucket, key, ETag and size of the source object plus the
+profiling parameters (e.g. sample_size), so an unchanged object is never
+re-read and a changed object simply misses. Two storage backends are provided:
+- LocalDiskCacheBackend: files on local disk with size-bounded LRU eviction
+- S3CacheBackend: objects under an S3 prefix, shared across sessions and runtimes
+
+Values are stored as JSON (the to_dict() form of profiles and reservoirs), never
+pickled, so entries read from a shared prefix cannot execute code.
+
+Configuration (environment variables):
+- PROFILE_CACHE_DIR: local cache directory (default: /tmp/profile-cache)
+- PROFILE_CACHE_MAX_BYTES: local cache size bound in bytes (default: 1 GiB)
+- PROFILE_CACHE_S3_URI: use S3 instead of local disk (e.g. 's3://bucket/profile-cache/')
+"""
+import os
+import json
+import hashlib
+import threading
+import boto3
+from typing import Dict, Any, Optional
+
+
+DEFAULT_CACHE_DIR = '/tmp/profile-cache'
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Bump when the layout of cached profile objects changes
+CACHE_FORMAT_VERSION = 2
+
+
+class LocalDiskCacheBackend:
+    """JSON entries on local disk, evicting least recently used files beyond max_bytes"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, cache_key: str) -> str:
+        return os.path.join(self.directory, f"{cache_key}.json")
+
+    def get(self, cache_key: str) -> Optional[bytes]:
+        path = self._path(cache_key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Touch the entry so eviction is least-recently-used rather than oldest-written
+            os.utime(path, None)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, cache_key: str, data: bytes):
+        path = self._path(cache_key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+class S3CacheBackend:
+    """JSON entries stored as objects under an S3 prefix (expire them with a bucket lifecycle rule)"""
+
+    def __init__(self, s3_uri: str, s3_client=None):
+        s3_parts = s3_uri.replace('s3://', '').split('/', 1)
+        self.bucket = s3_parts[0]
+        self.prefix = s3_parts[1] if len(s3_parts) > 1 else ''
+        if self.prefix and not self.prefix.endswith('/'):
+            self.prefix += '/'
+        self.s3_client = s3_client or boto3.client('s3')
+
+    def get(self, cache_key: str) -> Optional[bytes]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{cache_key}.json")
+            return response['Body'].read()
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, cache_key: str, data: bytes):
+        self.s3_client.put_object(Bucket=self.bucket, Key=f"{self.prefix}{cache_key}.json", Body=data)
+
+
+class ProfileCache:
+    """Per-object profile cache with hit/miss counters, on top of a storage backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # get() is called from profiling worker threads
+        self._lock = threading.Lock()
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def cache_key(kind: str, bucket: str, obj: Dict[str, Any], params: Dict[str, Any] = None) -> str:
+        """Content address for a profile of one object version under the given parameters"""
+        identity = {
+            "version": CACHE_FORMAT_VERSION,
+            "kind": kind,
+            "bucket": bucket,
+            "key": obj['key'],
+            "etag": obj.get('etag', ''),
+            "size": obj.get('size', 0),
+            "params": params or {}
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, kind: str, bucket: str, obj: Dict[str, Any], params: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Cached JSON value (a to_dict() form) or None"""
+        # Objects without an ETag cannot be content-addressed safely
+        if not obj.get('etag'):
+            self._count(hit=False)
+            return None
+        try:
+            data = self.backend.get(self.cache_key(kind, bucket, obj, params))
+            value = json.loads(data.decode('utf-8')) if data is not None else None
+        except Exception as e:
+            print(f"⚠️ Profile cache read failed: {e}")
+            value = None
+        self._count(hit=value is not None)
+        return value
+
+    def put(self, kind: str, bucket: str, obj: Dict[str, Any], value: Dict[str, Any], params: Dict[str, Any] = None):
+        """Store a JSON-serialisable value (a to_dict() form)"""
+        if not obj.get('etag'):
+            return
+        try:
+            self.backend.put(self.cache_key(kind, bucket, obj, params), json.dumps(value).encode('utf-8'))
+        except Exception as e:
+            # Caching is best effort; profiling results are still returned
+            print(f"⚠️ Profile cache write failed: {e}")
+
+
+_default_backend = None
+
+
+def get_profile_cache() -> ProfileCache:
+    """Return a ProfileCache on the backend configured by environment variables"""
+    global _default_backend
+    if _default_backend is None:
+        s3_uri = os.environ.get('PROFILE_CACHE_S3_URI')
+        if s3_uri:
+            _default_backend = S3CacheBackend(s3_uri)
+        else:
+            _default_backend = LocalDiskCacheBackend(
+                os.environ.get('PROFILE_CACHE_DIR', DEFAULT_CACHE_DIR),
+                int(os.environ.get('PROFILE_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES))
+            )
+    return ProfileCache(_default_backend)
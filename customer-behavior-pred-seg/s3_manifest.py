@@ -0,0 +1,355 @@
+"""
+Paginated, concurrent S3 listing with a persisted manifest index.
+
+A manifest records every supported data object under a prefix (key, size,
+ETag, last-modified, detected format) so the explorer, Glue job sizing and
+training loaders can reuse one listing instead of re-listing S3. Listing fans
+out across common sub-prefixes in parallel and always follows pagination.
+A refresh re-lists the prefix and reports added, changed and removed keys (the
+last-modified watermark only helps label changes); prefixes whose keys are only
+ever appended in order can be refreshed by listing just the keys after the last
+known one.
+
+Incremental feature engineering records the inputs a feature output was built
+from (key -> ETag) next to that output, so the next run only processes new objects.
+"""
+import re
+import json
+import hashlib
+import boto3
+import pandas as pd
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from data_profiling import detect_format, parse_s3_uri
+
+
+MANIFEST_VERSION = 1
+
+
+def _object_entry(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Manifest entry for a listed object, or None for unsupported keys"""
+    file_format = detect_format(obj['Key'])
+    if not file_format:
+        return None
+    return {
+        "key": obj['Key'],
+        "size": obj.get('Size', 0),
+        "etag": obj.get('ETag', '').strip('"'),
+        "last_modified": obj['LastModified'].isoformat() if obj.get('LastModified') else None,
+        "format": file_format
+    }
+
+
+def _list_flat(s3_client, bucket: str, prefix: str, start_after: str = None) -> List[Dict[str, Any]]:
+    """List every object under a prefix (no delimiter), following pagination"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    entries = []
+    for page in paginator.paginate(**params):
+        for obj in page.get('Contents', []):
+            entry = _object_entry(obj)
+            if entry:
+                entries.append(entry)
+    return entries
+
+
+def _list_level(s3_client, bucket: str, prefix: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """List one level of a prefix: objects directly under it and its common sub-prefixes"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    entries, sub_prefixes = [], []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            entry = _object_entry(obj)
+            if entry:
+                entries.append(entry)
+        sub_prefixes.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+    return entries, sub_prefixes
+
+
+def list_objects_parallel(bucket: str, prefix: str, max_workers: int = 16, fan_out_depth: int = 2,
+                          s3_client=None) -> List[Dict[str, Any]]:
+    """
+    List every supported object under a prefix, fanning out across common sub-prefixes.
+
+    Args:
+        bucket: S3 bucket name
+        prefix: Key prefix to list
+        max_workers: Number of concurrent list requests
+        fan_out_depth: Number of '/'-delimited levels discovered before listing sub-prefixes flat in parallel
+    """
+    s3_client = s3_client or boto3.client('s3')
+    entries = []
+    frontier = [prefix]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in range(fan_out_depth):
+            next_frontier = []
+            for level_entries, sub_prefixes in executor.map(lambda p: _list_level(s3_client, bucket, p), frontier):
+                entries.extend(level_entries)
+                next_frontier.extend(sub_prefixes)
+            frontier = next_frontier
+            # Stop discovering once there is enough parallelism (or nothing left to discover)
+            if not frontier or len(frontier) >= max_workers:
+                break
+
+        for sub_entries in executor.map(lambda p: _list_flat(s3_client, bucket, p), frontier):
+            entries.extend(sub_entries)
+
+    return sorted(entries, key=lambda entry: entry['key'])
+
+
+def _watermark(objects: List[Dict[str, Any]]) -> Optional[str]:
+    timestamps = [obj['last_modified'] for obj in objects if obj.get('last_modified')]
+    return max(timestamps) if timestamps else None
+
+
+def build_manifest(s3_prefix: str, max_workers: int = 16) -> Dict[str, Any]:
+    """List an S3 prefix and return a new manifest"""
+    bucket, prefix = parse_s3_uri(s3_prefix)
+    objects = list_objects_parallel(bucket, prefix, max_workers=max_workers)
+    return {
+        "version": MANIFEST_VERSION,
+        "s3_prefix": s3_prefix,
+        "bucket": bucket,
+        "prefix": prefix,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "refreshed_at": datetime.now(timezone.utc).isoformat(),
+        "watermark": _watermark(objects),
+        "total_bytes": sum(obj['size'] for obj in objects),
+        "objects": objects
+    }
+
+
+def refresh_manifest(manifest: Dict[str, Any], append_only: bool = False,
+                     max_workers: int = 16) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Refresh a manifest and report which keys were added, changed or removed.
+
+    By default the whole prefix is listed again; ETags and the last-modified watermark
+    of the previous listing only decide which keys count as changed. With append_only,
+    only keys after the last known key are listed.
+
+    Args:
+        manifest: Previously built manifest
+        append_only: Keys only ever get added in increasing lexicographic order (e.g. date-stamped drops);
+                     only keys after the last known key are listed and nothing is treated as removed
+        max_workers: Number of concurrent list requests for a full re-list
+    """
+    bucket, prefix = manifest['bucket'], manifest['prefix']
+    previous = {obj['key']: obj for obj in manifest['objects']}
+    watermark = manifest.get('watermark')
+
+    if append_only and previous:
+        s3_client = boto3.client('s3')
+        new_entries = _list_flat(s3_client, bucket, prefix, start_after=max(previous))
+        current = dict(previous)
+        current.update({entry['key']: entry for entry in new_entries})
+    else:
+        current = {entry['key']: entry for entry in list_objects_parallel(bucket, prefix, max_workers=max_workers)}
+
+    added = [key for key in current if key not in previous]
+    removed = [key for key in previous if key not in current]
+    changed = [
+        key for key, entry in current.items()
+        if key in previous and (
+            entry['etag'] != previous[key]['etag']
+            or (watermark and entry.get('last_modified') and entry['last_modified'] > watermark)
+        )
+    ]
+
+    objects = sorted(current.values(), key=lambda entry: entry['key'])
+    refreshed = dict(manifest)
+    refreshed.update({
+        "refreshed_at": datetime.now(timezone.utc).isoformat(),
+        "watermark": _watermark(objects) or watermark,
+        "total_bytes": sum(obj['size'] for obj in objects),
+        "objects": objects
+    })
+    return refreshed, {"added": added, "changed": changed, "removed": removed}
+
+
+def manifest_name(s3_prefix: str) -> str:
+    """Stable file name for the manifest of an S3 prefix"""
+    return hashlib.sha256(s3_prefix.encode('utf-8')).hexdigest()[:32] + '.json'
+
+
+def save_manifest(manifest: Dict[str, Any], manifest_uri: str):
+    """Persist a manifest as JSON to an S3 URI or a local path"""
+    body = json.dumps(manifest, indent=2).encode('utf-8')
+    if manifest_uri.startswith('s3://'):
+        bucket, key = parse_s3_uri(manifest_uri)
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/json')
+    else:
+        with open(manifest_uri, 'wb') as f:
+            f.write(body)
+
+
+def load_manifest(manifest_uri: str) -> Optional[Dict[str, Any]]:
+    """Load a manifest from an S3 URI or a local path, or None if it does not exist"""
+    try:
+        if manifest_uri.startswith('s3://'):
+            bucket, key = parse_s3_uri(manifest_uri)
+            s3_client = boto3.client('s3')
+            try:
+                body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+            except s3_client.exceptions.NoSuchKey:
+                return None
+        else:
+            with open(manifest_uri, 'rb') as f:
+                body = f.read()
+    except FileNotFoundError:
+        return None
+    manifest = json.loads(body)
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def get_manifest(s3_prefix: str, manifest_uri: str, refresh: bool = True,
+                 append_only: bool = False) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Load the persisted manifest for a prefix (refreshed with refresh_manifest) or build and save a new one.
+
+    Returns the manifest and the added/changed/removed keys since the persisted version.
+    """
+    manifest = load_manifest(manifest_uri)
+    if manifest is None or manifest.get('s3_prefix') != s3_prefix:
+        manifest = build_manifest(s3_prefix)
+        save_manifest(manifest, manifest_uri)
+        return manifest, {"added": [obj['key'] for obj in manifest['objects']], "changed": [], "removed": []}
+
+    if not refresh:
+        return manifest, {"added": [], "changed": [], "removed": []}
+
+    manifest, delta = refresh_manifest(manifest, append_only=append_only)
+    if any(delta.values()):
+        save_manifest(manifest, manifest_uri)
+    return manifest, delta
+
+
+def manifest_version(manifest: Dict[str, Any]) -> str:
+    """Version of the listed data: changes whenever any object is added, removed or rewritten"""
+    identity = {
+        "s3_prefix": manifest['s3_prefix'],
+        "objects": sorted((obj['key'], obj['etag']) for obj in manifest['objects'])
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+
+def sub_manifest(manifest: Dict[str, Any], s3_prefix: str) -> Dict[str, Any]:
+    """Manifest restricted to the objects under a sub-prefix, without re-listing S3"""
+    bucket, prefix = parse_s3_uri(s3_prefix)
+    objects = [obj for obj in manifest['objects'] if obj['key'].startswith(prefix)]
+    return dict(manifest, s3_prefix=s3_prefix, bucket=bucket, prefix=prefix, objects=objects,
+                total_bytes=sum(obj['size'] for obj in objects))
+
+
+def manifest_paths(manifest: Dict[str, Any], file_format: str = None) -> List[str]:
+    """Full s3:// paths of manifest objects, optionally restricted to one format"""
+    return [
+        f"s3://{manifest['bucket']}/{obj['key']}"
+        for obj in manifest['objects']
+        if file_format is None or obj['format'] == file_format
+    ]
+
+
+def partition_value(key: str, partition_column: str) -> Optional[str]:
+    """Value of a Hive-style `column=value` partition segment in an object key, or None"""
+    match = re.search(rf"(?:^|/){re.escape(partition_column)}=([^/]+)/", key)
+    return match.group(1) if match else None
+
+
+def _filter_partitions(manifest: Dict[str, Any], partition_column: str = None, partition_start: str = None,
+                       partition_end: str = None) -> Dict[str, Any]:
+    if partition_column and (partition_start or partition_end):
+        manifest = dict(manifest, objects=[
+            obj for obj in manifest['objects']
+            if (value := partition_value(obj['key'], partition_column)) is not None
+            and (partition_start is None or value >= partition_start)
+            and (partition_end is None or value <= partition_end)
+        ])
+    return manifest
+
+
+def manifest_dataset(manifest: Dict[str, Any], file_format: str = 'parquet', partition_column: str = None,
+                     partition_start: str = None, partition_end: str = None):
+    """
+    Arrow dataset over the manifest's Parquet or CSV objects without re-listing S3.
+
+    With partition_column, objects under Hive-style `column=value/` directories outside
+    [partition_start, partition_end] are skipped before any read, and the partition value
+    is a column of the dataset.
+    """
+    import pyarrow.dataset as ds
+    import s3fs
+
+    manifest = _filter_partitions(manifest, partition_column, partition_start, partition_end)
+    paths = manifest_paths(manifest, file_format)
+    if not paths:
+        raise ValueError(f"No {file_format} files in manifest for {manifest['s3_prefix']}")
+    partitioned = partition_column and any(partition_value(obj['key'], partition_column) for obj in manifest['objects'])
+    return ds.dataset([path.replace('s3://', '') for path in paths], format=file_format,
+                      filesystem=s3fs.S3FileSystem(),
+                      partitioning='hive' if partitioned else None,
+                      partition_base_dir=f"{manifest['bucket']}/{manifest['prefix']}" if partitioned else None)
+
+
+def read_manifest_dataframe(manifest: Dict[str, Any], file_format: str = 'parquet', partition_column: str = None,
+                            partition_start: str = None, partition_end: str = None) -> pd.DataFrame:
+    """
+    Read the manifest's objects of one format into a DataFrame without re-listing S3.
+
+    Partitions are filtered as in manifest_dataset.
+    """
+    if file_format == 'parquet':
+        return manifest_dataset(manifest, file_format, partition_column, partition_start, partition_end).to_table().to_pandas()
+    paths = manifest_paths(_filter_partitions(manifest, partition_column, partition_start, partition_end), file_format)
+    if not paths:
+        raise ValueError(f"No {file_format} files in manifest for {manifest['s3_prefix']}")
+    if file_format == 'csv':
+        return pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    return pd.concat([pd.read_json(path, lines=True) for path in paths], ignore_index=True)
+
+
+def processed_inputs_uri(output_path: str) -> str:
+    """Location of the processed-inputs ledger written next to an incremental feature output"""
+    return output_path.rstrip('/') + '/_processed_inputs.json'
+
+
+def load_processed_inputs(output_path: str) -> Optional[Dict[str, str]]:
+    """Input key -> ETag already reflected in a feature output, or None if nothing was processed yet"""
+    bucket, key = parse_s3_uri(processed_inputs_uri(output_path))
+    s3_client = boto3.client('s3')
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)['objects']
+
+
+def plan_incremental_inputs(manifest: Dict[str, Any], processed: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Decide which input objects an incremental feature run has to process.
+
+    New objects are appended. Changed or removed objects invalidate rows already written,
+    so those (and first runs) rebuild the whole output.
+
+    Returns a dict with `write_mode` ('append' or 'overwrite'), `objects` to process and a `reason`.
+    """
+    if processed is None:
+        return {"write_mode": "overwrite", "objects": manifest['objects'], "reason": "first incremental run"}
+
+    current = {obj['key']: obj for obj in manifest['objects']}
+    changed = [key for key, etag in processed.items() if key in current and current[key]['etag'] != etag]
+    removed = [key for key in processed if key not in current]
+    if changed or removed:
+        return {
+            "write_mode": "overwrite",
+            "objects": manifest['objects'],
+            "reason": f"{len(changed)} changed and {len(removed)} removed input objects require a full rebuild"
+        }
+
+    new_objects = [obj for key, obj in current.items() if key not in processed]
+    return {"write_mode": "append", "objects": new_objects, "reason": f"{len(new_objects)} new input objects"}
@@ -0,0 +1,220 @@
+"""
+Versioned cache of loaded and split training data shared by the propensity models.
+
+Training the churn, call and spend_change models used to read and split the same
+feature table once per model. The cache loads a table once per (source, version),
+performs one deterministic train/test split - stratified on the churn label when
+it is present - and stores the rows reordered so the train and test sets are
+contiguous row slices. Every model gets those slices as views of the one cached
+frame and leaves the other targets out by column name instead of copying it.
+
+Requests for an entry that is still loading wait for that load.
+
+Feature tables are read through Arrow datasets: part files are scanned in
+parallel, only the columns training needs are read (bookkeeping columns such as
+job_name are skipped), low-cardinality strings become categoricals and numeric
+columns are downcast before conversion to pandas. Floats are only narrowed when
+float32 holds every value exactly; targets and keys are never downcast.
+
+Configuration (environment variables):
+- TRAINING_DATA_CACHE_ENTRIES: loaded datasets kept in memory (default: 2)
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable, Iterable, List, Optional
+
+
+DEFAULT_CACHE_ENTRIES = 2
+DEFAULT_TEST_SIZE = 0.2
+DEFAULT_RANDOM_STATE = 42
+
+# Columns written by feature engineering for bookkeeping, never used for training
+BOOKKEEPING_COLUMNS = ['feature_engineering_timestamp', 'job_name', 'feature_date']
+
+# String columns with at most this many distinct values (and at most half the rows) load as categoricals
+CATEGORICAL_MAX_UNIQUE = 1024
+
+# Part files read concurrently
+PARALLEL_FRAGMENTS = 16
+
+_INTEGER_TYPES = [pa.int8(), pa.int16(), pa.int32(), pa.int64()]
+
+# Largest integer a float32 represents exactly
+_FLOAT32_EXACT_MAX = 2 ** 24
+
+
+def _downcast_column(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Smallest dtype that holds a column's values; strings with few values become dictionary (categorical)"""
+    column_type = column.type
+    if pa.types.is_floating(column_type):
+        if column_type.bit_width <= 32:
+            return column
+        # Only when every value survives the round trip (nulls compare as NaN)
+        values = column.to_numpy()
+        if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+            return column.cast(pa.float32())
+        return column
+    if pa.types.is_integer(column_type):
+        bounds = pc.min_max(column)
+        low, high = bounds['min'].as_py(), bounds['max'].as_py()
+        if low is None:
+            return column
+        if column.null_count:
+            # pandas holds integers with nulls as floats; pick the float that is still exact
+            return column.cast(pa.float32() if max(abs(low), abs(high)) <= _FLOAT32_EXACT_MAX else pa.float64())
+        for candidate in _INTEGER_TYPES:
+            info = np.iinfo(candidate.to_pandas_dtype())
+            if info.min <= low and high <= info.max:
+                return column.cast(candidate) if candidate.bit_width < column_type.bit_width else column
+        return column
+    if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+        distinct = pc.count_distinct(column).as_py()
+        if distinct <= CATEGORICAL_MAX_UNIQUE and distinct <= max(1, len(column) // 2):
+            return column.dictionary_encode()
+    return column
+
+
+def optimize_table_dtypes(table: pa.Table, keep_columns: Iterable[str] = ()) -> pa.Table:
+    """Downcast numeric columns and dictionary-encode low-cardinality string columns, except keep_columns"""
+    keep = set(keep_columns)
+    return pa.table([column if name in keep else _downcast_column(column)
+                     for name, column in zip(table.column_names, table.columns)], names=table.column_names)
+
+
+def read_training_frame(dataset, columns: Optional[List[str]] = None,
+                        exclude_columns: Iterable[str] = BOOKKEEPING_COLUMNS,
+                        keep_columns: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Read an Arrow dataset into a memory-lean DataFrame.
+
+    Args:
+        dataset: pyarrow dataset (e.g. from s3_manifest.manifest_dataset)
+        columns: Columns to read (optional, all columns if not provided)
+        exclude_columns: Columns never read
+        keep_columns: Columns read with their stored types, e.g. targets and keys
+    """
+    excluded = set(exclude_columns)
+    names = [name for name in dataset.schema.names
+             if name not in excluded and (columns is None or name in columns)]
+    table = dataset.to_table(columns=names, use_threads=True, fragment_readahead=PARALLEL_FRAGMENTS)
+    table = optimize_table_dtypes(table, keep_columns)
+    # Release Arrow buffers column by column while converting, so the table and frame are not both held in full
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+class TrainingSplit:
+    """One loaded dataset with its rows ordered train-first, so both sets are slices"""
+
+    def __init__(self, data: pd.DataFrame, train_size: int, source: Hashable, version: str,
+                 stratify_column: Optional[str] = None):
+        self.data = data
+        self.train_size = train_size
+        self.source = source
+        self.version = version
+        self.stratify_column = stratify_column
+
+    @property
+    def train(self) -> pd.DataFrame:
+        return self.data.iloc[:self.train_size]
+
+    @property
+    def test(self) -> pd.DataFrame:
+        return self.data.iloc[self.train_size:]
+
+    def excluded_columns(self, target: str, targets: List[str]) -> List[str]:
+        """The other targets present in the data, which must not be used as features for `target`"""
+        return [column for column in targets if column != target and column in self.data.columns]
+
+
+def split_dataset(data: pd.DataFrame, stratify_column: str = None, test_size: float = DEFAULT_TEST_SIZE,
+                  random_state: int = DEFAULT_RANDOM_STATE):
+    """
+    Deterministic train/test split returned as (reordered frame, train size, stratified column or None).
+
+    Splitting row positions with the same seed selects the same rows as splitting the frame itself.
+    """
+    from sklearn.model_selection import train_test_split
+
+    positions = np.arange(len(data))
+    stratified = None
+    if stratify_column and stratify_column in data.columns:
+        try:
+            train_positions, test_positions = train_test_split(
+                positions, test_size=test_size, random_state=random_state, stratify=data[stratify_column].to_numpy()
+            )
+            stratified = stratify_column
+        except ValueError as e:
+            print(f"⚠️ Cannot stratify on {stratify_column} ({e}), using a random split")
+    if stratified is None:
+        train_positions, test_positions = train_test_split(positions, test_size=test_size, random_state=random_state)
+
+    ordered = data.take(np.concatenate([train_positions, test_positions]))
+    return ordered, len(train_positions), stratified
+
+
+class TrainingDataCache:
+    """Bounded LRU of TrainingSplits keyed by (source, version), with in-flight load sharing"""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_split(self, source: Hashable, version: str, load: Callable[[], pd.DataFrame],
+                  stratify_column: str = None) -> TrainingSplit:
+        """Return the split of `source` at `version`, calling load() only if it is not cached or loading"""
+        key = (source, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = Future()
+            else:
+                self._entries.move_to_end(key)
+
+        if not owner:
+            if not entry.done():
+                print(f"⏳ Waiting for the shared load of {source}")
+            return entry.result()
+
+        try:
+            data = load()
+            ordered, train_size, stratified = split_dataset(data, stratify_column)
+            del data
+            entry.set_result(TrainingSplit(ordered, train_size, source, version, stratified))
+        except Exception as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.set_exception(e)
+        self._evict()
+        return entry.result()
+
+    def _evict(self):
+        with self._lock:
+            while len(self._entries) > self.max_entries:
+                oldest = next((key for key, entry in self._entries.items() if entry.done()), None)
+                if oldest is None:
+                    break
+                del self._entries[oldest]
+
+    def clear(self):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.done()]:
+                del self._entries[key]
+
+
+_default_cache = None
+
+
+def get_training_data_cache() -> TrainingDataCache:
+    """Return the process-wide TrainingDataCache configured by environment variables"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TrainingDataCache(int(os.environ.get('TRAINING_DATA_CACHE_ENTRIES', DEFAULT_CACHE_ENTRIES)))
+    return _default_cache
@@ -0,0 +1,196 @@
+"""
+Bounded worker pool for propensity model training jobs.
+
+Jobs for different targets (churn, call, spend_change) run concurrently on a
+fixed number of worker threads, so training all three models takes the
+wall-clock time of the slowest rather than the sum. Each job tracks its state
+(queued, running, completed, failed, cancelled), timestamped progress messages
+and a cancellation flag that the training function checks between stages.
+
+Configuration (environment variables):
+- TRAINING_MAX_WORKERS: number of models trained at the same time (default: 3)
+"""
+import os
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+
+
+DEFAULT_TRAINING_MAX_WORKERS = 3
+
+# Progress messages kept per job
+MAX_PROGRESS_MESSAGES = 200
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+class TrainingCancelled(Exception):
+    """Raised inside a training job when it has been cancelled"""
+
+
+class TrainingConflict(Exception):
+    """Raised when a request matches an active job's dedupe key but asks for different parameters"""
+
+    def __init__(self, job: 'TrainingJob', params: Dict[str, Any]):
+        self.job = job
+        differences = ', '.join(f"{name}: {job.params.get(name)!r} requested as {params.get(name)!r}"
+                                for name in sorted(set(job.params) | set(params))
+                                if job.params.get(name) != params.get(name))
+        super().__init__(f"{job.model_type} training job {job.job_id} is already {job.status} with different "
+                         f"parameters ({differences}). Wait for it to finish or cancel it with cancel_training_job first.")
+
+
+class TrainingJob:
+    """State, progress and cancellation flag of one training job"""
+
+    def __init__(self, job_id: str, model_type: str, params: Dict[str, Any], dedupe_key: Any = None):
+        self.job_id = job_id
+        self.model_type = model_type
+        self.params = params
+        self.dedupe_key = dedupe_key if dedupe_key is not None else model_type
+        self.status = 'queued'
+        self.progress: List[Dict[str, str]] = []
+        self.submitted_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future: Optional[Future] = None
+        self._cancel_requested = threading.Event()
+
+    def report(self, message: str):
+        print(message)
+        self.progress.append({"time": datetime.now().isoformat(), "message": message})
+        del self.progress[:-MAX_PROGRESS_MESSAGES]
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set()
+
+    def check_cancelled(self):
+        """Stop the job at a stage boundary if cancellation was requested"""
+        if self.cancel_requested:
+            raise TrainingCancelled(f"Training job {self.job_id} was cancelled")
+
+    def to_dict(self, progress_messages: int = 5) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "model_type": self.model_type,
+            "status": self.status,
+            "cancel_requested": self.cancel_requested,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "latest_progress": self.progress[-progress_messages:] if progress_messages else [],
+            "error": self.error
+        }
+
+
+_current = threading.local()
+
+
+def current_job() -> Optional[TrainingJob]:
+    """The training job running on this thread, if any"""
+    return getattr(_current, 'job', None)
+
+
+def report_progress(message: str):
+    """Print a progress message and record it on the current training job"""
+    job = current_job()
+    if job is not None:
+        job.report(message)
+    else:
+        print(message)
+
+
+class TrainingScheduler:
+    """Runs training jobs on a bounded thread pool and keeps their state for status polling"""
+
+    def __init__(self, max_workers: int = DEFAULT_TRAINING_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training')
+        self._jobs: Dict[str, TrainingJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, model_type: str, train_fn: Callable[..., Dict[str, Any]], dedupe_key: Any = None,
+               **params) -> TrainingJob:
+        """
+        Queue a training job, or return the queued/running job with the same dedupe key (default: model type).
+
+        An active job with the same dedupe key is only returned when it was submitted with the same
+        params; otherwise TrainingConflict is raised naming that job.
+
+        train_fn is called as train_fn(model_type, job=job, **params) and returns the tool response dict.
+        """
+        dedupe_key = dedupe_key if dedupe_key is not None else model_type
+        with self._lock:
+            for job in self._jobs.values():
+                if job.dedupe_key == dedupe_key and job.status in ACTIVE_STATES:
+                    if job.params != params:
+                        raise TrainingConflict(job, params)
+                    return job
+            job = TrainingJob(f"{model_type}-{uuid.uuid4().hex[:8]}", model_type, params, dedupe_key)
+            self._jobs[job.job_id] = job
+            job.future = self._executor.submit(self._run, job, train_fn)
+            return job
+
+    def _run(self, job: TrainingJob, train_fn: Callable[..., Dict[str, Any]]) -> Dict[str, Any]:
+        if job.cancel_requested:
+            job.status = 'cancelled'
+            job.finished_at = datetime.now().isoformat()
+            return {"status": "error", "content": [{"text": f"Training job {job.job_id} was cancelled"}]}
+
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        _current.job = job
+        try:
+            job.result = train_fn(job.model_type, job=job, **job.params)
+            if job.result.get('status') == 'success':
+                job.status = 'completed'
+            else:
+                job.status = 'failed'
+                job.error = ' '.join(item['text'] for item in job.result.get('content', []) if 'text' in item)
+        except TrainingCancelled as e:
+            job.status = 'cancelled'
+            job.result = {"status": "error", "content": [{"text": str(e)}]}
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            job.result = {"status": "error", "content": [{"text": f"Error training model: {str(e)}"}]}
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            _current.job = None
+        return job.result
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; queued jobs never start, running jobs stop at the next stage boundary"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job._cancel_requested.set()
+        if job.future.cancel():
+            job.status = 'cancelled'
+            job.finished_at = datetime.now().isoformat()
+        return True
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[TrainingJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+
+    def active_jobs(self) -> List[TrainingJob]:
+        return [job for job in self.jobs() if job.status in ACTIVE_STATES]
+
+
+_default_scheduler = None
+
+
+def get_training_scheduler() -> TrainingScheduler:
+    """Return the process-wide TrainingScheduler configured by environment variables"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = TrainingScheduler(int(os.environ.get('TRAINING_MAX_WORKERS', DEFAULT_TRAINING_MAX_WORKERS)))
+    return _default_scheduler
@@ -0,0 +1,150 @@
+"""
+Compressed columnar transfer of the customer dataset into the Code Interpreter sandbox.
+
+The CSV extract used to be decoded to a Python string, written to the sandbox
+verbatim and re-parsed by pandas on every analysis. Instead the dataset is
+converted once per version into a zstd-compressed Parquet file in which
+low-cardinality string columns are dictionary-encoded (pandas categoricals).
+The file is written to the sandbox in base64 chunks over several writeFiles
+calls, reassembled there and loaded once into the persistent DataFrame `df`
+that every later execute_python call uses.
+"""
+import os
+import re
+import base64
+from typing import Dict, Iterator, List
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+SANDBOX_DATA_FILE = 'customer_data.parquet'
+
+# String columns with at most this many distinct values in the first block become categoricals
+CATEGORICAL_MAX_UNIQUE = 1024
+
+# CSV bytes parsed per block while converting
+CSV_BLOCK_BYTES = 64 * 1024 ** 2
+
+# CSV column types are inferred from the first block; a column that does not convert in a later block
+# is read again as the next wider type
+_WIDER_TYPES = {pa.null(): pa.float64(), pa.int64(): pa.float64()}
+
+_CONVERSION_ERROR = re.compile(r'In CSV column #(\d+)')
+
+# File bytes per writeFiles call (sent base64-encoded, about a third larger)
+UPLOAD_CHUNK_BYTES = 4 * 1024 ** 2
+
+
+def _categorical_columns(batch: pa.RecordBatch) -> List[str]:
+    """String columns of the first block that have few distinct values"""
+    names = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            distinct = pc.count_distinct(column).as_py()
+            if 0 < distinct <= CATEGORICAL_MAX_UNIQUE and distinct <= max(1, batch.num_rows // 2):
+                names.append(name)
+    return names
+
+
+def _write_parquet(source_path: str, partial: str, column_types: Dict[str, pa.DataType]) -> List[str]:
+    """Stream the CSV into a Parquet file, returning the categorical columns"""
+    reader = pa_csv.open_csv(source_path, read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+                             convert_options=pa_csv.ConvertOptions(column_types=column_types))
+    writer = None
+    categorical = set()
+    try:
+        for batch in reader:
+            if writer is None:
+                categorical = set(_categorical_columns(batch))
+                fields = [pa.field(field.name, pa.dictionary(pa.int32(), field.type)) if field.name in categorical else field
+                          for field in batch.schema]
+                schema = pa.schema(fields)
+                writer = pq.ParquetWriter(partial, schema, compression='zstd')
+            columns = [column.dictionary_encode() if name in categorical else column
+                       for name, column in zip(batch.schema.names, batch.columns)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"No rows in {source_path}")
+    return sorted(categorical)
+
+
+def convert_to_parquet(source_path: str, parquet_path: str) -> str:
+    """
+    Convert a local CSV file to compressed Parquet with dictionary-encoded categoricals.
+
+    The CSV is streamed block by block, so memory does not grow with the file.
+    Column types come from the first block; when a later block holds values
+    that do not fit (e.g. a column empty at first, or decimals in an integer
+    column), the conversion is redone with that column widened to float or string.
+    Parquet input is used as is.
+    """
+    if source_path.endswith('.parquet'):
+        return source_path
+    if os.path.exists(parquet_path):
+        return parquet_path
+
+    partial = f"{parquet_path}.partial"
+    column_types: Dict[str, pa.DataType] = {}
+    while True:
+        try:
+            categorical = _write_parquet(source_path, partial, column_types)
+            break
+        except pa.ArrowInvalid as e:
+            match = _CONVERSION_ERROR.search(str(e))
+            if not match:
+                raise
+            field = pa_csv.open_csv(source_path, read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+                                    convert_options=pa_csv.ConvertOptions(column_types=column_types)
+                                    ).schema.field(int(match.group(1)))
+            if pa.types.is_string(field.type):
+                raise
+            column_types[field.name] = _WIDER_TYPES.get(field.type, pa.string())
+            print(f"🔁 Column '{field.name}' does not fit {field.type} past the first CSV block; "
+                  f"converting again as {column_types[field.name]}")
+    os.replace(partial, parquet_path)
+
+    print(f"🗜️ Converted {os.path.getsize(source_path) / 1024 ** 2:.1f} MB CSV to "
+          f"{os.path.getsize(parquet_path) / 1024 ** 2:.1f} MB Parquet ({len(categorical)} categorical columns)")
+    return parquet_path
+
+
+def encode_chunks(path: str, chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> Iterator[str]:
+    """Base64 text of consecutive chunks of a file"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            yield base64.b64encode(chunk).decode('ascii')
+
+
+def chunk_path(index: int, file_name: str = SANDBOX_DATA_FILE) -> str:
+    return f"{file_name}.b64.part{index:05d}"
+
+
+def sandbox_assemble_code(chunks: int, file_name: str = SANDBOX_DATA_FILE) -> str:
+    """Python run in the sandbox to reassemble uploaded chunks into file_name"""
+    return f"""
+import os, base64
+with open({file_name!r}, 'wb') as out:
+    for i in range({chunks}):
+        part = f"{file_name}.b64.part{{i:05d}}"
+        with open(part) as f:
+            out.write(base64.b64decode(f.read()))
+        os.remove(part)
+"""
+
+
+def sandbox_load_code(chunks: int) -> str:
+    """Python run in the sandbox to reassemble the uploaded dataset and load it into `df`"""
+    return sandbox_assemble_code(chunks) + f"""
+import pandas as pd
+df = pd.read_parquet({SANDBOX_DATA_FILE!r})
+print(f"Loaded {{len(df)}} rows x {{df.shape[1]}} columns into df ({{df.memory_usage(deep=True).sum() / 1024 ** 2:.1f}} MB)")
+"""
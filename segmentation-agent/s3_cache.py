@@ -0,0 +1,92 @@
+"""
+On-disk cache of S3 objects keyed by ETag for the segmentation agent.
+
+Every invocation used to download the full customer extract from S3. The cache
+asks S3 for the object's current ETag (a HEAD request) and keeps downloaded
+objects on local disk under that ETag, so a dataset is fetched from S3 once per
+version and new sandboxes are filled from the local copy. Objects are streamed
+to disk (multipart for large files), and the least recently used files are
+removed when the cache grows beyond its size limit.
+
+Configuration (environment variables):
+- S3_CACHE_DIR: cache directory (default: /tmp/segmentation-s3-cache)
+- S3_CACHE_MAX_BYTES: size limit of the cache directory (default: 10 GiB)
+"""
+import os
+import hashlib
+import threading
+from typing import NamedTuple
+
+import boto3
+
+
+DEFAULT_CACHE_DIR = '/tmp/segmentation-s3-cache'
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+
+class DatasetVersion(NamedTuple):
+    """An S3 object at one version"""
+    bucket: str
+    key: str
+    etag: str
+
+
+class S3ObjectCache:
+    """Local copies of S3 objects, one file per (bucket, key, ETag)"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._s3 = boto3.client('s3')
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def version(self, bucket: str, key: str) -> DatasetVersion:
+        """Current version of an S3 object (one HEAD request)"""
+        head = self._s3.head_object(Bucket=bucket, Key=key)
+        return DatasetVersion(bucket, key, head['ETag'].strip('"'))
+
+    def path_for(self, version: DatasetVersion) -> str:
+        name = hashlib.sha256(f"{version.bucket}/{version.key}".encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{name}-{version.etag}{os.path.splitext(version.key)[1]}")
+
+    def fetch(self, version: DatasetVersion) -> str:
+        """Local path of the object at `version`, downloading it only if it is not cached"""
+        path = self.path_for(version)
+        with self._lock:
+            if os.path.exists(path):
+                # Mark as recently used for eviction
+                os.utime(path)
+                print(f"📦 Using cached s3://{version.bucket}/{version.key} ({os.path.getsize(path) / 1024 ** 2:.1f} MB)")
+                return path
+
+            print(f"⬇️ Downloading s3://{version.bucket}/{version.key} into the local cache")
+            partial = f"{path}.partial"
+            self._s3.download_file(version.bucket, version.key, partial)
+            os.replace(partial, path)
+            self._evict(keep=path)
+            return path
+
+    def _evict(self, keep: str):
+        """Remove least recently used files until the cache fits its size limit (caller holds the lock)"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path) and path != keep and not name.endswith('.partial'):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files) + os.path.getsize(keep)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            print(f"🧹 Removed {os.path.basename(path)} from the local S3 cache")
+
+
+def create_s3_cache() -> S3ObjectCache:
+    """S3ObjectCache configured by environment variables"""
+    return S3ObjectCache(
+        cache_dir=os.environ.get('S3_CACHE_DIR', DEFAULT_CACHE_DIR),
+        max_bytes=int(os.environ.get('S3_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    )
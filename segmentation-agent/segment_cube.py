@@ -0,0 +1,134 @@
+"""
+Precomputed aggregation cube for common segmentation questions.
+
+Most questions ("customers by location", "churn analysis", "spending by
+demographics") are group-bys over a handful of customer dimensions. When a
+dataset is loaded, the cube groups it once by every dimension and keeps the
+customer count and each numeric measure's sum and non-null count per cell. Every
+combination of dimensions is then rolled up from those cells. Because counts and
+sums are additive, any breakdown or filter over the dimensions - with totals,
+means and rates (means of 0/1 columns such as churn) - is answered exactly from
+the cube, without running code in the sandbox.
+"""
+from itertools import combinations
+from typing import Dict, List, Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+DIMENSIONS = ['geography', 'product_tier', 'contract_lifecycle', 'billing_preference', 'vulnerability']
+
+# Measures reported when a question does not name any
+DEFAULT_MEASURES = ['churn_after_migration', 'average_monthly_spend', 'change_in_spend', 'tenure_months',
+                    'number_of_complaints']
+
+# Numeric columns that identify rows rather than measure them
+EXCLUDED_MEASURES = ['customer_id']
+
+MISSING_VALUE = 'Unknown'
+
+
+def _as_dimension(values: pd.Series) -> pd.Series:
+    """Categorical dimension column with missing values labelled"""
+    values = values.astype('category')
+    if values.isna().any():
+        values = values.cat.add_categories(MISSING_VALUE).fillna(MISSING_VALUE)
+    return values
+
+
+class SegmentCube:
+    """Additive cells of a dataset over DIMENSIONS, with every rollup precomputed"""
+
+    def __init__(self, cells: pd.DataFrame, dimensions: List[str], measures: List[str], binary_measures: List[str]):
+        # Cells are few; plain string labels keep rollups sorted and filters simple
+        cells = cells.astype({dimension: str for dimension in dimensions})
+        self.dimensions = dimensions
+        self.measures = measures
+        self.binary_measures = binary_measures
+        self.rows = int(cells['customers'].sum())
+        self.values = {dimension: sorted(cells[dimension].unique()) for dimension in dimensions}
+
+        additive = ['customers'] + [f"{measure}__sum" for measure in measures] + [f"{measure}__n" for measure in measures]
+        self.cuboids: Dict[tuple, pd.DataFrame] = {}
+        for size in range(len(dimensions) + 1):
+            for group in combinations(dimensions, size):
+                if group:
+                    self.cuboids[group] = cells.groupby(list(group))[additive].sum().reset_index()
+                else:
+                    self.cuboids[group] = cells[additive].sum().to_frame().T
+
+    def describe(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "dimensions": self.values, "measures": self.measures,
+                "rate_measures": self.binary_measures}
+
+    def query(self, group_by: Optional[List[str]] = None, measures: Optional[List[str]] = None,
+              filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """
+        Aggregate the cube.
+
+        Args:
+            group_by: Dimensions to break down by (none for the overall total)
+            measures: Numeric columns to report (default: DEFAULT_MEASURES present in the data)
+            filters: Dimension -> value or list of values to keep
+        """
+        group_by = list(group_by or [])
+        filters = filters or {}
+        unknown = [name for name in group_by + list(filters) if name not in self.dimensions]
+        if unknown:
+            raise ValueError(f"Unknown dimensions {unknown}; available: {self.dimensions}")
+        measures = list(measures or [measure for measure in DEFAULT_MEASURES if measure in self.measures] or self.measures)
+        unknown = [name for name in measures if name not in self.measures]
+        if unknown:
+            raise ValueError(f"Unknown measures {unknown}; available: {self.measures}")
+
+        # Smallest precomputed rollup that still has every grouped or filtered dimension
+        table = self.cuboids[tuple(d for d in self.dimensions if d in group_by or d in filters)]
+        for dimension, value in filters.items():
+            allowed = [str(v) for v in (value if isinstance(value, (list, tuple, set)) else [value])]
+            table = table[table[dimension].isin(allowed)]
+        table = table.drop(columns=[d for d in self.dimensions if d in table.columns and d not in group_by])
+        if group_by:
+            table = table.groupby(group_by).sum()
+        else:
+            table = table.sum().to_frame(name='all customers').T
+
+        result = pd.DataFrame({'customers': table['customers'].astype(int)}, index=table.index)
+        result['share'] = result['customers'] / max(int(result['customers'].sum()), 1)
+        for measure in measures:
+            mean = table[f"{measure}__sum"] / table[f"{measure}__n"].where(table[f"{measure}__n"] > 0)
+            if measure in self.binary_measures:
+                result[f"{measure}_rate"] = mean
+            else:
+                result[f"{measure}_total"] = table[f"{measure}__sum"]
+                result[f"{measure}_mean"] = mean
+        return result
+
+
+def build_cube(data_path: str, dimensions: List[str] = DIMENSIONS) -> SegmentCube:
+    """Build the cube of a Parquet dataset, reading only the dimension and numeric columns"""
+    schema = pq.read_schema(data_path)
+    dimensions = [name for name in dimensions if name in schema.names]
+    if not dimensions:
+        raise ValueError(f"None of the cube dimensions {DIMENSIONS} are in the data")
+    measures = [field.name for field in schema
+                if field.name not in dimensions and field.name not in EXCLUDED_MEASURES
+                and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_boolean(field.type))]
+    data = pd.read_parquet(data_path, columns=dimensions + measures)
+    binary_measures = [name for name in measures if data[name].dropna().isin([0, 1]).all()]
+    for dimension in dimensions:
+        data[dimension] = _as_dimension(data[dimension])
+
+    # One grouping of the rows into base cells; every other aggregation is a rollup of the cells
+    grouped = data.groupby(dimensions, observed=True)
+    cells = pd.concat([
+        grouped.size().rename('customers'),
+        grouped[measures].sum().add_suffix('__sum'),
+        grouped[measures].count().add_suffix('__n')
+    ], axis=1).reset_index()
+
+    cube = SegmentCube(cells, dimensions, measures, binary_measures)
+    print(f"🧊 Built segment cube: {cube.rows} customers, {len(cells)} cells, "
+          f"{len(cube.cuboids)} rollups over {dimensions}")
+    return cube
@@ -1,75 +1,233 @@
 import os
 os.environ["BYPASS_TOOL_CONSENT"] = "true"
 
-from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter
 from strands import Agent, tool
 from strands.models import BedrockModel
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 import json
-import boto3
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List
+from session_pool import create_sandbox_pool
+from s3_cache import create_s3_cache, DatasetVersion
+from columnar import SANDBOX_DATA_FILE, convert_to_parquet, encode_chunks, chunk_path, sandbox_assemble_code, sandbox_load_code
+from segment_cube import build_cube, DIMENSIONS
+from segmentation_engine import kmeans_segmentation, rfm_segmentation, DEFAULT_SEGMENTS, ENTITY_KEY, RANDOM_SEED
 
-# Initialize Code Interpreter with configurable region
+# Warm Code Interpreter sandboxes, reused across invocations of the same chat and dataset
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
-code_client = CodeInterpreter(AWS_REGION)
+sandbox_pool = create_sandbox_pool(AWS_REGION)
 
-def load_s3_data(bucket: str = None, key: str = None) -> str:
-    """Load customer data from S3 and return as string"""
+# Local copies of S3 datasets keyed by ETag, shared by all sandboxes
+s3_cache = create_s3_cache()
+
+# Segment assignments written into the sandbox by segment_customers
+SEGMENTS_FILE = 'customer_segments.parquet'
+
+# Aggregation cubes of recently loaded dataset versions
+segment_cubes = {}
+MAX_SEGMENT_CUBES = 4
+
+# Sandbox, dataset and cube of the invocation being handled; invocations are serialised because the agent is shared
+active_sandbox = None
+active_dataset = None
+active_cube = None
+invocation_lock = threading.Lock()
+
+def load_s3_data(bucket: str = None, key: str = None, version: DatasetVersion = None) -> str:
+    """Load customer data from S3 (through the local object cache) and return the path of its Parquet form"""
     try:
-        s3 = boto3.client('s3')
         # Use provided parameters or environment variables
         bucket = bucket or os.environ.get('S3_BUCKET')
         key = key or os.environ.get('S3_KEY', 'data/customer_data.csv')
+        version = version or s3_cache.version(bucket, key)
         
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        return obj['Body'].read().decode('utf-8')
+        # Converted once per version and kept next to the cached download
+        local_path = s3_cache.fetch(version)
+        return convert_to_parquet(local_path, f"{local_path}.parquet")
     except Exception as e:
         print(f"Error loading S3 data: {e}")
         return ""
 
-def call_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-    """Helper function to invoke sandbox tools"""
-    response = code_client.invoke(tool_name, arguments)
-    for event in response["stream"]:
-        return json.dumps(event["result"])
+def upload_to_sandbox(local_path: str, file_name: str):
+    """Write a local file to the sandbox in chunks, one writeFiles call each; returns the chunk count or None"""
+    chunks = 0
+    for text in encode_chunks(local_path):
+        result = active_sandbox.call("writeFiles", {"content": [{"path": chunk_path(chunks, file_name), "text": text}]})
+        if not result or result.get("isError", False):
+            print(f"Error writing files to sandbox: {result}")
+            return None
+        chunks += 1
+    return chunks
+
+def load_segment_cube(version: DatasetVersion):
+    """Aggregation cube of a dataset version, built once when the version is first loaded"""
+    if version not in segment_cubes:
+        data_path = load_s3_data(version.bucket, version.key, version)
+        if not data_path:
+            return None
+        segment_cubes[version] = build_cube(data_path)
+        while len(segment_cubes) > MAX_SEGMENT_CUBES:
+            segment_cubes.pop(next(iter(segment_cubes)))
+    return segment_cubes[version]
 
 def setup_sandbox_data(bucket: str = None, key: str = None):
-    """Load S3 data and write to sandbox environment"""
-    # Load customer data from S3
-    data_file_content = load_s3_data(bucket, key)
-    
-    if not data_file_content:
-        return False
+    """Write the S3 data to the sandbox unless it already holds the current version"""
+    global active_dataset, active_cube
+    bucket = bucket or os.environ.get('S3_BUCKET')
+    key = key or os.environ.get('S3_KEY', 'data/customer_data.csv')
+    try:
+        version = s3_cache.version(bucket, key)
+    except Exception as e:
+        print(f"Error loading S3 data: {e}")
         return False
+    active_dataset = version
+    
+    # Precomputed aggregates answer common group-by questions without the sandbox
+    try:
+        active_cube = load_segment_cube(version)
+    except Exception as e:
+        print(f"⚠️ Could not build segment cube: {e}")
+        active_cube = None
     
-    # Prepare files for sandbox environment
-    files_to_create = [{
-        "path": "customer_data.csv",
-        "text": data_file_content
-    }]
+    if active_sandbox.dataset_version == version:
+        print(f"♻️ Sandbox already holds s3://{bucket}/{key} (ETag {version.etag})")
+        return True
     
-    # Write files to sandbox
-    writing_files = call_tool("writeFiles", {"content": files_to_create})
-    print("Writing files result:")
-    print(writing_files)
+    # Load customer data from S3 as compressed Parquet
+    data_path = load_s3_data(bucket, key, version)
     
-    # Verify files were created
-    listing_files = call_tool("listFiles", {"path": ""})
-    print("\nFiles in sandbox:")
-    print(listing_files)
+    if not data_path:
+        return False
+    
+    # Write the file to the sandbox in chunks
+    chunks = upload_to_sandbox(data_path, SANDBOX_DATA_FILE)
+    if chunks is None:
+        return False
     
+    # Reassemble and load it once into the persistent DataFrame df
+    result = active_sandbox.call("executeCode", {
+        "code": sandbox_load_code(chunks),
+        "language": "python",
+        "clearContext": False
+    })
+    if not result or result.get("isError", False):
+        print(f"Error loading data in sandbox: {result}")
+        return False
+    print(result["content"][0].get("text", "") if result.get("content") else "")
+    
+    active_sandbox.dataset_version = version
+    print(f"✅ Wrote s3://{bucket}/{key} (ETag {version.etag}) to the sandbox in {chunks} chunks")
     return True
 
 # System prompt following the sample pattern
-SYSTEM_PROMPT = """You are a customer segmentation analyst. Use the execute_python tool to analyze customer data and create visualizations.
+SYSTEM_PROMPT = """You are a customer segmentation analyst. Use the query_segment_cube tool for counts, totals, averages and churn rates by customer dimensions, the segment_customers tool to create customer segments, and the execute_python tool for any other analysis and for visualizations.
 
 Key Guidelines:
-1. The customer data is available as 'customer_data.csv' in the sandbox
-2. Use pandas for data analysis and plotly for visualizations
-3. Always execute code to validate your analysis
-4. Provide clear insights and recommendations
+1. Answer breakdowns by geography, product_tier, contract_lifecycle, billing_preference and vulnerability with query_segment_cube first; it returns exact results instantly
+2. Create segments with segment_customers (k-means or RFM) rather than writing clustering code; it is deterministic and adds a `segment` column to df
+3. The customer data is already loaded as the pandas DataFrame `df` (low-cardinality text columns are categoricals); use it directly instead of reading files. It is also saved as 'customer_data.parquet'
+4. Use pandas for data analysis and plotly for visualizations
+5. Always execute code to validate your analysis
+6. Provide clear insights and recommendations
 
-Available tool: execute_python - Run Python code in the sandbox environment."""
+Available tools:
+- query_segment_cube - Precomputed aggregates by customer dimensions
+- segment_customers - Deterministic k-means or RFM segmentation with segment profiles
+- execute_python - Run Python code in the sandbox environment."""
+
+@tool
+def query_segment_cube(group_by: List[str] = None, measures: List[str] = None, filters: Dict[str, Any] = None) -> str:
+    """
+    Answer aggregate questions from the precomputed segment cube without running code.
+    
+    Returns the number and share of customers and, per measure, the total and mean
+    (or the rate, for 0/1 columns such as churn_after_migration) for each group.
+    
+    Args:
+        group_by: Dimensions to break down by: geography, product_tier, contract_lifecycle,
+            billing_preference, vulnerability (none for the overall total)
+        measures: Numeric columns to report, e.g. churn_after_migration, average_monthly_spend,
+            change_in_spend (default: key churn, spend, tenure and complaint measures)
+        filters: Dimension -> value or list of values to keep, e.g. {"vulnerability": "Yes"}
+    """
+    if active_cube is None:
+        return f"Segment cube not available for this dataset (needs columns among {DIMENSIONS}); use execute_python instead"
+    
+    try:
+        result = active_cube.query(group_by, measures, filters)
+    except ValueError as e:
+        return f"Error: {e}. Dimension values: {json.dumps(active_cube.describe()['dimensions'])}"
+    
+    print(f"\n🧊 Cube query: group_by={group_by}, measures={measures}, filters={filters}")
+    return f"{active_cube.rows} customers in dataset\n" + result.round(4).to_string()
+
+@tool
+def segment_customers(method: str = "kmeans", n_segments: int = DEFAULT_SEGMENTS, features: List[str] = None,
+                      recency_column: str = None, frequency_column: str = None, monetary_column: str = None,
+                      seed: int = RANDOM_SEED) -> str:
+    """
+    Segment all customers with the built-in deterministic segmentation engine.
+    
+    Returns per-segment profiles (size, share and the mean of each feature and outcome such as
+    churn_after_migration). Afterwards the sandbox DataFrame df has a `segment` column (plus
+    r_score, f_score, m_score and rfm_score for RFM) for further analysis and charts.
+    
+    Args:
+        method: "kmeans" (clusters on standardised numeric features) or "rfm" (recency/frequency/monetary
+            quintile scores banded by total score, segment 0 = highest value)
+        n_segments: Number of segments
+        features: Numeric columns to cluster on for kmeans (default: behavioural columns such as age,
+            tenure_months, average_monthly_spend, products, complaints, faults and payment history)
+        recency_column: RFM column where lower is better, e.g. days since last contact
+        frequency_column: RFM frequency column, e.g. contact_frequency_pre_migration
+        monetary_column: RFM monetary column, e.g. average_monthly_spend
+        seed: Random seed; the same seed gives the same segments
+    """
+    if active_dataset is None:
+        return "Error: No customer data loaded"
+    
+    data_path = load_s3_data(active_dataset.bucket, active_dataset.key, active_dataset)
+    if not data_path:
+        return "Error: Could not load customer data from S3"
+    
+    print(f"\n🧩 Segmenting customers: method={method}, n_segments={n_segments}, seed={seed}")
+    try:
+        if method == "kmeans":
+            result = kmeans_segmentation(data_path, features, n_segments, seed)
+        elif method == "rfm":
+            result = rfm_segmentation(data_path, recency_column, frequency_column, monetary_column, n_segments, seed)
+        else:
+            return f"Error: Unknown method '{method}'; use 'kmeans' or 'rfm'"
+    except ValueError as e:
+        return f"Error: {e}"
+    
+    # Attach the segments to df in the sandbox. Earlier execute_python calls may have filtered or sorted df,
+    # so rows are matched on the entity key; by position only when there is no unique key
+    assignments = result.write_assignments(data_path, f"{data_path}.segments.parquet")
+    chunks = upload_to_sandbox(assignments, SEGMENTS_FILE)
+    attached = chunks is not None and active_sandbox.call("executeCode", {
+        "code": sandbox_assemble_code(chunks, SEGMENTS_FILE) + f"""
+import pandas as pd
+segments = pd.read_parquet({SEGMENTS_FILE!r})
+key = {ENTITY_KEY!r}
+if key in segments.columns and key in df.columns and segments[key].is_unique:
+    segments = segments.set_index(key)
+    for column in {['segment'] + list(result.scores)!r}:
+        df[column] = df[key].map(segments[column])
+elif len(segments) == len(df):
+    for column in {['segment'] + list(result.scores)!r}:
+        df[column] = segments[column].to_numpy()
+else:
+    raise ValueError(f"df has {{len(df)}} rows, the segments {{len(segments)}}, and there is no unique {{key}} to match them on")
+""",
+        "language": "python",
+        "clearContext": False
+    })
+    note = ("df now has a `segment` column" + (" and RFM score columns" if result.scores else "")
+            if attached and not attached.get("isError", False) else "Segments could not be attached to df")
+    
+    summary = {key: value for key, value in result.summary.items() if key != "centres_scaled"}
+    return f"{json.dumps(summary, default=str)}\n{note}\n" + result.profiles.round(3).to_string()
 
 @tool
 def execute_python(code: str, description: str = "") -> str:
@@ -81,19 +239,13 @@ def execute_python(code: str, description: str = "") -> str:
     print(f"\nGenerated Code: {code}")
     
     try:
-        # Execute code using Code Interpreter client
-        response = code_client.invoke("executeCode", {
+        # Execute code in the invocation's warm sandbox (first streamed result)
+        result = active_sandbox.call("executeCode", {
             "code": code,
             "language": "python",
             "clearContext": False
         })
         
-        # Process the streaming response
-        result = None
-        for event in response["stream"]:
-            result = event["result"]
-            break  # Take the first result
-        
         if result:
             # Extract the actual output from the result
             if result.get("isError", False):
@@ -121,7 +273,7 @@ model = BedrockModel(model_id=model_id)
 
 agent = Agent(
     model=model,
-    tools=[execute_python],
+    tools=[query_segment_cube, segment_customers, execute_python],
     system_prompt=SYSTEM_PROMPT,
     callback_handler=None
 )
@@ -132,34 +284,41 @@ app = BedrockAgentCoreApp()
 @app.entrypoint
 def agent_invocation(payload, context):
     """Handler for agent invocation following the sample pattern"""
-    try:
-        # Start code interpreter session with extended timeout
-        code_client.start(session_timeout_seconds=1200)
-        
-        # Get S3 parameters from payload
-        s3_bucket = payload.get("s3_bucket")
-        s3_key = payload.get("s3_key")
-        
-        # Setup sandbox data from S3
-        if not setup_sandbox_data(s3_bucket, s3_key):
-            return {"result": "Error: Could not load customer data from S3"}
-        
-        # Get user message
-        user_message = payload.get("prompt", "Show me the first 10 rows of customer data")
-        
-        # Invoke agent synchronously
-        result = agent(user_message)
-        
-        return {"result": result.message}
-        
-    except Exception as e:
-        return {"result": f"Error processing request: {str(e)}"}
-    finally:
-        # Clean up code interpreter session
+    global active_sandbox, active_dataset, active_cube
+    
+    # Get S3 parameters from payload
+    s3_bucket = payload.get("s3_bucket") or os.environ.get('S3_BUCKET')
+    s3_key = payload.get("s3_key") or os.environ.get('S3_KEY', 'data/customer_data.csv')
+    session_id = payload.get("session_id") or getattr(context, "session_id", None) or "default-session"
+    
+    with invocation_lock:
+        sandbox = None
         try:
-            code_client.stop()
-        except:
-            pass
+            # Reuse the warm sandbox of this chat and dataset, or start one
+            sandbox = sandbox_pool.acquire(session_id, (s3_bucket, s3_key))
+            active_sandbox = sandbox
+            
+            # Setup sandbox data from S3 unless this sandbox already holds the current version
+            if not setup_sandbox_data(s3_bucket, s3_key):
+                return {"result": "Error: Could not load customer data from S3"}
+            
+            # Get user message
+            user_message = payload.get("prompt", "Show me the first 10 rows of customer data")
+            
+            # Invoke agent synchronously
+            result = agent(user_message)
+            
+            return {"result": result.message}
+            
+        except Exception as e:
+            return {"result": f"Error processing request: {str(e)}"}
+        finally:
+            # Keep the sandbox warm for the next question
+            active_sandbox = None
+            active_dataset = None
+            active_cube = None
+            if sandbox is not None:
+                sandbox_pool.release(sandbox)
 
 if __name__ == "__main__":
     app.run()
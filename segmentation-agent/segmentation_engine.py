@@ -0,0 +1,388 @@
+"""
+Built-in deterministic customer segmentation for the segmentation agent.
+
+Segmenting through execute_python meant the model wrote new pandas code for
+every request, recomputed everything from scratch and produced different
+segments from run to run. This engine works on NumPy arrays streamed from the
+dataset's Parquet file in chunks, so memory is bounded by the chunk size and the
+per-row segment labels rather than the dataset:
+
+- k-means: features are standardised with running means and variances, centres
+  are initialised with k-means++ on a reservoir sample and refined with
+  mini-batch k-means passes over the chunks
+- RFM: recency, frequency and monetary columns are scored 1-5 by quintile (edges
+  from the reservoir sample) and customers are banded by their total score
+
+Each run ends with a pass that assigns every customer and builds per-segment
+profiles. All randomness comes from one generator seeded by the caller, so the
+same data, parameters and seed always give the same segments.
+"""
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List, Any, Iterator, Optional
+
+
+DEFAULT_SEGMENTS = 5
+RANDOM_SEED = 42
+ENTITY_KEY = 'customer_id'
+
+# Rows read from Parquet at a time
+CHUNK_ROWS = 100_000
+
+# Rows per mini-batch k-means update
+MINI_BATCH_SIZE = 2_048
+
+# Rows kept for k-means++ initialisation and RFM quintiles
+SAMPLE_ROWS = 50_000
+
+# k-means++ initialisations refined on the sample; the one with the lowest inertia is kept
+INIT_RUNS = 10
+SAMPLE_ITERATIONS = 100
+
+# Passes over the data; stop early once no centre moves more than TOLERANCE (in standard deviations)
+MAX_PASSES = 5
+TOLERANCE = 1e-2
+
+# Behavioural columns clustered on by default, when present
+DEFAULT_FEATURES = ['age', 'tenure_months', 'average_monthly_spend', 'product_broadband', 'product_tv',
+                    'product_voice', 'contact_frequency_pre_migration', 'number_of_complaints',
+                    'number_of_faults', 'late_payments', 'missed_payments']
+
+# Outcomes reported in segment profiles but not clustered on
+DEFAULT_PROFILE_COLUMNS = ['churn_after_migration', 'change_in_spend', 'change_in_products',
+                           'number_of_calls_post_migration']
+
+
+def numeric_columns(data_path: str) -> List[str]:
+    """Numeric and boolean columns of a Parquet file"""
+    return [field.name for field in pq.read_schema(data_path)
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_boolean(field.type)]
+
+
+def iter_chunks(data_path: str, columns: List[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+    """float64 matrices of consecutive rows of the given columns (missing values as NaN)"""
+    for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunk_rows, columns=columns):
+        yield np.column_stack([batch.column(i).cast(pa.float64()).to_numpy(zero_copy_only=False)
+                               for i in range(batch.num_columns)])
+
+
+class RunningScaler:
+    """Per-column mean and variance accumulated chunk by chunk, ignoring NaN"""
+
+    def __init__(self, columns: int):
+        self.count = np.zeros(columns)
+        self.mean = np.zeros(columns)
+        self.m2 = np.zeros(columns)
+
+    def partial_fit(self, chunk: np.ndarray):
+        valid = ~np.isnan(chunk)
+        count = valid.sum(axis=0)
+        mean = np.where(count > 0, np.nansum(chunk, axis=0) / np.maximum(count, 1), 0.0)
+        m2 = np.nansum((chunk - mean) ** 2, axis=0)
+        # Chan et al. combination of two sets of moments
+        total = self.count + count
+        delta = mean - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+        self.count = total
+
+    @property
+    def scale(self) -> np.ndarray:
+        std = np.sqrt(self.m2 / np.maximum(self.count, 1))
+        return np.where(std > 0, std, 1.0)
+
+    def transform(self, chunk: np.ndarray) -> np.ndarray:
+        """Standardised values; missing values become the mean (0)"""
+        scaled = (chunk - self.mean) / self.scale
+        return np.nan_to_num(scaled, nan=0.0)
+
+
+class Reservoir:
+    """Uniform sample of fixed size over a stream of rows (algorithm R, vectorised per chunk)"""
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        self.size = size
+        self.rng = rng
+        self.sample = None
+        self.seen = 0
+
+    def add(self, rows: np.ndarray):
+        if self.sample is None:
+            self.sample = np.empty((0, rows.shape[1]))
+        fill = min(self.size - len(self.sample), len(rows))
+        if fill:
+            self.sample = np.vstack([self.sample, rows[:fill]])
+        rest = rows[fill:]
+        if len(rest):
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = (self.rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+            keep = slots < self.size
+            self.sample[slots[keep]] = rest[keep]
+        self.seen += len(rows)
+
+
+def nearest_centres(points: np.ndarray, centres: np.ndarray):
+    """Index of and squared distance to the nearest centre for every point"""
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centres.T + (centres ** 2).sum(axis=1)[None, :]
+    labels = distances.argmin(axis=1)
+    return labels, np.maximum(distances[np.arange(len(points)), labels], 0.0)
+
+
+def kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Greedy k-means++ seeding: each next centre is the best of a few candidates drawn with
+    probability proportional to squared distance from the centres chosen so far.
+    """
+    trials = 2 + int(np.log(k))
+    centres = [points[rng.integers(len(points))]]
+    closest = ((points - centres[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            candidates = rng.integers(len(points), size=trials)
+        else:
+            candidates = rng.choice(len(points), size=trials, p=closest / total)
+        distances = np.minimum(closest[None, :], ((points[None, :, :] - points[candidates][:, None, :]) ** 2).sum(axis=2))
+        best = distances.sum(axis=1).argmin()
+        centres.append(points[candidates[best]])
+        closest = distances[best]
+    return np.array(centres)
+
+
+def lloyd(points: np.ndarray, centres: np.ndarray, iterations: int):
+    """Full-batch k-means on in-memory points; returns centres, labels and mean squared distance"""
+    for _ in range(iterations):
+        labels, _ = nearest_centres(points, centres)
+        counts = np.bincount(labels, minlength=len(centres))
+        sums = np.eye(len(centres))[labels].T @ points
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centres)
+        if np.allclose(updated, centres):
+            break
+        centres = updated
+    labels, distances = nearest_centres(points, centres)
+    return centres, labels, distances.mean()
+
+
+class SegmentationResult:
+    """Per-row segment labels, extra per-row scores, per-segment profiles and a run summary"""
+
+    def __init__(self, labels: np.ndarray, profiles: pd.DataFrame, summary: Dict[str, Any],
+                 scores: Optional[Dict[str, np.ndarray]] = None):
+        self.labels = labels
+        self.profiles = profiles
+        self.summary = summary
+        self.scores = scores or {}
+
+    def _columns(self, start: int, stop: int) -> List[pa.Array]:
+        return [pa.array(self.labels[start:stop])] + [pa.array(values[start:stop]) for values in self.scores.values()]
+
+    def write_assignments(self, data_path: str, output_path: str, entity_key: str = ENTITY_KEY) -> str:
+        """Write the entity key (if present), segment and scores of every row, in the data's row order"""
+        schema = pq.read_schema(data_path)
+        has_key = entity_key in schema.names
+        fields = ([schema.field(entity_key)] if has_key else []) + [pa.field('segment', pa.int16())]
+        fields += [pa.field(name, pa.int8()) for name in self.scores]
+        with pq.ParquetWriter(output_path, pa.schema(fields), compression='zstd') as writer:
+            if has_key:
+                start = 0
+                for batch in pq.ParquetFile(data_path).iter_batches(batch_size=CHUNK_ROWS, columns=[entity_key]):
+                    stop = start + batch.num_rows
+                    writer.write_table(pa.Table.from_arrays([batch.column(0)] + self._columns(start, stop),
+                                                            schema=writer.schema))
+                    start = stop
+            else:
+                for start in range(0, len(self.labels), CHUNK_ROWS):
+                    writer.write_table(pa.Table.from_arrays(self._columns(start, start + CHUNK_ROWS),
+                                                            schema=writer.schema))
+        return output_path
+
+
+def _profile(data_path: str, labels: np.ndarray, segments: int, columns: List[str], chunk_rows: int) -> pd.DataFrame:
+    """Customers, share and the mean of each column per segment, accumulated over chunks"""
+    sums = np.zeros((segments, len(columns)))
+    counts = np.zeros((segments, len(columns)))
+    start = 0
+    for chunk in iter_chunks(data_path, columns, chunk_rows):
+        membership = np.eye(segments)[labels[start:start + len(chunk)]]
+        start += len(chunk)
+        valid = ~np.isnan(chunk)
+        sums += membership.T @ np.where(valid, chunk, 0.0)
+        counts += membership.T @ valid
+
+    sizes = np.bincount(labels, minlength=segments)
+    profiles = pd.DataFrame({'customers': sizes, 'share': sizes / max(len(labels), 1)},
+                            index=pd.RangeIndex(segments, name='segment'))
+    means = pd.DataFrame(sums / np.where(counts > 0, counts, np.nan), columns=[f"{c}_mean" for c in columns],
+                         index=profiles.index)
+    return pd.concat([profiles, means], axis=1)
+
+
+def _resolve_columns(data_path: str, requested: Optional[List[str]], defaults: List[str], kind: str) -> List[str]:
+    available = numeric_columns(data_path)
+    if requested:
+        missing = [name for name in requested if name not in available]
+        if missing:
+            raise ValueError(f"{kind} {missing} are not numeric columns of the data; available: {available}")
+        return list(requested)
+    return [name for name in defaults if name in available]
+
+
+def kmeans_segmentation(data_path: str, features: Optional[List[str]] = None, n_segments: int = DEFAULT_SEGMENTS,
+                        seed: int = RANDOM_SEED, profile_columns: Optional[List[str]] = None,
+                        chunk_rows: int = CHUNK_ROWS) -> SegmentationResult:
+    """
+    Mini-batch k-means segmentation of a Parquet dataset, streamed in chunks.
+
+    Args:
+        data_path: Local Parquet file
+        features: Numeric columns to cluster on (default: DEFAULT_FEATURES present, else all numeric columns)
+        n_segments: Number of segments
+        seed: Random seed; the same seed always gives the same segments
+        profile_columns: Extra columns whose per-segment means are reported (default: DEFAULT_PROFILE_COLUMNS present)
+        chunk_rows: Rows read at a time
+
+    Segments are numbered by size, 0 being the largest.
+    """
+    started = time.time()
+    features = _resolve_columns(data_path, features, DEFAULT_FEATURES, "Features") or \
+        [name for name in numeric_columns(data_path) if name != ENTITY_KEY]
+    if not features:
+        raise ValueError("No numeric feature columns to segment on")
+    if n_segments < 2:
+        raise ValueError("n_segments must be at least 2")
+    rng = np.random.default_rng(seed)
+
+    # Pass 1: feature statistics and a sample for initialisation
+    scaler = RunningScaler(len(features))
+    reservoir = Reservoir(SAMPLE_ROWS, rng)
+    rows = 0
+    for chunk in iter_chunks(data_path, features, chunk_rows):
+        scaler.partial_fit(chunk)
+        reservoir.add(chunk)
+        rows += len(chunk)
+    if rows < n_segments:
+        raise ValueError(f"Only {rows} rows; cannot form {n_segments} segments")
+    # Initialise on the sample: best of several k-means++ seedings refined in memory
+    sample = scaler.transform(reservoir.sample)
+    runs = [lloyd(sample, kmeans_plus_plus(sample, n_segments, rng), SAMPLE_ITERATIONS) for _ in range(INIT_RUNS)]
+    centres, sample_labels, _ = min(runs, key=lambda run: run[2])
+
+    # Mini-batch k-means over all rows: per-centre learning rate 1 / (points assigned so far),
+    # counting the sample points the initial centres were fitted to
+    assigned = np.bincount(sample_labels, minlength=n_segments).astype(np.float64)
+    passes = 0
+    for passes in range(1, MAX_PASSES + 1):
+        previous = centres.copy()
+        for chunk in iter_chunks(data_path, features, chunk_rows):
+            scaled = scaler.transform(chunk)
+            order = rng.permutation(len(scaled))
+            for start in range(0, len(scaled), MINI_BATCH_SIZE):
+                batch = scaled[order[start:start + MINI_BATCH_SIZE]]
+                labels, _ = nearest_centres(batch, centres)
+                counts = np.bincount(labels, minlength=n_segments)
+                sums = np.eye(n_segments)[labels].T @ batch
+                assigned += counts
+                moved = counts > 0
+                centres[moved] += (sums[moved] - counts[moved, None] * centres[moved]) / assigned[moved, None]
+        shift = np.sqrt(((centres - previous) ** 2).sum(axis=1)).max()
+        if shift < TOLERANCE:
+            break
+
+    # Final pass: label every row, then number segments by size
+    labels = np.empty(rows, dtype=np.int16)
+    inertia = 0.0
+    start = 0
+    for chunk in iter_chunks(data_path, features, chunk_rows):
+        chunk_labels, distances = nearest_centres(scaler.transform(chunk), centres)
+        labels[start:start + len(chunk)] = chunk_labels
+        inertia += distances.sum()
+        start += len(chunk)
+    by_size = np.argsort(-np.bincount(labels, minlength=n_segments), kind='stable')
+    labels = np.argsort(by_size).astype(np.int16)[labels]
+    centres = centres[by_size]
+
+    profile_columns = _resolve_columns(data_path, profile_columns, DEFAULT_PROFILE_COLUMNS, "Profile columns")
+    profiles = _profile(data_path, labels, n_segments, features + [c for c in profile_columns if c not in features], chunk_rows)
+    summary = {
+        "method": "kmeans",
+        "rows": rows,
+        "segments": n_segments,
+        "features": features,
+        "seed": seed,
+        "passes": passes,
+        "inertia_per_row": inertia / rows,
+        "centres_scaled": np.round(centres, 4).tolist(),
+        "elapsed_seconds": time.time() - started
+    }
+    print(f"✅ k-means: {rows} rows into {n_segments} segments on {len(features)} features "
+          f"in {passes} passes ({summary['elapsed_seconds']:.1f}s)")
+    return SegmentationResult(labels, profiles, summary)
+
+
+def rfm_segmentation(data_path: str, recency_column: Optional[str] = None, frequency_column: Optional[str] = None,
+                     monetary_column: Optional[str] = None, n_segments: int = DEFAULT_SEGMENTS,
+                     seed: int = RANDOM_SEED, profile_columns: Optional[List[str]] = None,
+                     chunk_rows: int = CHUNK_ROWS) -> SegmentationResult:
+    """
+    RFM scoring and banding of a Parquet dataset, streamed in chunks.
+
+    Each given column is scored 1-5 by quintile (recency reversed: lower is better, scores 5),
+    and customers are banded by their total score into n_segments equal-width bands,
+    segment 0 holding the highest totals. Missing values score 1.
+    """
+    started = time.time()
+    columns = {name: column for name, column in
+               (('r_score', recency_column), ('f_score', frequency_column), ('m_score', monetary_column)) if column}
+    if not columns:
+        raise ValueError("RFM needs at least one of recency_column, frequency_column, monetary_column")
+    _resolve_columns(data_path, list(columns.values()), [], "RFM columns")
+    rng = np.random.default_rng(seed)
+
+    # Pass 1: quintile edges from a sample
+    reservoir = Reservoir(SAMPLE_ROWS, rng)
+    rows = 0
+    for chunk in iter_chunks(data_path, list(columns.values()), chunk_rows):
+        reservoir.add(chunk)
+        rows += len(chunk)
+    if rows == 0:
+        raise ValueError("No rows to score")
+    edges = np.nanquantile(reservoir.sample, [0.2, 0.4, 0.6, 0.8], axis=0).T
+
+    # Pass 2: scores and bands
+    scores = {name: np.empty(rows, dtype=np.int8) for name in columns}
+    start = 0
+    for chunk in iter_chunks(data_path, list(columns.values()), chunk_rows):
+        for i, name in enumerate(columns):
+            score = 1 + np.searchsorted(edges[i], chunk[:, i], side='right')
+            if name == 'r_score':
+                score = 6 - score
+            scores[name][start:start + len(chunk)] = np.where(np.isnan(chunk[:, i]), 1, score)
+        start += len(chunk)
+    total = sum(score.astype(np.int16) for score in scores.values())
+    scores['rfm_score'] = total.astype(np.int8)
+    low, high = len(columns), 5 * len(columns)
+    bands = np.minimum(((total - low) * n_segments) // (high - low + 1), n_segments - 1)
+    labels = (n_segments - 1 - bands).astype(np.int16)
+
+    profile_columns = _resolve_columns(data_path, profile_columns, DEFAULT_PROFILE_COLUMNS, "Profile columns")
+    profile_columns = list(columns.values()) + [c for c in profile_columns if c not in columns.values()]
+    profiles = _profile(data_path, labels, n_segments, profile_columns, chunk_rows)
+    for name, values in scores.items():
+        profiles[f"{name}_mean"] = np.bincount(labels, weights=values, minlength=n_segments) / \
+            np.maximum(profiles['customers'].to_numpy(), 1)
+    summary = {
+        "method": "rfm",
+        "rows": rows,
+        "segments": n_segments,
+        "columns": {name.split('_')[0]: column for name, column in columns.items()},
+        "quintile_edges": {column: np.round(edges[i], 4).tolist() for i, column in enumerate(columns.values())},
+        "seed": seed,
+        "elapsed_seconds": time.time() - started
+    }
+    print(f"✅ RFM: {rows} rows scored on {list(columns.values())} into {n_segments} bands "
+          f"({summary['elapsed_seconds']:.1f}s)")
+    return SegmentationResult(labels, profiles, summary, scores)
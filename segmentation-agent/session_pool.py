@@ -0,0 +1,211 @@
+"""
+Pool of warm Code Interpreter sandboxes for the segmentation agent.
+
+Starting a sandbox and uploading the customer data on every request made each
+question pay a cold start. The pool keeps a bounded number of started sandboxes
+keyed by (session, dataset) and hands the same sandbox - with its data and Python
+context still loaded - to follow-up questions in the same chat. Sandboxes are
+health-checked before reuse, evicted after being idle for too long or when they
+approach the Code Interpreter session timeout, and the least recently used idle
+sandbox makes room when the pool is full.
+
+Configuration (environment variables):
+- SANDBOX_POOL_SIZE: warm sandboxes kept (default: 4)
+- SANDBOX_IDLE_TIMEOUT_SECONDS: idle time before a sandbox is stopped (default: 600)
+- SANDBOX_SESSION_TIMEOUT_SECONDS: Code Interpreter session timeout (default: 1200)
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter
+
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT_SECONDS = 600
+DEFAULT_SESSION_TIMEOUT_SECONDS = 1200
+
+# Sandboxes this close to their session timeout are not reused
+EXPIRY_MARGIN_SECONDS = 120
+
+# How often idle sandboxes are looked for in the background
+REAP_INTERVAL_SECONDS = 60
+
+
+class WarmSandbox:
+    """A started Code Interpreter session and what has been loaded into it"""
+
+    def __init__(self, key: Tuple[str, Any], client: CodeInterpreter, pooled: bool = True):
+        self.key = key
+        self.client = client
+        self.pooled = pooled
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.in_use = False
+        self.invocations = 0
+        # (bucket, key, ETag) of the dataset written into the sandbox, set by the agent
+        self.dataset_version = None
+
+    def call(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Invoke a sandbox tool and return its first result"""
+        response = self.client.invoke(tool_name, arguments)
+        for event in response["stream"]:
+            return event["result"]
+        return {}
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def idle_for(self) -> float:
+        return time.time() - self.last_used
+
+
+class SandboxPool:
+    """Bounded set of warm sandboxes keyed by (session, dataset)"""
+
+    def __init__(self, region: str, max_sandboxes: int = DEFAULT_POOL_SIZE,
+                 idle_timeout_seconds: int = DEFAULT_IDLE_TIMEOUT_SECONDS,
+                 session_timeout_seconds: int = DEFAULT_SESSION_TIMEOUT_SECONDS):
+        self.region = region
+        self.max_sandboxes = max_sandboxes
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.session_timeout_seconds = session_timeout_seconds
+        self._sandboxes: Dict[Tuple[str, Any], WarmSandbox] = {}
+        self._lock = threading.Lock()
+        self._reaper = threading.Thread(target=self._reap_forever, name='sandbox-reaper', daemon=True)
+        self._reaper.start()
+
+    def _expired(self, sandbox: WarmSandbox) -> bool:
+        return (sandbox.idle_for() > self.idle_timeout_seconds
+                or sandbox.age() > self.session_timeout_seconds - EXPIRY_MARGIN_SECONDS)
+
+    def _stop(self, sandbox: WarmSandbox, reason: str):
+        try:
+            sandbox.client.stop()
+            print(f"🧹 Stopped sandbox {sandbox.key} ({reason})")
+        except Exception as e:
+            print(f"⚠️ Could not stop sandbox {sandbox.key}: {e}")
+
+    def _start(self, key: Tuple[str, Any], pooled: bool) -> WarmSandbox:
+        client = CodeInterpreter(self.region)
+        client.start(session_timeout_seconds=self.session_timeout_seconds)
+        print(f"🚀 Started sandbox for {key}" + ("" if pooled else " (pool full, not kept)"))
+        return WarmSandbox(key, client, pooled)
+
+    def is_healthy(self, sandbox: WarmSandbox) -> bool:
+        """A sandbox is healthy if it still runs code"""
+        try:
+            result = sandbox.call("executeCode", {"code": "print('ok')", "language": "python", "clearContext": False})
+            return bool(result) and not result.get("isError", False)
+        except Exception as e:
+            print(f"⚠️ Sandbox health check failed for {sandbox.key}: {e}")
+            return False
+
+    def acquire(self, session_id: str, dataset: Any) -> WarmSandbox:
+        """Return the warm sandbox for (session, dataset) if it is healthy, else start one"""
+        key = (session_id, dataset)
+        stale = []
+        with self._lock:
+            sandbox = self._sandboxes.get(key)
+            if sandbox is not None and (sandbox.in_use or self._expired(sandbox)):
+                if not sandbox.in_use:
+                    stale.append(self._sandboxes.pop(key))
+                sandbox = None
+            if sandbox is not None:
+                sandbox.in_use = True
+        for expired in stale:
+            self._stop(expired, "expired")
+
+        if sandbox is not None:
+            if self.is_healthy(sandbox):
+                print(f"♻️ Reusing warm sandbox for {key} ({sandbox.invocations} earlier invocations)")
+                return sandbox
+            with self._lock:
+                self._sandboxes.pop(key, None)
+            self._stop(sandbox, "failed health check")
+
+        with self._lock:
+            pooled = key not in self._sandboxes
+            evicted = self._make_room() if pooled else None
+            if pooled and len(self._sandboxes) >= self.max_sandboxes:
+                pooled = False
+        if evicted is not None:
+            self._stop(evicted, "least recently used")
+
+        sandbox = self._start(key, pooled)
+        sandbox.in_use = True
+        if pooled:
+            with self._lock:
+                self._sandboxes[key] = sandbox
+        return sandbox
+
+    def _make_room(self) -> Optional[WarmSandbox]:
+        """Remove the least recently used idle sandbox if the pool is full (caller holds the lock)"""
+        if len(self._sandboxes) < self.max_sandboxes:
+            return None
+        idle = [sandbox for sandbox in self._sandboxes.values() if not sandbox.in_use]
+        if not idle:
+            return None
+        oldest = min(idle, key=lambda sandbox: sandbox.last_used)
+        return self._sandboxes.pop(oldest.key)
+
+    def release(self, sandbox: WarmSandbox, healthy: bool = True):
+        """Return a sandbox after an invocation; unpooled or broken sandboxes are stopped"""
+        sandbox.in_use = False
+        sandbox.last_used = time.time()
+        sandbox.invocations += 1
+        if sandbox.pooled and healthy:
+            return
+        with self._lock:
+            if self._sandboxes.get(sandbox.key) is sandbox:
+                del self._sandboxes[sandbox.key]
+        self._stop(sandbox, "released" if healthy else "invocation failed")
+
+    def reap(self):
+        """Stop idle and expiring sandboxes"""
+        with self._lock:
+            expired = [sandbox for sandbox in self._sandboxes.values() if not sandbox.in_use and self._expired(sandbox)]
+            for sandbox in expired:
+                del self._sandboxes[sandbox.key]
+        for sandbox in expired:
+            self._stop(sandbox, "idle timeout")
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(REAP_INTERVAL_SECONDS)
+            self.reap()
+
+    def shutdown(self):
+        """Stop every sandbox"""
+        with self._lock:
+            sandboxes = list(self._sandboxes.values())
+            self._sandboxes.clear()
+        for sandbox in sandboxes:
+            self._stop(sandbox, "shutdown")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_sandboxes": self.max_sandboxes,
+                "sandboxes": [
+                    {"key": json.dumps(sandbox.key, default=str), "in_use": sandbox.in_use,
+                     "age_seconds": round(sandbox.age()), "idle_seconds": round(sandbox.idle_for()),
+                     "invocations": sandbox.invocations}
+                    for sandbox in self._sandboxes.values()
+                ]
+            }
+
+
+def create_sandbox_pool(region: str) -> SandboxPool:
+    """SandboxPool configured by environment variables, stopped when the process exits"""
+    pool = SandboxPool(
+        region,
+        max_sandboxes=int(os.environ.get('SANDBOX_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        idle_timeout_seconds=int(os.environ.get('SANDBOX_IDLE_TIMEOUT_SECONDS', DEFAULT_IDLE_TIMEOUT_SECONDS)),
+        session_timeout_seconds=int(os.environ.get('SANDBOX_SESSION_TIMEOUT_SECONDS', DEFAULT_SESSION_TIMEOUT_SECONDS))
+    )
+    atexit.register(pool.shutdown)
+    return pool
@@ -34,7 +34,7 @@ def parse_s3_uri(s3_uri):
     bucket, key = path.split('/', 1)
     return bucket, key
 
-def invoke_agent(prompt, s3_bucket=None, s3_key=None):
+def invoke_agent(prompt, s3_bucket=None, s3_key=None, session_id=None):
     """Invoke the segmentation agent using agentcore CLI"""
     import subprocess
     import json
@@ -46,6 +46,9 @@ def invoke_agent(prompt, s3_bucket=None, s3_key=None):
             payload["s3_bucket"] = s3_bucket
         if s3_key:
             payload["s3_key"] = s3_key
+        if session_id:
+            # Lets follow-up questions reuse the chat's warm sandbox
+            payload["session_id"] = session_id
             
         result = subprocess.run([
             'agentcore', 'invoke', 
@@ -263,7 +266,7 @@ if len(user_messages) > st.session_state.processed_count:
     with st.chat_message("assistant"):
         with st.spinner("Analyzing data..."):
             s3_bucket, s3_key = parse_s3_uri(st.session_state.s3_uri)
-            response = invoke_agent(prompt, s3_bucket, s3_key)
+            response = invoke_agent(prompt, s3_bucket, s3_key, st.session_state.session_id)
             
             # Extract content from the response
             if isinstance(response.get("result"), dict) and "content" in response["result"]: